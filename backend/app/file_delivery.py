@@ -0,0 +1,124 @@
+"""file_delivery.py
+====================
+Выдача артефактов пайплайна (STL, GLB, NIfTI, отчёты) из data/reports.
+
+Сам файл отдаёт ``starlette.responses.FileResponse``: потоковая отдача,
+HTTP Range/If-Range для докачки и zero-copy ``http.response.pathsend``
+(sendfile), если сервер это расширение поддерживает. Здесь — то, чего в
+нём нет:
+
+    • защита от выхода за пределы каталога отчётов (``resolve_artifact``);
+    • ETag по содержимому (sha256), а не по mtime/size — повторная выгрузка
+      того же результата не сбрасывает кэш клиента; хэш считается один раз
+      на (путь, mtime, size);
+    • gzip для текстовых форматов: сжатая копия создаётся один раз и
+      хранится в кэше по ETag, поэтому Range работает и для неё.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+__all__ = [
+    "REPORTS_ROOT",
+    "resolve_artifact",
+    "content_etag",
+    "etag_matches",
+    "media_type_for",
+    "gzip_variant",
+    "is_text_format",
+]
+
+
+REPORTS_ROOT = Path("data", "reports")
+GZIP_CACHE_DIR = Path(os.environ.get("GZIP_CACHE_DIR", Path("data") / "cache" / "gzip"))
+ETAG_CACHE_ENTRIES = 4096
+HASH_CHUNK = 1024 * 1024
+
+TEXT_SUFFIXES = {".json", ".gltf", ".obj", ".csv", ".txt", ".md", ".html", ".xml", ".svg"}
+MEDIA_TYPES = {
+    ".glb": "model/gltf-binary",
+    ".gltf": "model/gltf+json",
+    ".stl": "model/stl",
+    ".obj": "model/obj",
+    ".nii": "application/octet-stream",
+    ".gz": "application/gzip",
+    ".json": "application/json",
+}
+
+_etags: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+_etags_lock = threading.Lock()
+
+
+def resolve_artifact(filename: str, root: Path = REPORTS_ROOT) -> Path:
+    """Путь к файлу внутри root; PermissionError при выходе за root, FileNotFoundError — если файла нет."""
+    root = Path(root).resolve()
+    path = (root / filename).resolve()
+    if path != root and root not in path.parents:
+        raise PermissionError(f"Path outside of reports directory: {filename}")
+    if not path.is_file():
+        raise FileNotFoundError(f"File not found: {filename}")
+    return path
+
+
+def content_etag(path: Path) -> str:
+    """Сильный ETag по sha256 содержимого; кэшируется по (путь, mtime_ns, size)."""
+    st = path.stat()
+    key = (str(path), st.st_mtime_ns, st.st_size)
+    with _etags_lock:
+        etag = _etags.get(key)
+        if etag is not None:
+            _etags.move_to_end(key)
+            return etag
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    etag = f'"{digest.hexdigest()[:32]}"'
+    with _etags_lock:
+        _etags[key] = etag
+        while len(_etags) > ETAG_CACHE_ENTRIES:
+            _etags.popitem(last=False)
+    return etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Сравнение If-None-Match (список, '*' и слабые W/ — по RFC 9110, слабое сравнение)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    strip = lambda t: t.strip().removeprefix("W/")  # noqa: E731
+    return strip(etag) in {strip(t) for t in if_none_match.split(",")}
+
+
+def is_text_format(path: Path) -> bool:
+    return path.suffix.lower() in TEXT_SUFFIXES
+
+
+def media_type_for(path: Path) -> str:
+    name = path.name.lower()
+    if name.endswith(".nii.gz"):
+        return "application/gzip"
+    return MEDIA_TYPES.get(path.suffix.lower()) or mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def gzip_variant(path: Path, etag: str, cache_dir: Optional[Path] = None) -> Path:
+    """Сжатая копия файла (создаётся один раз на ETag, атомарно); etag — ETag сжатого варианта."""
+    cache_dir = Path(cache_dir or GZIP_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    target = cache_dir / f"{etag.strip(chr(34))}.gz"
+    if not target.exists():
+        tmp = target.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(path, "rb") as src, gzip.open(tmp, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, HASH_CHUNK)
+        os.replace(tmp, target)
+    return target
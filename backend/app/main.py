@@ -1,26 +1,56 @@
-from fastapi import FastAPI, UploadFile, File, Form, Request, Body, BackgroundTasks, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Query, Request, Body, BackgroundTasks, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
 import os
 import tempfile
+import threading
 from backend.models.model_handler import load_stl_model, get_mesh_surface_points, export_points_json
 from backend.calculations.trocar_calculations import calculate_trocar_points
 from backend.segmentation.segmentation import segment_and_export, segment_and_export_full, EmptyMaskError
-from backend.dicom.pacs_import import download_dicom_series_orthanc
+from backend.segmentation.histogram import get_histogram, histogram_for_series
+from backend.segmentation.incremental import segment_incremental
+from backend.segmentation.multilabel import parse_label_specs, segment_multilabel
+from backend.segmentation.ml_inference import get_segmenter
+from backend.segmentation.mask_slices import get_mask_slice_cache
+from backend.segmentation.mesh_chunks import MESH_CHUNKS
+from backend.dicom.pacs_import import fetch_dicom_series_cached
+from backend.dicom.pacs_browse import BROWSE_MAX_PAGE, BROWSE_MAX_PREVIEW, get_browser
+from backend.dicom.mpr_tiles import get_tile_server
 from backend.dicom.parser import find_dicom_series, extended_validate_dicom_file, log_import_error
 from backend.dicom import dicom_service
+from backend.app.resumable_upload import ChunkBusyError, UploadBusyError, get_upload_store, materialize_dicom, save_model_stream, store_model
+from backend.app.file_delivery import content_etag, etag_matches, gzip_variant, is_text_format, media_type_for, resolve_artifact
+from backend.monitoring.metrics import CONTENT_TYPE, METRICS_ENABLED, MetricsMiddleware, register_gauge, render_metrics, track_job
 import datetime
 
 # In-memory simple task registry for async jobs (MVP, not for production)
-from typing import Dict, List
+from typing import Dict, List, Optional
 import uuid as _uuid
 _tasks: Dict[str, Dict] = {}
 
 app = FastAPI()
+app.add_middleware(MetricsMiddleware)
+
+# Глубина очереди: фоновые задания, которые приняты, но ещё не завершены
+register_gauge(
+    "job_queue_depth", "Accepted background jobs that have not finished",
+    lambda: sum(t.get("status") in ("pending", "preview") for t in list(_tasks.values())),
+)
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics():
+    """
+    Метрики в текстовом формате Prometheus: запросы, время шагов пайплайна, пиковый RSS заданий,
+    глубина очереди, попадания кэшей. При METRICS_ENABLED=0 — 404
+    """
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
 @app.post("/upload_stl/")
 def upload_stl(
     stl: UploadFile = File(...),
@@ -90,7 +120,8 @@ def segment_dicom(dicom_folder: str = Form(...), threshold_min: int = Form(30),
     out_dir = os.path.join("data", "reports", f"segmentation_{uuid.uuid4().hex[:8]}")
     os.makedirs(out_dir, exist_ok=True)
     try:
-        nifti_path = segment_and_export(dicom_folder, out_dir, threshold=(threshold_min, threshold_max))
+        with track_job("segment"):
+            nifti_path = segment_and_export(dicom_folder, out_dir, threshold=(threshold_min, threshold_max))
         return JSONResponse({
             "nifti_mask_path": nifti_path,
             "mask_png_dir": os.path.join(out_dir, "mask_png"),
@@ -102,27 +133,164 @@ def segment_dicom(dicom_folder: str = Form(...), threshold_min: int = Form(30),
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
 @app.post("/segment_dicom_full/")
-def segment_dicom_full(dicom_folder: str = Form(...), threshold_min: int = Form(30), threshold_max: int = Form(300)):
+def segment_dicom_full(
+    dicom_folder: str = Form(...),
+    threshold_min: int = Form(30),
+    threshold_max: int = Form(300),
+    postprocess: bool = Form(False),
+    segmenter: str = Form(None),
+):
     """
     Запуск полного пайплайна сегментации: принимает путь к папке с DICOM, пороги, возвращает пути к маске (NIfTI), STL, GLTF, PNG
+    postprocess=true — заполнение полостей, наибольшая компонента и сглаживание меша (с временем шагов)
+    segmenter — threshold | onnx (по умолчанию SEGMENTER из окружения)
     """
     import uuid
     out_dir = os.path.join("data", "reports", f"segmentation_{uuid.uuid4().hex[:8]}")
     os.makedirs(out_dir, exist_ok=True)
     try:
-        result = segment_and_export_full(dicom_folder, out_dir, threshold=(threshold_min, threshold_max))
-        return JSONResponse({
+        seg = get_segmenter(segmenter, threshold=(threshold_min, threshold_max))
+    except (ValueError, ImportError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        with track_job("segment_full"):
+            result = segment_and_export_full(
+                dicom_folder, out_dir, threshold=(threshold_min, threshold_max), postprocess=postprocess, segmenter=seg
+            )
+        response = {
             "nifti_mask_path": result["nifti"],
             "stl_path": result["stl"],
             "gltf_path": result["gltf"],
             "mask_png_dir": result["mask_png_dir"],
+            "lods": result["lods"],
             "message": "Сегментация и экспорт выполнены успешно"
+        }
+        if postprocess:
+            response["postprocess_timings_ms"] = result["postprocess_timings"]
+        return JSONResponse(response)
+    except EmptyMaskError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": str(e)})
+
+@app.post("/segment_dicom_incremental/")
+def segment_dicom_incremental(
+    dicom_folder: str = Form(...),
+    threshold_min: int = Form(30),
+    threshold_max: int = Form(300),
+    job_id: str = Form(None),
+):
+    """
+    Интерактивный подбор порогов: при повторном вызове с тем же job_id пересчитываются
+    только блоки меша, в которых изменилась маска. Возвращает путь к GLB и статистику блоков.
+    """
+    job_id = job_id or _uuid.uuid4().hex[:8]
+    out_dir = _segmentation_dir(job_id)
+    try:
+        with track_job("incremental"):
+            result = segment_incremental(dicom_folder, out_dir, job_id, threshold=(threshold_min, threshold_max))
+        return JSONResponse({
+            "job_id": job_id,
+            "gltf_path": result["gltf"],
+            "faces": result["faces"],
+            "changed_blocks": result["changed_blocks"],
+            "total_blocks": result["total_blocks"],
+        })
+    except EmptyMaskError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": str(e)})
+
+@app.post("/segment_dicom_multilabel/")
+def segment_dicom_multilabel(dicom_folder: str = Form(...), labels: str = Form(...)):
+    """
+    Многометочная сегментация за один проход: labels — JSON-список
+    [{"name": "kidney", "min": 30, "max": 300, "forbidden": false}, ...].
+    Возвращает многометочный NIfTI, GLB на каждый орган и forbidden_mesh_paths для /upload_stl/
+    """
+    import json
+    try:
+        specs = parse_label_specs(json.loads(labels))
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid labels: {e}")
+    out_dir = os.path.join("data", "reports", f"segmentation_{_uuid.uuid4().hex[:8]}")
+    try:
+        with track_job("multilabel"):
+            result = segment_multilabel(dicom_folder, out_dir, specs)
+        return JSONResponse({
+            "nifti_labels_path": result["nifti"],
+            "labels": result["labels"],
+            "forbidden_mesh_paths": result["forbidden_mesh_paths"],
+            "message": "Многометочная сегментация выполнена успешно"
         })
     except EmptyMaskError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
+@app.post("/histogram/")
+def series_histogram(dicom_folder: str = Form(...), bins: int = Form(64, ge=1, le=4096)):
+    """
+    Считает (один раз) HU-гистограмму серии и возвращает histogram_id для мгновенного предпросмотра порогов
+    """
+    try:
+        histogram_id, hist = histogram_for_series(dicom_folder)
+        return JSONResponse({"histogram_id": histogram_id, **hist.summary(bins)})
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": str(e)})
+
+@app.get("/histogram/{histogram_id}/preview/")
+def threshold_preview(histogram_id: str, threshold_min: float = 30, threshold_max: float = 300):
+    """
+    Число вокселей и объём (мл) для диапазона порогов — по кумулятивной гистограмме, без сегментации
+    """
+    hist = get_histogram(histogram_id)
+    if hist is None:
+        raise HTTPException(status_code=404, detail="Histogram not found")
+    return hist.preview(threshold_min, threshold_max)
+
+@app.get("/histogram/{histogram_id}/auto_threshold/")
+def auto_threshold(histogram_id: str, classes: int = Query(2, ge=2, le=4)):
+    """
+    Предлагает пороги по гистограмме: Otsu (classes=2) или multi-Otsu (classes 3..4)
+    """
+    hist = get_histogram(histogram_id)
+    if hist is None:
+        raise HTTPException(status_code=404, detail="Histogram not found")
+    try:
+        thresholds = hist.auto_thresholds(classes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    edges = [hist.min_value] + thresholds + [hist.max_value]
+    ranges = [hist.preview(lo, hi) for lo, hi in zip(edges[:-1], edges[1:])]
+    return {"thresholds": thresholds, "ranges": ranges}
+
+def _validated_copy(cache_dir, target_dir):
+    """
+    Валидирует файлы серии из (закреплённой) папки кэша и копирует валидные в target_dir —
+    наружу отдаются только копии: папка кэша после ответа может быть вытеснена.
+    Возвращает (число найденных файлов, пути скопированных валидных файлов).
+    """
+    import shutil
+    dicom_files = find_dicom_series(cache_dir)
+    valid_files = []
+    for f in dicom_files:
+        ok, msg = extended_validate_dicom_file(f)
+        if ok:
+            valid_files.append(f)
+        else:
+            log_import_error(f, msg)
+    copied = []
+    if valid_files:
+        os.makedirs(target_dir, exist_ok=True)
+        for f in valid_files:
+            copied.append(shutil.copy2(f, target_dir))
+    return len(dicom_files), copied
+
 @app.post("/import_and_validate_pacs/")
 def import_and_validate_pacs(
     orthanc_url: str = Form(...),
@@ -132,23 +300,18 @@ def import_and_validate_pacs(
 ):
     """
     Импортирует DICOM-серию из PACS (Orthanc), валидирует все файлы, логирует ошибки, возвращает список валидных файлов
+    (копии в собственной папке import_dir, а не пути внутри кэша серий)
     """
-    import uuid
-    out_dir = os.path.join("data", "dicom_samples", f"pacs_import_{uuid.uuid4().hex[:8]}")
     try:
-        download_dicom_series_orthanc(orthanc_url, series_uid, out_dir, username, password)
-        dicom_files = find_dicom_series(out_dir)
-        valid_files = []
-        for f in dicom_files:
-            ok, msg = extended_validate_dicom_file(f)
-            if ok:
-                valid_files.append(f)
-            else:
-                log_import_error(f, msg)
+        # Серия берётся из локального кэша, PACS опрашивается только при промахе;
+        # пока идёт валидация и копирование, папка закреплена и не вытесняется
+        import_dir = str(dicom_service.TMP_ROOT / f"pacs_{_uuid.uuid4().hex[:8]}")
+        with fetch_dicom_series_cached(orthanc_url, series_uid, username, password) as out_dir:
+            found, valid_files = _validated_copy(out_dir, import_dir)
         return JSONResponse({
-            "import_dir": out_dir,
+            "import_dir": import_dir if valid_files else None,
             "valid_dicom_files": valid_files,
-            "invalid_count": len(dicom_files) - len(valid_files),
+            "invalid_count": found - len(valid_files),
             "message": "Импорт и валидация завершены"
         })
     except Exception as e:
@@ -169,45 +332,83 @@ def import_segment_pacs(
     """
     import uuid
     from backend.segmentation.segmentation import segment_and_export_full
-    out_dir = os.path.join("data", "dicom_samples", f"pacs_import_{uuid.uuid4().hex[:8]}")
     try:
-        # 1. Импорт из PACС
-        download_dicom_series_orthanc(orthanc_url, series_uid, out_dir, username, password)
-        # 2. Валидация
-        dicom_files = find_dicom_series(out_dir)
-        valid_files = []
-        for f in dicom_files:
-            ok, msg = extended_validate_dicom_file(f)
-            if ok:
-                valid_files.append(f)
-            else:
-                log_import_error(f, msg)
-        if not valid_files:
-            return JSONResponse(status_code=400, content={"detail": "Нет валидных DICOM-файлов для сегментации"})
-        # 3. Сегментация и экспорт (используем папку с валидными файлами)
         segm_out_dir = os.path.join("data", "reports", f"segmentation_{uuid.uuid4().hex[:8]}")
-        os.makedirs(segm_out_dir, exist_ok=True)
-        # Для простоты передаём папку, где лежат только валидные файлы
-        # Можно скопиров��ть в��лидные файлы во временную папку, если нужно
-        import shutil
         temp_valid_dir = os.path.join(segm_out_dir, "valid_dicom")
-        os.makedirs(temp_valid_dir, exist_ok=True)
-        for f in valid_files:
-            shutil.copy2(f, temp_valid_dir)
-        result = segment_and_export_full(temp_valid_dir, segm_out_dir, threshold=(threshold_min, threshold_max))
+        # 1. Импорт из PACС (через кэш серий); папка закреплена, пока валидные файлы не скопированы
+        with fetch_dicom_series_cached(orthanc_url, series_uid, username, password) as out_dir:
+            # 2. Валидация и копирование валидных файлов в папку результата
+            found, valid_files = _validated_copy(out_dir, temp_valid_dir)
+        if not valid_files:
+            return JSONResponse(status_code=400, content={"detail": "Нет валидных DICOM-файлов для сегментации"})
+        # 3. Сегментация и экспорт (папка с копиями валидных файлов не зависит от кэша)
+        with track_job("pacs"):
+            result = segment_and_export_full(temp_valid_dir, segm_out_dir, threshold=(threshold_min, threshold_max))
         return JSONResponse({
             "nifti_mask_path": result["nifti"],
             "stl_path": result["stl"],
             "gltf_path": result["gltf"],
             "mask_png_dir": result["mask_png_dir"],
-            "import_dir": out_dir,
+            "lods": result["lods"],
+            "import_dir": temp_valid_dir,
             "valid_dicom_files": valid_files,
-            "invalid_count": len(dicom_files) - len(valid_files),
+            "invalid_count": found - len(valid_files),
             "message": "Импорт, валидация и сегментация завершены"
         })
     except Exception as e:
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
+@app.get("/pacs/studies/")
+def pacs_studies(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=BROWSE_MAX_PAGE),
+    patient_id: str = None,
+    study_date: str = None,
+    modality: str = None,
+):
+    """
+    Список исследований на сконфигурированном Orthanc (с пагинацией и кэшем).
+    """
+    try:
+        return JSONResponse(get_browser().list_studies(
+            offset=offset,
+            limit=limit,
+            filters={"PatientID": patient_id, "StudyDate": study_date, "ModalitiesInStudy": modality},
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": str(e)})
+
+@app.get("/pacs/studies/{study_id}/series/")
+def pacs_study_series(
+    study_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=BROWSE_MAX_PAGE),
+):
+    """
+    Серии исследования с количеством срезов (с пагинацией и кэшем).
+    """
+    try:
+        return JSONResponse(get_browser().list_series(study_id, offset=offset, limit=limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": str(e)})
+
+@app.post("/pacs/series/preview/")
+def pacs_series_preview(series_uids: List[str] = Body(..., embed=True, max_length=BROWSE_MAX_PREVIEW)):
+    """
+    Пакетное превью серий (описание, модальность, число срезов) по списку SeriesInstanceUID
+    (не больше BROWSE_MAX_PREVIEW за запрос).
+    """
+    try:
+        return JSONResponse({"items": get_browser().preview_series(series_uids)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": str(e)})
+
 @app.post("/export/report/")
 def export_report(request: Request):
     """
@@ -243,18 +444,57 @@ def log_user_action(request: Request):
 @app.post("/unity/upload/")
 def unity_upload(file: UploadFile = File(...), meta: str = Form("{}")):
     """
-    Заглушка: загрузка моделей, масок, отчётов из Unity
+    Загрузка моделей, масок, отчётов из Unity в хранилище моделей (data/reports/models/<id>/).
+    Для больших файлов — возобновляемая загрузка /uploads/ с kind=model
     """
-    # TODO: сохранить файл и метаданные
-    return JSONResponse({"status": "uploaded", "filename": file.filename})
+    import json
+    try:
+        meta_dict = json.loads(meta)
+        path = save_model_stream(file.file, file.filename, _uuid.uuid4().hex[:8], meta_dict)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse({"status": "uploaded", "filename": path.name, **_model_location(path)})
+
+def _model_location(path) -> Dict[str, str]:
+    rel = os.path.relpath(path, os.path.join("data", "reports")).replace(os.sep, "/")
+    return {"model_path": str(path), "download_url": f"/unity/download/?filename={rel}"}
 
 @app.get("/unity/download/")
-def unity_download(filename: str):
+def unity_download(filename: str, request: Request):
     """
-    Заглушка: скачивание моделей, масок, отчётов для Unity
+    Скачивание моделей, масок, отчётов для Unity из data/reports (filename — путь относительно него).
+    Range — докачка; ETag по содержимому: повторная загрузка неизменной модели — один ответ 304;
+    текстовые форматы (json, gltf, obj, csv) сжимаются gzip, если клиент его принимает
     """
-    # TODO: реализовать выдачу файла
-    return JSONResponse({"status": "ready", "filename": filename})
+    try:
+        path = resolve_artifact(filename)
+    except PermissionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return _artifact_response(path, request)
+
+def _artifact_response(path, request: Request) -> Response:
+    """FileResponse с ETag по содержимому (304 на If-None-Match), Range и gzip для текстовых форматов"""
+    etag = content_etag(path)
+    headers = {"Cache-Control": "private, no-cache"}
+    gzipped = False
+    if is_text_format(path):
+        headers["Vary"] = "Accept-Encoding"
+        gzipped = "gzip" in request.headers.get("accept-encoding", "")
+        if gzipped:
+            etag = etag[:-1] + '-gz"'  # у сжатого представления свой ETag
+    headers["ETag"] = etag
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+    return FileResponse(
+        gzip_variant(path, etag) if gzipped else path,
+        media_type=media_type_for(path),
+        filename=path.name,
+        headers=headers,
+    )
 
 @app.post("/anatomical_points/")
 def save_anatomical_points(patient_id: str = Form(...), points: str = Form(...)):
@@ -306,16 +546,24 @@ async def segment_dicom_async(
     dicom_folder: str = Form(...),
     threshold_min: int = Form(30),
     threshold_max: int = Form(300),
+    mesh_chunks: bool = Form(None),
 ):
-    """Запускает сегментацию в фоне и возвращает task_id."""
+    """
+    Запускает сегментацию в фоне и возвращает task_id.
+    mesh_chunks (по умолчанию MESH_CHUNKS) — прогрессивные чанки меша, манифест по chunk_manifest_url
+    """
     task_id = _uuid.uuid4().hex[:8]
     _tasks[task_id] = {"status": "pending"}
+    chunked = MESH_CHUNKS if mesh_chunks is None else mesh_chunks
 
     def _run():
         try:
             out_dir = os.path.join("data", "reports", f"segmentation_{task_id}")
             os.makedirs(out_dir, exist_ok=True)
-            result = segment_and_export_full(dicom_folder, out_dir, threshold=(threshold_min, threshold_max))
+            with track_job("async"):
+                result = segment_and_export_full(
+                    dicom_folder, out_dir, threshold=(threshold_min, threshold_max), mesh_chunks=chunked
+                )
             _tasks[task_id] = {"status": "done", "result": result}
         except EmptyMaskError as e:
             _tasks[task_id] = {"status": "error", "detail": str(e)}
@@ -323,7 +571,69 @@ async def segment_dicom_async(
             _tasks[task_id] = {"status": "error", "detail": str(e)}
 
     background_tasks.add_task(_run)
-    return {"task_id": task_id, "status": "pending"}
+    response = {"task_id": task_id, "status": "pending"}
+    if chunked:
+        response["chunk_manifest_url"] = f"/segmentation/{task_id}/chunks/manifest"
+    return response
+
+@app.post("/segment_dicom_preview/")
+async def segment_dicom_preview(
+    dicom_folder: str = Form(...),
+    threshold_min: int = Form(30),
+    threshold_max: int = Form(300),
+    preview_factor: int = Form(2),
+    mesh_chunks: bool = Form(None),
+):
+    """
+    Быстрое превью + полная сегментация в фоне под одним job_id.
+    Возвращает грубый GLB (объём прорежен в preview_factor раз), как только он готов;
+    полный результат заменяет превью в /task_status/{job_id} (status: preview -> done).
+    mesh_chunks (по умолчанию MESH_CHUNKS) — полный меш ещё и чанками по мере готовности (chunk_manifest_url)
+    """
+    if preview_factor not in (2, 4):
+        raise HTTPException(status_code=400, detail="preview_factor must be 2 or 4")
+    job_id = _uuid.uuid4().hex[:8]
+    chunked = MESH_CHUNKS if mesh_chunks is None else mesh_chunks
+    _tasks[job_id] = {"status": "pending"}
+    preview_ready = threading.Event()
+
+    def _on_preview(preview):
+        _tasks[job_id] = {"status": "preview", "preview": preview}
+        preview_ready.set()
+
+    def _run():
+        try:
+            out_dir = os.path.join("data", "reports", f"segmentation_{job_id}")
+            os.makedirs(out_dir, exist_ok=True)
+            with track_job("preview"):
+                result = segment_and_export_full(
+                    dicom_folder, out_dir, threshold=(threshold_min, threshold_max),
+                    preview_factor=preview_factor, on_preview=_on_preview, mesh_chunks=chunked,
+                )
+            _tasks[job_id] = {"status": "done", "result": result}
+        except EmptyMaskError as e:
+            _tasks[job_id] = {"status": "error", "detail": str(e), "empty_mask": True}
+        except Exception as e:
+            _tasks[job_id] = {"status": "error", "detail": str(e)}
+        finally:
+            preview_ready.set()
+
+    threading.Thread(target=_run, daemon=True).start()
+    await run_in_threadpool(preview_ready.wait)
+    state = _tasks[job_id]
+    if state["status"] == "error":
+        raise HTTPException(status_code=400 if state.get("empty_mask") else 500, detail=state["detail"])
+    preview = state.get("preview") or {"preview_gltf": state.get("result", {}).get("preview_gltf")}
+    response = {
+        "job_id": job_id,
+        "status": state["status"],
+        "preview_gltf_path": preview.get("preview_gltf"),
+        "preview_factor": preview_factor,
+        "message": "Превью готово, полная сегментация выполняется в фоне"
+    }
+    if chunked:
+        response["chunk_manifest_url"] = f"/segmentation/{job_id}/chunks/manifest"
+    return JSONResponse(response)
 
 @app.get("/task_status/{task_id}")
 async def task_status(task_id: str):
@@ -331,26 +641,150 @@ async def task_status(task_id: str):
         raise HTTPException(status_code=404, detail="Task not found")
     return _tasks[task_id]
 
+def _segmentation_dir(job_id: str) -> str:
+    """Каталог результата segmentation_{job_id}; job_id без разделителей пути."""
+    if not job_id.replace("_", "").replace("-", "").isalnum():
+        raise HTTPException(status_code=400, detail="Invalid job id")
+    return os.path.join("data", "reports", f"segmentation_{job_id}")
+
+@app.get("/segmentation/{job_id}/mask_slice/{z}")
+def mask_slice(job_id: str, z: int):
+    """
+    PNG среза z маски результата segmentation_{job_id}: кодируется по запросу из маски
+    в памяти (или mask.nii.gz) и кэшируется; для ленивого режима MASK_PNG_MODE=lazy
+    """
+    result_dir = _segmentation_dir(job_id)
+    try:
+        png = get_mask_slice_cache().png(result_dir, z)
+    except (FileNotFoundError, IndexError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(content=png, media_type="image/png", headers={"Cache-Control": "private, max-age=3600"})
+
+@app.get("/segmentation/{job_id}/chunks/manifest")
+async def mesh_chunk_manifest(job_id: str, since: int = 0, wait: float = 0.0):
+    """
+    Манифест прогрессивных чанков меша (границы, уровни, готовые чанки, version).
+    since/wait — long-poll: ждать до wait секунд (не больше 30), пока version не станет больше since.
+    Пока меш не построен — {"status": "pending", "version": 0}; если задача завершилась, не дойдя
+    до чанков (ошибка загрузки, пустая маска, ...), — статус задачи: "error" с detail или "done"
+    """
+    import asyncio
+    import json
+    result_dir = _segmentation_dir(job_id)
+    if not os.path.isdir(result_dir) and job_id not in _tasks:
+        raise HTTPException(status_code=404, detail="Segmentation job not found")
+    path = os.path.join(result_dir, "chunks", "manifest.json")
+    deadline = asyncio.get_running_loop().time() + min(max(wait, 0.0), 30.0)
+    while True:
+        manifest = {"status": "pending", "version": 0, "chunks": []}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        else:
+            task = _tasks.get(job_id, {})
+            if task.get("status") == "error":
+                manifest.update(status="error", detail=task["detail"])
+            elif task.get("status") == "done":
+                manifest["status"] = "done"
+        if (manifest["version"] > since or manifest["status"] in ("done", "error")
+                or asyncio.get_running_loop().time() >= deadline):
+            return JSONResponse(manifest, headers={"Cache-Control": "no-store"})
+        await asyncio.sleep(0.1)
+
+@app.get("/segmentation/{job_id}/chunks/{name}")
+def mesh_chunk(job_id: str, name: str, request: Request):
+    """GLB-чанк из манифеста (ETag по содержимому, Range)"""
+    try:
+        path = resolve_artifact(name, root=os.path.join(_segmentation_dir(job_id), "chunks"))
+    except PermissionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return _artifact_response(path, request)
+
+@app.post("/volumes/")
+def open_volume(dicom_folder: str = Form(...)):
+    """
+    Открывает серию для просмотра срезов (через кэш объёмов) и возвращает volume_id и число срезов по осям
+    """
+    try:
+        return JSONResponse(get_tile_server().open(dicom_folder))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": str(e)})
+
+@app.get("/volumes/{volume_id}/slice/{axis}/{index}")
+def volume_slice(
+    volume_id: str,
+    axis: str,
+    index: int,
+    window: float = 400.0,
+    level: float = 40.0,
+    format: str = "png",
+    mask_job: Optional[str] = None,
+    size: Optional[int] = None,
+):
+    """
+    Срез axial | coronal | sagittal с окном/уровнем HU (PNG/WebP), опционально с наложением
+    маски результата segmentation_{mask_job}; тайлы кэшируются
+    """
+    mask = None
+    if mask_job:
+        try:
+            mask = get_mask_slice_cache().get_mask(_segmentation_dir(mask_job))
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+    try:
+        data, media_type = get_tile_server().render(
+            volume_id, axis, index, window, level, format, mask=mask, mask_key=mask_job, size=size
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Volume not found, open it with POST /volumes/")
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=data, media_type=media_type, headers={"Cache-Control": "private, max-age=3600"})
+
+@app.get("/volumes/{volume_id}/thumbnail")
+def volume_thumbnail(volume_id: str, size: int = 128, format: str = "webp"):
+    """
+    Миниатюра серии: центральный аксиальный срез
+    """
+    try:
+        data, media_type = get_tile_server().thumbnail(volume_id, size=size, fmt=format)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Volume not found, open it with POST /volumes/")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=data, media_type=media_type, headers={"Cache-Control": "private, max-age=3600"})
+
 @app.post("/upload_dicom/")
 async def upload_dicom(
     files: List[UploadFile] = File(...),
     threshold_min: int = Form(30),
     threshold_max: int = Form(300),
 ):
-    """Принимает один или несколько DICOM-файлов, сохраняет во временную папку и запускает сегментацию."""
+    """
+    Принимает один или несколько DICOM-файлов, сохраняет во временную папку и запускает сегментацию.
+    Файлы пишутся из потоков загрузки без чтения в память; при INGEST_ANONYMIZE=1 — сразу обезличенными
+    """
     import uuid
     # Сохраняем файлы через общий сервис
-    temp_root = dicom_service.save_uploaded_files([(f.filename, f.file.read()) for f in files])
+    temp_root = dicom_service.save_uploaded_files([(f.filename, f.file) for f in files])
     # Запустим полную сегментацию
     try:
         out_dir = os.path.join("data", "reports", f"segmentation_{uuid.uuid4().hex[:8]}")
         os.makedirs(out_dir, exist_ok=True)
-        result = segment_and_export_full(temp_root, out_dir, threshold=(threshold_min, threshold_max))
+        with track_job("upload"):
+            result = segment_and_export_full(temp_root, out_dir, threshold=(threshold_min, threshold_max))
         return JSONResponse({
             "nifti_mask_path": result["nifti"],
             "stl_path": result["stl"],
             "gltf_path": result["gltf"],
             "mask_png_dir": result["mask_png_dir"],
+            "lods": result["lods"],
             "message": "Импорт и сегментация выполнены успешно"
         })
     except EmptyMaskError as e:
@@ -358,6 +792,123 @@ async def upload_dicom(
     except Exception as e:
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
+@app.post("/uploads/")
+def create_upload(
+    filename: str = Form(...),
+    size: int = Form(...),
+    kind: str = Form("dicom"),
+    chunk_size: int = Form(None),
+    sha256: str = Form(None),
+):
+    """
+    Начало возобновляемой загрузки: kind — dicom (ZIP серии или один файл) | model.
+    Возвращает upload_id, размер части и число частей
+    """
+    try:
+        return JSONResponse(get_upload_store().create(filename, size, kind, chunk_size, sha256))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.put("/uploads/{upload_id}/chunks/{index}")
+async def upload_chunk(upload_id: str, index: int, request: Request):
+    """
+    Часть index (тело запроса — сырые байты, заголовок X-Chunk-SHA256). Пишется на диск по мере
+    чтения из сокета (запись — в пуле потоков, не в цикле событий); при несовпадении длины или хэша
+    часть не засчитывается (400) и её нужно повторить; 409 — ту же часть сейчас шлёт другой запрос
+    """
+    checksum = request.headers.get("x-chunk-sha256")
+    if not checksum:
+        raise HTTPException(status_code=400, detail="X-Chunk-SHA256 header is required")
+    try:
+        writer = await run_in_threadpool(get_upload_store().open_chunk, upload_id, index)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except ChunkBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        async for piece in request.stream():
+            await run_in_threadpool(writer.write, piece)
+        return JSONResponse(await run_in_threadpool(writer.commit, checksum))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        writer.close()
+
+@app.get("/uploads/{upload_id}")
+def upload_status(upload_id: str):
+    """Принятые и недостающие части загрузки — с чего продолжать после обрыва"""
+    try:
+        return JSONResponse(get_upload_store().status(upload_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+@app.post("/uploads/{upload_id}/complete")
+def complete_upload(
+    upload_id: str,
+    threshold_min: int = Form(30),
+    threshold_max: int = Form(300),
+):
+    """
+    Завершение загрузки: проверка полноты и sha256, затем передача файла дальше —
+    kind=dicom: распаковка серии и полная сегментация (ответ как у /upload_dicom/);
+    kind=model: перенос в хранилище моделей, ответ с путём и ссылкой на /unity/download/.
+    409 — не хватает частей, не совпал хэш или загрузку уже завершает другой запрос;
+    422 — файл не распаковывается (битый ZIP, не DICOM); 507 — ошибка записи на диск
+    """
+    store = get_upload_store()
+    try:
+        # finalize и передача файла — под исключительным владением загрузкой; после успеха она удаляется
+        with store.completing(upload_id) as path:
+            meta = store.meta(upload_id)
+            try:
+                if meta["kind"] == "model":
+                    model_path = store_model(path, meta["filename"], upload_id,
+                                             {"filename": meta["filename"], "size": meta["size"]})
+                    return JSONResponse({"status": "uploaded", "filename": meta["filename"],
+                                         **_model_location(model_path)})
+                dicom_folder = materialize_dicom(path, meta["filename"], dicom_service.TMP_ROOT)
+            except OSError as e:
+                raise HTTPException(status_code=507, detail=f"Cannot store upload: {e}")
+            except Exception as e:
+                raise HTTPException(status_code=422, detail=f"Cannot unpack upload: {e}")
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        return JSONResponse(status_code=409, content={"detail": str(e), **store.status(upload_id)})
+    try:
+        out_dir = os.path.join("data", "reports", f"segmentation_{_uuid.uuid4().hex[:8]}")
+        os.makedirs(out_dir, exist_ok=True)
+        with track_job("resumable_upload"):
+            result = segment_and_export_full(str(dicom_folder), out_dir, threshold=(threshold_min, threshold_max))
+        return JSONResponse({
+            "dicom_folder": str(dicom_folder),
+            "nifti_mask_path": result["nifti"],
+            "stl_path": result["stl"],
+            "gltf_path": result["gltf"],
+            "mask_png_dir": result["mask_png_dir"],
+            "lods": result["lods"],
+            "message": "Импорт и сегментация выполнены успешно"
+        })
+    except EmptyMaskError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": str(e)})
+
+@app.delete("/uploads/{upload_id}")
+def cancel_upload(upload_id: str):
+    """Отмена загрузки и удаление принятых частей; 409, пока загрузку завершает другой запрос"""
+    try:
+        get_upload_store().discard(upload_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return JSONResponse({"status": "cancelled", "upload_id": upload_id})
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """
@@ -0,0 +1,425 @@
+"""resumable_upload.py
+====================
+Возобновляемая загрузка больших файлов (ZIP серии DICOM, модели) по частям.
+
+Протокол:
+    1. ``create`` — клиент сообщает имя, полный размер и (опционально)
+       sha256 файла; сервер выделяет upload_id и размер части;
+    2. части ``i = 0..N-1`` отправляются в любом порядке и параллельно,
+       каждая со своим sha256; тело пишется прямо в файл по смещению
+       ``i * chunk_size`` (``os.pwrite``) по мере чтения из сокета — в
+       памяти не копится; одновременно одну часть пишет только один запрос,
+       а принятая часть больше не перезаписывается;
+    3. ``status`` — какие части уже приняты (после обрыва сети клиент
+       досылает только недостающие);
+    4. ``finalize`` — проверка полноты и sha256 всего файла; дальше файл
+       переносится (``os.replace``, без копирования) в папку серии для
+       сегментации или в хранилище моделей.
+
+Состояние хранится на диске (``meta.json`` + журнал принятых частей),
+поэтому загрузку можно продолжить и после рестарта сервера.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+from backend.dicom.inline_anonymizer import INGEST_ANONYMIZE, write_anonymized
+from backend.dicom.parser import log_import_error
+
+__all__ = [
+    "UPLOAD_CHUNK_BYTES",
+    "UploadStore",
+    "ChunkWriter",
+    "ChunkBusyError",
+    "UploadBusyError",
+    "get_upload_store",
+    "materialize_dicom",
+    "store_model",
+    "save_model_stream",
+]
+
+
+UPLOAD_ROOT = Path(os.environ.get("UPLOAD_ROOT", Path("data") / "uploads"))
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_BYTES", 8 * 1024 ** 2))
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 4 * 1024 ** 3))
+UPLOAD_TTL_SECONDS = int(os.environ.get("UPLOAD_TTL_SECONDS", 24 * 3600))
+MAX_CHUNK_BYTES = 64 * 1024 ** 2
+MODEL_STORE = Path("data") / "reports" / "models"
+KINDS = ("dicom", "model")
+
+
+def _safe_name(filename: str) -> str:
+    name = os.path.basename(str(filename).replace("\\", "/"))
+    if name in ("", ".", ".."):
+        raise ValueError(f"Invalid filename: {filename!r}")
+    return name
+
+
+class ChunkBusyError(RuntimeError):
+    """Ту же часть сейчас пишет другой запрос."""
+
+
+class UploadBusyError(RuntimeError):
+    """Загрузку сейчас завершает другой запрос."""
+
+
+class ChunkWriter:
+    """
+    Запись одной части по смещению с подсчётом sha256; принимается только после ``commit``.
+    Писатель владеет частью (``UploadStore.open_chunk``) до ``close``: параллельный запрос на ту же
+    часть получает ChunkBusyError, а отметка о приёме ставится до освобождения — поэтому
+    проверенные байты ничто не перезапишет. Повторная отправка уже принятой части только
+    проверяется, но не пишется.
+    """
+
+    def __init__(self, store: "UploadStore", upload_id: str, index: int, offset: int, length: int,
+                 verify_only: bool = False):
+        self.store = store
+        self.upload_id = upload_id
+        self.index = index
+        self.offset = offset
+        self.length = length
+        self.written = 0
+        self._digest = hashlib.sha256()
+        self._claimed = True
+        try:
+            self._fd = None if verify_only else os.open(store._data_path(upload_id), os.O_WRONLY)
+        except BaseException:
+            self.close()
+            raise
+
+    def write(self, data: bytes) -> None:
+        if self.written + len(data) > self.length:
+            self.close()
+            raise ValueError(f"Chunk {self.index} exceeds its size of {self.length} bytes")
+        self._digest.update(data)
+        if self._fd is None:
+            self.written += len(data)
+            return
+        view = memoryview(data)
+        while view:
+            n = os.pwrite(self._fd, view, self.offset + self.written)
+            self.written += n
+            view = view[n:]
+
+    def commit(self, sha256: str) -> Dict:
+        """Проверяет длину и sha256 части и отмечает её принятой; ValueError при расхождении."""
+        try:
+            self._close_fd()
+            if self.written != self.length:
+                raise ValueError(f"Chunk {self.index}: got {self.written} bytes, expected {self.length}")
+            if self._digest.hexdigest() != sha256.strip().lower():
+                raise ValueError(f"Chunk {self.index}: sha256 mismatch")
+            return self.store._mark_received(self.upload_id, self.index)
+        finally:
+            self.close()
+
+    def _close_fd(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def close(self) -> None:
+        self._close_fd()
+        if self._claimed:
+            self._claimed = False
+            self.store._release_chunk(self.upload_id, self.index)
+
+
+class UploadStore:
+    """Каталог незавершённых загрузок: root/<upload_id>/{meta.json, data.part, chunks.log}."""
+
+    def __init__(self, root=UPLOAD_ROOT, default_chunk_bytes: int = UPLOAD_CHUNK_BYTES,
+                 max_bytes: int = UPLOAD_MAX_BYTES, ttl_seconds: int = UPLOAD_TTL_SECONDS):
+        self.root = Path(root)
+        self.default_chunk_bytes = default_chunk_bytes
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._received: Dict[str, set] = {}
+        self._writing: set = set()  # (upload_id, index) частей, у которых есть открытый ChunkWriter
+        self._completing: set = set()  # upload_id, которые сейчас завершаются (``completing``)
+
+    def _dir(self, upload_id: str) -> Path:
+        if not upload_id.isalnum():
+            raise KeyError(upload_id)
+        path = self.root / upload_id
+        if not (path / "meta.json").exists():
+            raise KeyError(upload_id)
+        return path
+
+    def _data_path(self, upload_id: str) -> Path:
+        return self._dir(upload_id) / "data.part"
+
+    def meta(self, upload_id: str) -> Dict:
+        with open(self._dir(upload_id) / "meta.json", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _received_set(self, upload_id: str) -> set:
+        # под self._lock; при первом обращении (или после рестарта) — из журнала
+        received = self._received.get(upload_id)
+        if received is None:
+            log = self._dir(upload_id) / "chunks.log"
+            received = set()
+            if log.exists():
+                received = {int(line) for line in log.read_text().split()}
+            self._received[upload_id] = received
+        return received
+
+    def create(self, filename: str, size: int, kind: str = "dicom",
+               chunk_size: Optional[int] = None, sha256: Optional[str] = None) -> Dict:
+        """Новая загрузка; ValueError при неверных параметрах. Возвращает состояние (см. ``status``)."""
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}")
+        if not 0 < size <= self.max_bytes:
+            raise ValueError(f"size must be in 1..{self.max_bytes}")
+        chunk_size = int(chunk_size or self.default_chunk_bytes)
+        if not 0 < chunk_size <= MAX_CHUNK_BYTES:
+            raise ValueError(f"chunk_size must be in 1..{MAX_CHUNK_BYTES}")
+        filename = _safe_name(filename)
+        self.purge_expired()
+        upload_id = uuid.uuid4().hex[:16]
+        path = self.root / upload_id
+        path.mkdir(parents=True)
+        with open(path / "data.part", "wb") as f:
+            f.truncate(size)  # разреженный файл нужного размера: части пишутся по своим смещениям
+        meta = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "kind": kind,
+            "size": int(size),
+            "chunk_size": chunk_size,
+            "chunks": -(-int(size) // chunk_size),
+            "sha256": sha256.strip().lower() if sha256 else None,
+            "created": time.time(),
+        }
+        with open(path / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return self.status(upload_id)
+
+    def open_chunk(self, upload_id: str, index: int) -> ChunkWriter:
+        """
+        KeyError — неизвестная загрузка, ValueError — номер части вне диапазона,
+        ChunkBusyError — часть уже пишет другой запрос. Писатель нужно закрыть (``commit``/``close``).
+        """
+        meta = self.meta(upload_id)
+        if not 0 <= index < meta["chunks"]:
+            raise ValueError(f"Chunk index must be in 0..{meta['chunks'] - 1}")
+        offset = index * meta["chunk_size"]
+        with self._lock:
+            if (upload_id, index) in self._writing:
+                raise ChunkBusyError(f"Chunk {index} is being uploaded by another request")
+            self._writing.add((upload_id, index))
+            received = index in self._received_set(upload_id)
+        return ChunkWriter(self, upload_id, index, offset, min(meta["chunk_size"], meta["size"] - offset),
+                           verify_only=received)
+
+    def _release_chunk(self, upload_id: str, index: int) -> None:
+        with self._lock:
+            self._writing.discard((upload_id, index))
+
+    def write_chunk(self, upload_id: str, index: int, data: bytes, sha256: str) -> Dict:
+        writer = self.open_chunk(upload_id, index)
+        writer.write(data)
+        return writer.commit(sha256)
+
+    def _mark_received(self, upload_id: str, index: int) -> Dict:
+        with self._lock:
+            received = self._received_set(upload_id)
+            if index not in received:
+                received.add(index)
+                with open(self._dir(upload_id) / "chunks.log", "a") as f:
+                    f.write(f"{index}\n")
+        return self.status(upload_id)
+
+    def status(self, upload_id: str) -> Dict:
+        """Принятые и недостающие части, число принятых байт и непрерывные диапазоны [start, end)."""
+        meta = self.meta(upload_id)
+        with self._lock:
+            received = sorted(self._received_set(upload_id))
+        size, chunk = meta["size"], meta["chunk_size"]
+        ranges: List[List[int]] = []
+        for i in received:
+            start, end = i * chunk, min((i + 1) * chunk, size)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+        received_set = set(received)
+        return {
+            "upload_id": upload_id,
+            "filename": meta["filename"],
+            "kind": meta["kind"],
+            "size": size,
+            "chunk_size": chunk,
+            "chunks": meta["chunks"],
+            "received": received,
+            "missing": [i for i in range(meta["chunks"]) if i not in received_set],
+            "received_bytes": sum(end - start for start, end in ranges),
+            "ranges": ranges,
+        }
+
+    def finalize(self, upload_id: str) -> Path:
+        """
+        Проверяет, что приняты все части и совпал sha256 файла (если задан при создании).
+        Возвращает путь к собранному файлу; после передачи его дальше вызвать ``discard``.
+        ValueError — не хватает частей или не совпал хэш.
+        """
+        st = self.status(upload_id)
+        if st["missing"]:
+            raise ValueError(f"Missing chunks: {st['missing'][:20]}")
+        path = self._data_path(upload_id)
+        expected = self.meta(upload_id)["sha256"]
+        if expected:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            if digest.hexdigest() != expected:
+                raise ValueError("File sha256 mismatch")
+        return path
+
+    @contextmanager
+    def completing(self, upload_id: str) -> Iterator[Path]:
+        """
+        ``finalize`` под исключительным владением загрузкой: путь к собранному файлу на время блока.
+        Параллельный ``completing`` или ``discard`` той же загрузки — UploadBusyError.
+        Если блок завершился без исключения, загрузка удаляется; при ошибке остаётся (повтор или отмена).
+        """
+        path = self._dir(upload_id)
+        with self._lock:
+            if upload_id in self._completing:
+                raise UploadBusyError(f"Upload {upload_id} is being completed by another request")
+            self._completing.add(upload_id)
+        try:
+            yield self.finalize(upload_id)
+            self._remove(path)
+        finally:
+            with self._lock:
+                self._completing.discard(upload_id)
+
+    def discard(self, upload_id: str) -> None:
+        """
+        Удаляет загрузку; KeyError — неизвестный или некорректный upload_id (как в ``_dir``),
+        UploadBusyError — её сейчас завершает другой запрос.
+        """
+        path = self._dir(upload_id)
+        with self._lock:
+            if upload_id in self._completing:
+                raise UploadBusyError(f"Upload {upload_id} is being completed")
+        self._remove(path)
+
+    def _remove(self, path: Path) -> None:
+        with self._lock:
+            self._received.pop(path.name, None)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def purge_expired(self) -> int:
+        """Удаляет загрузки старше ttl_seconds; возвращает их число."""
+        if not self.root.exists():
+            return 0
+        cutoff = time.time() - self.ttl_seconds
+        expired = [
+            p for p in self.root.iterdir()
+            if p.is_dir() and p.name not in self._completing
+            and max(f.stat().st_mtime for f in [p, *p.iterdir()]) < cutoff
+        ]
+        for path in expired:
+            self._remove(path)  # в т.ч. недосозданные каталоги без meta.json
+        return len(expired)
+
+
+def materialize_dicom(path: Path, filename: str, target_root: Path, anonymize: Optional[bool] = None) -> Path:
+    """
+    Собранный файл -> папка серии в target_root: одиночный файл переносится, ZIP распаковывается
+    и возвращается его подпапка с наибольшим числом файлов (архивы обычно содержат папку серии).
+    anonymize (по умолчанию INGEST_ANONYMIZE): файлы обезличиваются при записи (потоком из архива);
+    то, что не разбирается как DICOM, не сохраняется. ValueError — не осталось ни одного файла;
+    при любой ошибке папка удаляется.
+    """
+    if anonymize is None:
+        anonymize = INGEST_ANONYMIZE
+    target = Path(target_root) / f"upload_{uuid.uuid4().hex[:8]}"
+    target.mkdir(parents=True, exist_ok=True)
+    try:
+        return _materialize(path, filename, target, anonymize)
+    except BaseException:
+        shutil.rmtree(target, ignore_errors=True)
+        raise
+
+
+def _materialize(path: Path, filename: str, target: Path, anonymize: bool) -> Path:
+    if not zipfile.is_zipfile(path):
+        if anonymize:
+            with open(path, "rb") as src:
+                write_anonymized(src, target / _safe_name(filename))
+        else:
+            os.replace(path, target / _safe_name(filename))
+        return target
+    with zipfile.ZipFile(path) as zf:
+        if not anonymize:
+            zf.extractall(target)  # extractall отбрасывает абсолютные пути и ".."
+        else:
+            for info in zf.infolist():
+                rel = os.path.normpath(info.filename.replace("\\", "/")).lstrip("/")
+                if info.is_dir() or rel.startswith("..") or os.path.isabs(rel):
+                    continue
+                out = target / rel
+                out.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    with zf.open(info) as src:
+                        write_anonymized(src, out)
+                except Exception as exc:  # noqa: BLE001
+                    log_import_error(info.filename, f"anonymization failed: {exc}")
+    counts = {Path(root): len(files) for root, _, files in os.walk(target)}
+    if not any(counts.values()):
+        raise ValueError("No DICOM files in the upload")
+    return max(counts, key=lambda d: (counts[d], -len(d.parts)))
+
+
+def _model_target(filename: str, model_id: str, meta: Optional[Dict]) -> Path:
+    target_dir = MODEL_STORE / model_id
+    target_dir.mkdir(parents=True, exist_ok=True)
+    if meta is not None:
+        with open(target_dir / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+    return target_dir / _safe_name(filename)
+
+
+def store_model(path: Path, filename: str, model_id: str, meta: Optional[Dict] = None) -> Path:
+    """Переносит файл модели в data/reports/models/<model_id>/ (рядом — meta.json); возвращает путь."""
+    target = _model_target(filename, model_id, meta)
+    os.replace(path, target)
+    return target
+
+
+def save_model_stream(fileobj: BinaryIO, filename: str, model_id: str, meta: Optional[Dict] = None) -> Path:
+    """То же для потока (обычная multipart-загрузка): копирование блоками, без чтения целиком."""
+    target = _model_target(filename, model_id, meta)
+    with open(target, "wb") as f:
+        shutil.copyfileobj(fileobj, f, 1024 * 1024)
+    return target
+
+
+_default_store: Optional[UploadStore] = None
+_default_lock = threading.Lock()
+
+
+def get_upload_store() -> UploadStore:
+    """Общее хранилище загрузок (создаётся лениво)."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = UploadStore()
+        return _default_store
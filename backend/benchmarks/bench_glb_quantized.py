@@ -0,0 +1,71 @@
+"""Benchmark: float32 GLB (trimesh) vs. quantized GLB (KHR_mesh_quantization).
+
+Usage:
+    python -m backend.benchmarks.bench_glb_quantized --slices 160 --size 512 --repeat 3
+
+Meshes a synthetic organ phantom and reports byte size (raw and gzip, as sent
+over HTTP), encode time and the maximum geometric error of the quantized
+positions in millimetres.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import time
+
+import trimesh
+
+from backend.benchmarks.synthetic import organ_with_artifacts
+from backend.export.glb_quantized import encode_quantized_glb
+from backend.segmentation.segmentation import mask_to_mesh, simple_threshold_segmentation
+
+
+def _time(fn, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def run(slices: int, size: int, repeat: int, spacing=(0.7, 0.7, 1.5)) -> dict:
+    volume = organ_with_artifacts(shape=(slices, size, size), specks=0)
+    mask = simple_threshold_segmentation(volume, (30, 300), packed=True)
+    mesh = mask_to_mesh(mask, spacing)
+    t_plain, plain = _time(lambda: trimesh.exchange.gltf.export_glb(trimesh.Scene(mesh)), repeat)
+    t_quant, (quant, stats) = _time(lambda: encode_quantized_glb(mesh), repeat)
+    return {
+        "faces": len(mesh.faces),
+        "plain_bytes": len(plain),
+        "quant_bytes": len(quant),
+        "plain_gzip": len(gzip.compress(plain, 6)),
+        "quant_gzip": len(gzip.compress(quant, 6)),
+        "plain_s": t_plain,
+        "quant_s": t_quant,
+        "max_error_mm": stats["max_error"],
+    }
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare float32 and quantized GLB export")
+    p.add_argument("--slices", type=int, default=160)
+    p.add_argument("--size", type=int, default=512)
+    p.add_argument("--repeat", type=int, default=3)
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    res = run(args.slices, args.size, args.repeat)
+    print(f"Mesh: {res['faces']} faces")
+    print(f"  float32   : {res['plain_bytes'] / 1024:.0f} KiB (gzip {res['plain_gzip'] / 1024:.0f} KiB), "
+          f"{res['plain_s'] * 1000:.1f} ms")
+    print(f"  quantized : {res['quant_bytes'] / 1024:.0f} KiB (gzip {res['quant_gzip'] / 1024:.0f} KiB), "
+          f"{res['quant_s'] * 1000:.1f} ms")
+    print(f"  size ratio: {res['quant_bytes'] / res['plain_bytes']:.2f}, max error: {res['max_error_mm']:.4f} mm")
+
+
+if __name__ == "__main__":
+    main()
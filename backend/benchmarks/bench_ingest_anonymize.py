@@ -0,0 +1,77 @@
+"""Benchmark: overhead of inline anonymization on DICOM ingest.
+
+Usage:
+    python -m backend.benchmarks.bench_ingest_anonymize --slices 200 --size 512 --repeat 3
+
+Writes a synthetic CT series, then times the ingest path of ``/upload_dicom/``
+(``save_uploaded_files`` + ``load_dicom_series``) with and without inline
+anonymization.  The overhead is reported relative to the plain ingest time.
+"""
+
+from __future__ import annotations
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from backend.benchmarks.synthetic import write_ct_series
+from backend.dicom.dicom_service import save_uploaded_files
+from backend.segmentation.segmentation import load_dicom_series
+
+
+def _ingest(files, anonymize: bool) -> float:
+    t0 = time.perf_counter()
+    handles = [(p.name, open(p, "rb")) for p in files]
+    try:
+        folder = save_uploaded_files(handles, anonymize=anonymize)
+    finally:
+        for _, fh in handles:
+            fh.close()
+    load_dicom_series(folder)
+    elapsed = time.perf_counter() - t0
+    shutil.rmtree(folder, ignore_errors=True)
+    return elapsed
+
+
+def run(slices: int, size: int, repeat: int) -> dict:
+    rng = np.random.default_rng(0)
+    volume = rng.integers(-1000, 1500, size=(slices, size, size), dtype=np.int16)
+    with tempfile.TemporaryDirectory() as tmp:
+        files = sorted(write_ct_series(Path(tmp) / "series", volume).iterdir())
+        plain, anon = float("inf"), float("inf")
+        # Interleaved runs: page cache and CPU frequency drift hit both variants equally
+        for _ in range(repeat):
+            plain = min(plain, _ingest(files, anonymize=False))
+            anon = min(anon, _ingest(files, anonymize=True))
+    return {
+        "slices": slices,
+        "size": size,
+        "plain_s": plain,
+        "anonymized_s": anon,
+        "overhead_pct": 100.0 * (anon - plain) / plain,
+    }
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Measure inline anonymization overhead on DICOM ingest")
+    p.add_argument("--slices", type=int, default=200)
+    p.add_argument("--size", type=int, default=512)
+    p.add_argument("--repeat", type=int, default=7)
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    res = run(args.slices, args.size, args.repeat)
+    print(f"Series {res['slices']}x{res['size']}x{res['size']}")
+    print(f"  ingest        : {res['plain_s']:.3f} s")
+    print(f"  + anonymize   : {res['anonymized_s']:.3f} s")
+    print(f"  overhead      : {res['overhead_pct']:.1f} %")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""Benchmark suite: the whole segmentation pipeline on synthetic phantoms, with a JSON baseline.
+
+Usage:
+    python -m backend.benchmarks.suite --size small --save baseline.json
+    python -m backend.benchmarks.suite --size small --compare baseline.json
+    python -m backend.benchmarks.suite --size stress --cases header_scan load_dicom_series threshold
+
+Every run writes an abdomen phantom (:class:`~backend.benchmarks.synthetic.Phantom`,
+two kidneys and a spleen of known analytic volume) as a DICOM series and times
+each stage on it:
+
+* ``header_scan``       — ``dicom_service.collect_series`` (headers only);
+* ``load_dicom_series`` / ``load_dicom_series_parallel`` — the sitk and the
+  parallel reader;
+* ``threshold``         — ``simple_threshold_segmentation`` (dense and packed);
+* ``mask_to_stl`` / ``mask_to_gltf`` — marching cubes and export;
+* ``trocar``            — ``calculate_trocar_points`` on an abdomen-sized ellipsoid;
+* ``align_icp``         — rigid ICP of a rotated organ surface (skipped
+  without open3d).
+
+Each case reports min/median/mean/stddev over ``--rounds`` timed runs after
+one warm-up run, plus case metrics (e.g. the relative error of the segmented
+volume against the analytic organ volumes).  ``--save`` writes the results as
+a JSON baseline; ``--compare`` checks a run against one and exits with status 1
+when a case's median is slower than the baseline by more than its threshold
+(``--threshold``, default 25%; a ``"threshold"`` key in a baseline case
+overrides it).  Baselines only make sense on the machine that recorded them.
+
+The ``stress`` size is the ~2 GB volume of plan M3 (512×512×4096 int16).
+The series is written slice by slice, so generating it needs only disk space;
+the report includes the peak RSS of the process.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import trimesh
+
+from backend.benchmarks.synthetic import Phantom
+from backend.dicom.dicom_service import collect_series
+from backend.calculations.trocar_calculations import calculate_trocar_points
+from backend.segmentation.segmentation import (
+    load_dicom_series,
+    mask_to_gltf,
+    mask_to_mesh,
+    mask_to_stl,
+    simple_threshold_segmentation,
+)
+
+SIZES = {  # (z, y, x) voxels, spacing (x, y, z) mm
+    "tiny": ((24, 64, 64), (3.0, 3.0, 6.0)),
+    "small": ((96, 256, 256), (1.5, 1.5, 3.0)),
+    "medium": ((256, 512, 512), (0.8, 0.8, 1.5)),
+    "stress": ((4096, 512, 512), (0.8, 0.8, 0.5)),
+}
+DEFAULT_THRESHOLD = 0.25  # allowed slowdown of the median against the baseline
+DEFAULT_ROUNDS = 5
+NOISE_HU = 10.0
+
+
+class SkipCase(Exception):
+    """The case cannot run here (e.g. an optional dependency is missing)."""
+
+
+@dataclass
+class Context:
+    """Data shared by the cases of one run; built once, before any timing."""
+
+    phantom: Phantom
+    series: Path
+    workdir: Path
+    volume: Optional[np.ndarray] = None
+    mask: Optional[np.ndarray] = None
+    cache: Dict = field(default_factory=dict)
+
+    def load(self) -> np.ndarray:
+        if self.volume is None:
+            # The parallel reader fills one array, sitk needs a second copy (4 GB at the stress size)
+            self.volume = load_dicom_series(self.series, reader_kind="parallel")[1]
+        return self.volume
+
+    def get_mask(self) -> np.ndarray:
+        if self.mask is None:
+            self.mask = simple_threshold_segmentation(self.load())
+        return self.mask
+
+
+@dataclass
+class Case:
+    name: str
+    func: Callable[[Context], Optional[Dict]]
+    stress: bool = False  # also run on the ~2 GB volume
+
+
+CASES: Dict[str, Case] = {}
+
+
+def case(name: str, stress: bool = False):
+    """Register a benchmark case; the function returns a dict of metrics or None."""
+
+    def register(func: Callable[[Context], Optional[Dict]]):
+        CASES[name] = Case(name, func, stress)
+        return func
+
+    return register
+
+
+@case("header_scan", stress=True)
+def _header_scan(ctx: Context) -> Dict:
+    return {"files": len(collect_series(ctx.series))}
+
+
+@case("load_dicom_series", stress=True)
+def _load_sitk(ctx: Context) -> Dict:
+    array = load_dicom_series(ctx.series, reader_kind="sitk")[1]
+    return {"shape": list(array.shape)}
+
+
+@case("load_dicom_series_parallel", stress=True)
+def _load_parallel(ctx: Context) -> Dict:
+    array = load_dicom_series(ctx.series, reader_kind="parallel")[1]
+    return {"shape": list(array.shape)}
+
+
+@case("threshold", stress=True)
+def _threshold(ctx: Context) -> Dict:
+    mask = simple_threshold_segmentation(ctx.load())
+    return {"volume_error": volume_error(ctx.phantom, int(np.count_nonzero(mask)))}
+
+
+@case("threshold_packed", stress=True)
+def _threshold_packed(ctx: Context) -> Dict:
+    packed = simple_threshold_segmentation(ctx.load(), packed=True)
+    return {"volume_error": volume_error(ctx.phantom, packed.voxel_count)}
+
+
+@case("mask_to_stl")
+def _mask_to_stl(ctx: Context) -> Dict:
+    out = mask_to_stl(ctx.get_mask(), ctx.phantom.spacing[::-1], str(ctx.workdir / "organs.stl"))
+    return {"bytes": os.path.getsize(out)}
+
+
+@case("mask_to_gltf")
+def _mask_to_gltf(ctx: Context) -> Dict:
+    out = mask_to_gltf(ctx.get_mask(), ctx.phantom.spacing[::-1], str(ctx.workdir / "organs.glb"))
+    return {"bytes": os.path.getsize(out)}
+
+
+@case("trocar")
+def _trocar(ctx: Context) -> Dict:
+    if "body" not in ctx.cache:
+        # Flattened abdomen (m): most of the upper surface faces +Z, so the unseeded
+        # surface sampling of calculate_trocar_points always finds enough candidates
+        body = trimesh.creation.icosphere(subdivisions=4)
+        body.apply_scale((0.18, 0.15, 0.05))
+        ctx.cache["body"] = body
+    landmarks = {"asis_left": np.array([0.12, -0.08, 0.03]), "asis_right": np.array([-0.12, -0.08, 0.03])}
+    points, _ = calculate_trocar_points(ctx.cache["body"], landmarks, num_ports=3, min_distance=0.04,
+                                        max_angle_deg=60)
+    return {"ports": len(points)}
+
+
+@case("align_icp")
+def _align_icp(ctx: Context) -> Dict:
+    try:
+        from backend.calculations.icp_alignment import align_icp
+    except ImportError as exc:
+        raise SkipCase(f"open3d is not available: {exc}") from exc
+    if "icp" not in ctx.cache:
+        verts = np.asarray(mask_to_mesh(ctx.get_mask(), ctx.phantom.spacing[::-1]).vertices, dtype=np.float64)
+        angle = np.deg2rad(5.0)
+        rot = np.array([[np.cos(angle), -np.sin(angle), 0], [np.sin(angle), np.cos(angle), 0], [0, 0, 1]])
+        ctx.cache["icp"] = (verts @ rot.T + np.array([2.0, -1.5, 1.0]), verts)
+    source, target = ctx.cache["icp"]
+    _, moved = align_icp(source, target)
+    return {"points": len(source), "rmse": float(np.sqrt(((moved - target) ** 2).sum(axis=1).mean()))}
+
+
+def volume_error(phantom: Phantom, voxels: int) -> float:
+    """Relative error of a segmented volume against the analytic organ volumes."""
+    expected = sum(phantom.organ_volumes().values())
+    return abs(voxels * float(np.prod(phantom.spacing)) - expected) / expected
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process, MB (None where ``resource`` is missing)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def measure(func: Callable[[], Optional[Dict]], rounds: int = DEFAULT_ROUNDS, warmup: int = 1) -> Dict:
+    """Time *func* over *rounds* runs after *warmup* untimed ones; metrics come from the last run."""
+    metrics = None
+    for _ in range(warmup):
+        metrics = func()
+    times = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        metrics = func()
+        times.append(time.perf_counter() - t0)
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "stddev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "rounds": rounds,
+        "metrics": metrics or {},
+    }
+
+
+def make_phantom(size: str, seed: int = 0) -> Phantom:
+    shape, spacing = SIZES[size]
+    return Phantom.abdomen(shape, spacing, noise=NOISE_HU, seed=seed)
+
+
+def run(
+    size: str = "small",
+    cases: Optional[Sequence[str]] = None,
+    rounds: int = DEFAULT_ROUNDS,
+    workdir: Optional[Path] = None,
+    progress: bool = True,
+) -> Dict:
+    """Run the selected cases (default: all, or the stress ones for ``size="stress"``) on a new phantom."""
+    stress = size == "stress"
+    if cases is None:
+        cases = [name for name, c in CASES.items() if c.stress or not stress]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases: {', '.join(sorted(unknown))}")
+    if stress:
+        rounds = min(rounds, 1)  # a single 2 GB pass is long enough to be stable
+
+    phantom = make_phantom(size)
+    tmp = Path(tempfile.mkdtemp(prefix="bench_suite_", dir=workdir))
+    try:
+        t0 = time.perf_counter()
+        series = phantom.write_series(tmp / "series")
+        generate_s = time.perf_counter() - t0
+        ctx = Context(phantom=phantom, series=series, workdir=tmp)
+        results = {}
+        for name in cases:
+            try:
+                results[name] = measure(lambda: CASES[name].func(ctx), rounds=rounds)
+            except SkipCase as exc:
+                results[name] = {"skipped": str(exc)}
+            if progress:
+                print(_format_case(name, results[name]), flush=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {
+        "meta": {
+            "size": size,
+            "shape": list(phantom.shape),
+            "spacing": list(phantom.spacing),
+            "volume_mb": round(phantom.nbytes / 1024 ** 2, 1),
+            "organs_ml": {k: round(v / 1000, 3) for k, v in phantom.organ_volumes().items()},
+            "generate_s": round(generate_s, 3),
+            "peak_rss_mb": peak_rss_mb(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "cases": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """Compare case medians with *baseline*; a case regresses when ``median > baseline * (1 + threshold)``."""
+    rows = []
+    if baseline.get("meta", {}).get("size") != current.get("meta", {}).get("size"):
+        raise ValueError("Baseline was recorded for a different --size")
+    base_cases = baseline.get("cases", {})
+    for name, res in current.get("cases", {}).items():
+        base = base_cases.get(name)
+        if "skipped" in res or base is None or "skipped" in base:
+            rows.append({"case": name, "status": "skipped" if "skipped" in res else "new"})
+            continue
+        limit = base.get("threshold", threshold)
+        ratio = res["median"] / base["median"] if base["median"] > 0 else float("inf")
+        status = "regression" if ratio > 1 + limit else "improved" if ratio < 1 / (1 + limit) else "ok"
+        rows.append({
+            "case": name,
+            "status": status,
+            "baseline": base["median"],
+            "current": res["median"],
+            "ratio": ratio,
+            "threshold": limit,
+        })
+    for name in base_cases.keys() - current.get("cases", {}).keys():
+        rows.append({"case": name, "status": "missing"})
+    return rows
+
+
+def _format_case(name: str, res: Dict) -> str:
+    if "skipped" in res:
+        return f"  {name:28s} skipped ({res['skipped']})"
+    extra = ", ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in res["metrics"].items())
+    return (f"  {name:28s} median {res['median'] * 1000:9.1f} ms  min {res['min'] * 1000:9.1f} ms  "
+            f"± {res['stddev'] * 1000:7.1f} ms  {extra}")
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Benchmark the segmentation pipeline on synthetic phantoms")
+    p.add_argument("--size", choices=sorted(SIZES), default="small")
+    p.add_argument("--cases", nargs="+", default=None, choices=sorted(CASES), help="Cases to run (default: all)")
+    p.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS)
+    p.add_argument("--workdir", type=Path, default=None, help="Where to write the series (default: system temp)")
+    p.add_argument("--save", type=Path, default=None, help="Write the results as a JSON baseline")
+    p.add_argument("--compare", type=Path, default=None, help="Baseline JSON to check against")
+    p.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                   help="Allowed median slowdown, fraction (default 0.25)")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    print(f"Phantom '{args.size}': {SIZES[args.size][0]} voxels")
+    results = run(args.size, args.cases, rounds=args.rounds, workdir=args.workdir)
+    meta = results["meta"]
+    rss = f", peak RSS {meta['peak_rss_mb']:.0f} MB" if meta["peak_rss_mb"] is not None else ""
+    print(f"Series of {meta['volume_mb']} MB generated in {meta['generate_s']} s{rss}")
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(results, indent=2))
+        print(f"Baseline saved → {args.save}")
+    if args.compare:
+        rows = compare(results, json.loads(args.compare.read_text()), args.threshold)
+        for row in rows:
+            if "ratio" in row:
+                print(f"  {row['case']:28s} {row['status']:10s} x{row['ratio']:.2f} "
+                      f"(limit x{1 + row['threshold']:.2f})")
+            else:
+                print(f"  {row['case']:28s} {row['status']}")
+        if any(row["status"] == "regression" for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Synthetic CT data for benchmarks and tests.
+
+Generates DICOM series without any real patient data so that performance
+measurements and pipeline tests are reproducible anywhere.
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from pydicom.dataset import Dataset, FileDataset
+from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+
+__all__ = ["Organ", "Phantom", "write_ct_series", "organ_with_artifacts"]
+
+
+def _write_slice(path: Path, stored: np.ndarray, z: int, study_uid: str, series_uid: str, spacing, origin,
+                 intercept: float, bits_stored: int = 16) -> None:
+    meta = Dataset()
+    meta.MediaStorageSOPClassUID = CTImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = FileDataset(str(path), {}, file_meta=meta, preamble=b"\0" * 128)
+    ds.SOPClassUID = CTImageStorage
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.StudyInstanceUID = study_uid
+    ds.SeriesInstanceUID = series_uid
+    ds.Modality = "CT"
+    ds.PatientName = "Test^Phantom"
+    ds.PatientID = "PHANTOM"
+    ds.InstanceNumber = int(z) + 1
+    ds.ImagePositionPatient = [origin[0], origin[1], origin[2] + float(z) * spacing[2]]
+    ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    ds.PixelSpacing = [spacing[1], spacing[0]]
+    ds.SliceThickness = spacing[2]
+    ds.Rows, ds.Columns = stored.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = 16
+    ds.BitsStored = bits_stored
+    ds.HighBit = bits_stored - 1
+    ds.PixelRepresentation = 1
+    ds.RescaleIntercept = intercept
+    ds.RescaleSlope = 1
+    ds.PixelData = stored.tobytes()
+    ds.save_as(path, enforce_file_format=True)
+
+
+def write_ct_series(folder: Path, volume: np.ndarray, spacing=(0.8, 0.8, 2.0), origin=(-100.0, -80.0, 50.0),
+                    intercept: float = -1024.0) -> Path:
+    """Write *volume* (z, y, x HU values) as a CT series with one file per slice."""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    study_uid, series_uid = generate_uid(), generate_uid()
+    stored = (volume - intercept).astype(np.int16)
+    # Shuffle file order so that readers must sort by position, not by name
+    for z in np.random.RandomState(0).permutation(volume.shape[0]):
+        path = folder / f"slice_{int(z) * 7 % 1000:04d}.dcm"
+        _write_slice(path, stored[z], int(z), study_uid, series_uid, spacing, origin, intercept)
+    return folder
+
+
+@dataclass(frozen=True)
+class Organ:
+    """Ellipsoid of constant HU; *center* and *radii* in mm, (x, y, z) like the series spacing."""
+
+    name: str
+    center: Tuple[float, float, float]
+    radii: Tuple[float, float, float]
+    hu: int = 150
+
+    @property
+    def volume_mm3(self) -> float:
+        return 4.0 / 3.0 * math.pi * self.radii[0] * self.radii[1] * self.radii[2]
+
+
+@dataclass
+class Phantom:
+    """Abdomen-like CT phantom generated slice by slice, with organs of known volume.
+
+    *shape* is (z, y, x) voxels, *spacing* (x, y, z) mm as in :func:`write_ct_series`.
+    Voxel (z, y, x) is centred at ``(x * sx, y * sy, z * sz)`` mm.  A fat-density body
+    (``body_hu``, outside the default 30..300 HU threshold) surrounds the organs; optional
+    Gaussian noise is deterministic per slice.
+    """
+
+    shape: Tuple[int, int, int]
+    spacing: Tuple[float, float, float] = (0.8, 0.8, 2.0)
+    organs: Sequence[Organ] = ()
+    background: int = -1000
+    body_hu: Optional[int] = -100
+    noise: float = 0.0
+    seed: int = 0
+
+    @classmethod
+    def abdomen(cls, shape: Tuple[int, int, int], spacing=(0.8, 0.8, 2.0), **kwargs) -> "Phantom":
+        """Two kidneys and a spleen scaled to the field of view."""
+        ext = [n * s for n, s in zip(shape[::-1], spacing)]  # (x, y, z) mm
+        cz = ext[2] / 2
+        rz = 0.3 * ext[2]
+        organs = (
+            Organ("kidney_left", (0.32 * ext[0], 0.55 * ext[1], cz), (0.08 * ext[0], 0.11 * ext[1], rz), 150),
+            Organ("kidney_right", (0.68 * ext[0], 0.55 * ext[1], cz), (0.08 * ext[0], 0.11 * ext[1], rz), 150),
+            Organ("spleen", (0.5 * ext[0], 0.35 * ext[1], cz), (0.12 * ext[0], 0.07 * ext[1], 0.8 * rz), 120),
+        )
+        return cls(shape=tuple(shape), spacing=tuple(spacing), organs=organs, **kwargs)
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape)) * 2
+
+    def organ_volumes(self) -> Dict[str, float]:
+        """Analytic organ volumes, mm³."""
+        return {o.name: o.volume_mm3 for o in self.organs}
+
+    def slice(self, z: int) -> np.ndarray:
+        """HU values of slice *z* as int16 (y, x)."""
+        _, ny, nx = self.shape
+        sx, sy, sz = self.spacing
+        out = np.full((ny, nx), self.background, dtype=np.int16)
+        yy = np.arange(ny, dtype=np.float32)[:, None] * sy
+        xx = np.arange(nx, dtype=np.float32)[None, :] * sx
+        if self.body_hu is not None:
+            cx, cy = nx * sx / 2, ny * sy / 2
+            out[((xx - cx) / (0.45 * nx * sx)) ** 2 + ((yy - cy) / (0.4 * ny * sy)) ** 2 <= 1] = self.body_hu
+        zz = z * sz
+        for organ in self.organs:
+            (cx, cy, cz), (rx, ry, rz) = organ.center, organ.radii
+            k = 1.0 - ((zz - cz) / rz) ** 2
+            if k < 0:
+                continue
+            out[((xx - cx) / rx) ** 2 + ((yy - cy) / ry) ** 2 <= k] = organ.hu
+        if self.noise:
+            rng = np.random.default_rng((self.seed, z))
+            out = (out + rng.normal(0, self.noise, out.shape)).round().astype(np.int16)
+        return out
+
+    def volume(self) -> np.ndarray:
+        """Whole (z, y, x) int16 HU volume — only for phantoms that fit in memory."""
+        vol = np.empty(self.shape, dtype=np.int16)
+        for z in range(self.shape[0]):
+            vol[z] = self.slice(z)
+        return vol
+
+    def write_series(self, folder: Path, origin=(-100.0, -80.0, 50.0), intercept: float = -1024.0,
+                     bits_stored: int = 12) -> Path:
+        """Write the phantom as a CT series slice by slice (memory stays O(one slice)).
+
+        Like most scanners it stores 12 bits by default, so readers can keep HU in int16.
+        """
+        lo, hi = -(1 << (bits_stored - 1)), (1 << (bits_stored - 1)) - 1
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        study_uid, series_uid = generate_uid(), generate_uid()
+        order = np.random.RandomState(0).permutation(self.shape[0])
+        for i, z in enumerate(order):
+            stored = np.clip(self.slice(int(z)).astype(np.int32) - int(intercept), lo, hi).astype(np.int16)
+            _write_slice(folder / f"slice_{i:05d}.dcm", stored, int(z), study_uid, series_uid,
+                         self.spacing, origin, intercept, bits_stored)
+        return folder
+
+
+def organ_with_artifacts(shape=(160, 512, 512), radii=(30, 60, 45), organ_hu: int = 150, specks: int = 200,
+                         seed: int = 0) -> np.ndarray:
+    """CT-like volume with one ellipsoidal 'organ' that has an internal cavity, plus small
+    isolated specks in the organ HU range around it (what post-processing is expected to remove)."""
+    rng = np.random.default_rng(seed)
+    vol = np.full(shape, -1000, dtype=np.int16)
+    center = [n // 2 for n in shape]
+    box = tuple(slice(c - r - 1, c + r + 2) for c, r in zip(center, radii))
+    zz, yy, xx = np.ogrid[box]
+    dist = sum(((g - c) / r) ** 2 for g, c, r in zip((zz, yy, xx), center, radii))
+    sub = vol[box]
+    sub[dist <= 1] = organ_hu
+    sub[dist <= 0.15] = -1000  # cavity inside the organ
+    # Specks stay in the organ's neighbourhood, as threshold leakage from adjacent tissue does
+    near = [(max(c - 3 * r // 2, 1), min(c + 3 * r // 2, n - 3)) for c, r, n in zip(center, radii, shape)]
+    for z, y, x in zip(*(rng.integers(lo, hi, size=specks) for lo, hi in near)):
+        vol[z:z + 2, y:y + 2, x:x + 2] = organ_hu
+    return vol
@@ -13,6 +13,8 @@ from typing import Tuple
 import numpy as np
 import open3d as o3d
 
+from backend.monitoring.metrics import stage
+
 __all__ = ["align_icp"]
 
 
@@ -22,6 +24,7 @@ def _to_pcd(points: np.ndarray) -> o3d.geometry.PointCloud:
     return pcd
 
 
+@stage("icp")
 def align_icp(source_pts: np.ndarray, target_pts: np.ndarray, threshold: float = 10.0) -> Tuple[np.ndarray, np.ndarray]:
     """Rigid ICP alignment (point-to-point)."""
     assert source_pts.shape[1] == 3 and target_pts.shape[1] == 3, "pts must be Nx3"
@@ -5,6 +5,8 @@ import trimesh
 from math import radians, cos, sin
 from typing import Sequence
 
+from backend.monitoring.metrics import stage
+
 # ------------------------------------------------------------
 #  Helper orientation utilities
 # ------------------------------------------------------------
@@ -52,6 +54,7 @@ def _compute_outward_vector(patient_position: str, pitch_deg: float, roll_deg: f
 #  Public API
 # ------------------------------------------------------------
 
+@stage("trocar")
 def calculate_trocar_points(
     mesh: trimesh.Trimesh,
     anatomical_points: dict[str, np.ndarray],
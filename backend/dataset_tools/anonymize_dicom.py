@@ -1,19 +1,39 @@
-"""Anonymize DICOM series in a directory tree.
+r"""Anonymize DICOM series in a directory tree.
 
 Usage (PowerShell):
-    python anonymize_dicom.py -i C:\data\raw_dicom -o C:\data\anon_dicom
+    python anonymize_dicom.py -i C:\data\raw_dicom -o C:\data\anon_dicom --workers 8
 
 The script copies the directory tree from input to output, removing
-patient-identifying tags as defined in DICOM PS3.15.  UIDs are re-generated,
-InstanceNumber and ImagePositionPatient are preserved.
+patient-identifying tags as defined in DICOM PS3.15.  InstanceNumber and
+ImagePositionPatient are preserved.
+
+UIDs are remapped deterministically: ``generate_uid(entropy_srcs=[salt, uid])``.
+The same original UID maps to the same new UID in every file and in every
+worker process, so slices of one series still share a SeriesInstanceUID and
+references between objects stay consistent.  Pass a fixed ``--salt`` (or set
+ANON_UID_SALT) to keep the mapping stable across runs; keep the salt secret.
+
+Files are processed by a process pool.  Pixel data is read deferred
+(``defer_size``) and copied through as raw bytes on write — it is never
+decoded and only held in memory while one file is written.
 """
 
+from __future__ import annotations
+
 import argparse
+import json
+import os
+import secrets
 import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 import pydicom
+from pydicom.datadict import dictionary_VR
 from pydicom.uid import generate_uid
 
 # Tags to delete completely (PHI)
@@ -29,44 +49,147 @@ PHI_TAGS: List[str] = [
     "InstitutionName",
 ]
 
-# Tags whose UID should be replaced with a random UID
+# Tags whose UID must be remapped (every other UI element is remapped too, see below)
 auto_uid_tags = [
     "StudyInstanceUID",
     "SeriesInstanceUID",
     "SOPInstanceUID",
 ]
 
-def anonymize_file(src: Path, dst: Path) -> None:
-    ds = pydicom.dcmread(src, force=True)
+# UI elements that identify a class or encoding, not an instance — kept as is
+KEEP_UID_KEYWORDS = {
+    "SOPClassUID",
+    "ReferencedSOPClassUID",
+    "MediaStorageSOPClassUID",
+    "TransferSyntaxUID",
+    "ImplementationClassUID",
+    "CodingSchemeUID",
+    "RelatedGeneralSOPClassUID",
+    "OriginalSpecializedSOPClassUID",
+}
+
+# Elements larger than this (PixelData) are not read until the dataset is written
+DEFER_SIZE = "64 KB"
+PROGRESS_EVERY = 500
+
+# Per-process fallback salt for direct anonymize_file() calls without a salt
+_SESSION_SALT = os.environ.get("ANON_UID_SALT") or secrets.token_hex(16)
+
+
+@lru_cache(maxsize=65536)
+def remap_uid(uid: str, salt: Optional[str] = None) -> str:
+    """Deterministic replacement UID: same (salt, uid) -> same result in any process.
+
+    Cached: slices of a series share study, series and frame-of-reference UIDs.
+    """
+    return generate_uid(entropy_srcs=[salt or _SESSION_SALT, str(uid)])
+
+
+def remap_uids(ds: pydicom.Dataset, salt: Optional[str] = None) -> None:
+    """Remaps every instance UID, recursing into sequences; deferred elements are not loaded."""
+    for tag in list(ds.keys()):
+        raw = ds.get_item(tag, keep_deferred=True)
+        vr = raw.VR
+        if not vr:  # implicit VR: take it from the dictionary
+            try:
+                vr = dictionary_VR(tag)
+            except KeyError:
+                continue
+        if vr == "SQ":
+            for item in ds[tag].value:
+                remap_uids(item, salt)
+        elif vr == "UI":
+            elem = ds[tag]
+            if elem.keyword in KEEP_UID_KEYWORDS or not elem.value:
+                continue
+            if elem.VM > 1:
+                elem.value = [remap_uid(v, salt) for v in elem.value]
+            else:
+                elem.value = remap_uid(elem.value, salt)
+
+
+def anonymize_dataset(ds: pydicom.Dataset, salt: Optional[str] = None) -> pydicom.Dataset:
+    """Strips PHI and remaps UIDs in place; deferred elements (pixel data) are left untouched."""
     # Remove PHI tags
     for tag in PHI_TAGS:
         if tag in ds:
             del ds[tag]
-    # Replace UIDs
-    for tag in auto_uid_tags:
-        if tag in ds:
-            ds[tag].value = generate_uid()
+    # Replace UIDs (including references inside sequences)
+    remap_uids(ds, salt)
+    meta = getattr(ds, "file_meta", None)
+    if meta is not None and "SOPInstanceUID" in ds:
+        meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
     # Set dummy patient name to keep software happy
     ds.PatientName = "ANONYMIZED"
+    return ds
+
+
+def anonymize_file(src: Path, dst: Path, salt: Optional[str] = None) -> None:
+    ds = pydicom.dcmread(src, force=True, defer_size=DEFER_SIZE)
+    anonymize_dataset(ds, salt)
     ds.save_as(dst)
 
 
-def anonymize_series(input_dir: Path, output_dir: Path) -> None:
-    """Recursively copy and anonymize all DICOM files."""
-    for file_path in input_dir.rglob("*.dcm"):
-        rel = file_path.relative_to(input_dir)
-        dst_path = output_dir / rel
+def _anonymize_task(task: Tuple[str, str, str]) -> Tuple[str, int, Optional[str]]:
+    src, dst, salt = task
+    try:
+        anonymize_file(Path(src), Path(dst), salt)
+        return src, os.path.getsize(src), None
+    except Exception as exc:  # noqa: BLE001
+        return src, 0, str(exc)
+
+
+def anonymize_series(
+    input_dir: Path,
+    output_dir: Path,
+    workers: Optional[int] = None,
+    salt: Optional[str] = None,
+    progress: bool = True,
+) -> Dict:
+    """Recursively copy and anonymize all DICOM files; returns a throughput report."""
+    salt = salt or _SESSION_SALT
+    tasks = []
+    for file_path in sorted(input_dir.rglob("*.dcm")):
+        dst_path = output_dir / file_path.relative_to(input_dir)
         dst_path.parent.mkdir(parents=True, exist_ok=True)
-        try:
-            anonymize_file(file_path, dst_path)
-        except Exception as exc:  # noqa: BLE001
-            print(f"[WARN] Skip {file_path}: {exc}")
+        tasks.append((str(file_path), str(dst_path), salt))
+
+    start = time.perf_counter()
+    done, total_bytes, failed = 0, 0, []
+    workers = workers or os.cpu_count() or 1
+    # Batch tasks so per-task IPC overhead stays small next to the file I/O
+    chunksize = max(1, min(64, len(tasks) // (workers * 4) or 1))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for src, size, error in pool.map(_anonymize_task, tasks, chunksize=chunksize):
+            done += 1
+            total_bytes += size
+            if error is not None:
+                failed.append({"file": src, "error": error})
+                print(f"[WARN] Skip {src}: {error}", file=sys.stderr)
+            if progress and (done % PROGRESS_EVERY == 0 or done == len(tasks)):
+                elapsed = time.perf_counter() - start
+                print(f"[{done}/{len(tasks)}] {done / max(elapsed, 1e-9):.1f} files/s")
+
+    elapsed = time.perf_counter() - start
+    return {
+        "files": len(tasks),
+        "anonymized": len(tasks) - len(failed),
+        "failed": failed,
+        "bytes": total_bytes,
+        "seconds": round(elapsed, 3),
+        "files_per_s": round(len(tasks) / max(elapsed, 1e-9), 1),
+        "mb_per_s": round(total_bytes / 1024 ** 2 / max(elapsed, 1e-9), 1),
+        "workers": workers,
+    }
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Anonymize DICOM directory tree.")
     parser.add_argument("-i", "--input", required=True, type=Path, help="Input directory with DICOM")
     parser.add_argument("-o", "--output", required=True, type=Path, help="Output directory for anonymized DICOM")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--salt", default=None, help="Secret salt for UID remapping (default: ANON_UID_SALT or random)")
+    parser.add_argument("--report", type=Path, default=None, help="Write the throughput report as JSON")
     return parser.parse_args()
 
 
@@ -75,8 +198,13 @@ def main() -> None:
     if args.output.exists():
         shutil.rmtree(args.output)
     args.output.mkdir(parents=True)
-    anonymize_series(args.input, args.output)
-    print("Anonymization completed →", args.output)
+    report = anonymize_series(args.input, args.output, workers=args.workers, salt=args.salt)
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2))
+    print(
+        f"Anonymized {report['anonymized']}/{report['files']} files in {report['seconds']} s "
+        f"({report['files_per_s']} files/s, {report['mb_per_s']} MB/s) →", args.output
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,298 @@
+"""Chunked, compressed volume store for random-access patch training.
+
+A ``.cvol`` file holds one 3-D array split into fixed-size chunks
+(default 32³).  Each chunk is byte-shuffled and zlib-compressed on its own, so a
+96³ training patch only reads and decompresses the 27–64 chunks it overlaps
+instead of a whole volume.  Small chunks waste less decode work on the patch
+border than 64³ ones (about 8 MB instead of 15 MB of float32 per 96³ patch).
+
+Layout::
+
+    b"CVOL1\\0\\0\\0"          magic
+    uint64 (little endian)    offset of the index
+    chunk 0, chunk 1, ...     compressed chunks in C order of the chunk grid
+    index                     UTF-8 JSON: shape, dtype, chunks, codec,
+                              offsets, sizes, attrs
+
+Byte shuffling groups the n-th byte of every element together (as Blosc
+does); float32 and int16 volumes compress noticeably better after it.
+Chunks are read with ``os.pread`` and decompressed by ``zlib``, and both
+release the GIL, so several reader threads scale on one file (on Windows,
+without ``pread``, the reads themselves are serialized).
+
+Writing goes slab by slab along z: only one slab of chunk depth is in
+memory, and a *transform* (e.g. HU normalization) can be applied to it on
+the way — ``preprocess_volume`` writes ``.cvol`` outputs this way.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+__all__ = [
+    "CHUNK_SHAPE",
+    "ChunkedVolume",
+    "PatchDataset",
+    "write_chunked",
+]
+
+MAGIC = b"CVOL1\0\0\0"
+HEADER = struct.Struct("<8sQ")
+CHUNK_SHAPE = (32, 32, 32)
+ZLIB_LEVEL = 1  # level 1 is ~3x faster than 6 for a few percent larger files
+CACHE_BYTES = 64 * 1024 ** 2  # decoded chunks kept per open volume
+
+
+def _shuffle(buf: np.ndarray) -> bytes:
+    return np.ascontiguousarray(buf.reshape(-1).view(np.uint8).reshape(-1, buf.itemsize).T).tobytes()
+
+
+def _unshuffle(raw: bytes, dtype: np.dtype, shape: Tuple[int, ...]) -> np.ndarray:
+    planes = np.frombuffer(raw, dtype=np.uint8).reshape(dtype.itemsize, -1)
+    return np.ascontiguousarray(planes.T).view(dtype).reshape(shape)
+
+
+def write_chunked(
+    arr: np.ndarray,
+    path: Path,
+    chunks: Sequence[int] = CHUNK_SHAPE,
+    level: int = ZLIB_LEVEL,
+    transform: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    attrs: Optional[Dict] = None,
+) -> Dict:
+    """Write *arr* (any array-like with slicing, e.g. a memmap) as a ``.cvol`` file; returns the index.
+
+    *transform* is applied to each z slab before it is chunked and decides the stored dtype.
+    The file is written under a temporary name and renamed when complete.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    shape = tuple(int(n) for n in arr.shape)
+    chunks = tuple(int(c) for c in chunks)
+    offsets: List[int] = []
+    sizes: List[int] = []
+    dtype = None
+    tmp_path = path.with_name(path.name + ".part")
+    with open(tmp_path, "wb") as fh:
+        fh.write(HEADER.pack(MAGIC, 0))
+        for z0 in range(0, shape[0], chunks[0]):
+            slab = np.asarray(arr[z0:z0 + chunks[0]])
+            if transform is not None:
+                slab = transform(slab)
+            dtype = slab.dtype
+            for y0 in range(0, shape[1], chunks[1]):
+                for x0 in range(0, shape[2], chunks[2]):
+                    block = slab[:, y0:y0 + chunks[1], x0:x0 + chunks[2]]
+                    data = zlib.compress(_shuffle(block), level)
+                    offsets.append(fh.tell())
+                    sizes.append(len(data))
+                    fh.write(data)
+        index = {
+            "shape": list(shape),
+            "dtype": np.dtype(dtype if dtype is not None else arr.dtype).str,
+            "chunks": list(chunks),
+            "codec": "zlib",
+            "shuffle": True,
+            "offsets": offsets,
+            "sizes": sizes,
+            "attrs": attrs or {},
+        }
+        index_offset = fh.tell()
+        fh.write(json.dumps(index, separators=(",", ":")).encode("utf-8"))
+        fh.seek(0)
+        fh.write(HEADER.pack(MAGIC, index_offset))
+    os.replace(tmp_path, path)
+    return index
+
+
+class ChunkedVolume:
+    """Read-only random access to a ``.cvol`` file: ``vol[z0:z1, y0:y1, x0:x1]`` decodes only the chunks it needs.
+
+    Thread-safe; decoded chunks are kept in an LRU cache of *cache_bytes* (0 disables it).
+    Picklable: only the path and cache size are sent, and the unpickled copy reopens the file,
+    so a volume can be handed to spawned worker processes (each starts with an empty cache).
+    """
+
+    def __init__(self, path: Path, cache_bytes: int = CACHE_BYTES):
+        self.path = Path(path)
+        self.cache_bytes = cache_bytes
+        self._fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        self._io_lock = threading.Lock()
+        try:
+            magic, index_offset = HEADER.unpack(self._pread(HEADER.size, 0))
+            if magic != MAGIC:
+                raise ValueError(f"Not a chunked volume: {self.path}")
+            size = os.fstat(self._fd).st_size
+            index = json.loads(self._pread(size - index_offset, index_offset))
+        except Exception:
+            os.close(self._fd)
+            raise
+        self.shape: Tuple[int, int, int] = tuple(index["shape"])
+        self.dtype = np.dtype(index["dtype"])
+        self.chunks: Tuple[int, int, int] = tuple(index["chunks"])
+        self.attrs: Dict = index.get("attrs", {})
+        self._offsets = index["offsets"]
+        self._sizes = index["sizes"]
+        self._grid = tuple(-(-n // c) for n, c in zip(self.shape, self.chunks))
+        self._cache: "OrderedDict[Tuple[int, int, int], np.ndarray]" = OrderedDict()
+        self._cache_chunks = cache_bytes // (int(np.prod(self.chunks)) * self.dtype.itemsize)
+        self._lock = threading.Lock()
+        self.chunks_read = 0
+
+    @property
+    def ndim(self) -> int:
+        return 3
+
+    def __getstate__(self) -> Dict:
+        return {"path": self.path, "cache_bytes": self.cache_bytes}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__init__(state["path"], state["cache_bytes"])
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "ChunkedVolume":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _pread(self, size: int, offset: int) -> bytes:
+        if hasattr(os, "pread"):
+            return os.pread(self._fd, size, offset)
+        with self._io_lock:  # Windows: no pread, serialize seek + read
+            os.lseek(self._fd, offset, os.SEEK_SET)
+            return os.read(self._fd, size)
+
+    def _chunk(self, key: Tuple[int, int, int]) -> np.ndarray:
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        i = (key[0] * self._grid[1] + key[1]) * self._grid[2] + key[2]
+        raw = zlib.decompress(self._pread(self._sizes[i], self._offsets[i]))
+        shape = tuple(min(c, n - k * c) for k, c, n in zip(key, self.chunks, self.shape))
+        block = _unshuffle(raw, self.dtype, shape)
+        with self._lock:
+            self.chunks_read += 1
+            if self._cache_chunks:
+                self._cache[key] = block
+                while len(self._cache) > self._cache_chunks:
+                    self._cache.popitem(last=False)
+        return block
+
+    def read(self, start: Sequence[int], size: Sequence[int], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Box of *size* voxels starting at *start* (z, y, x), clipped to the volume bounds."""
+        lo = [max(0, int(s)) for s in start]
+        hi = [min(n, int(s) + int(k)) for s, k, n in zip(start, size, self.shape)]
+        shape = tuple(max(0, h - l) for l, h in zip(lo, hi))
+        if out is None:
+            out = np.empty(shape, dtype=self.dtype)
+        if 0 in shape:
+            return out
+        first = [l // c for l, c in zip(lo, self.chunks)]
+        last = [(h - 1) // c for h, c in zip(hi, self.chunks)]
+        for cz in range(first[0], last[0] + 1):
+            for cy in range(first[1], last[1] + 1):
+                for cx in range(first[2], last[2] + 1):
+                    block = self._chunk((cz, cy, cx))
+                    origin = (cz * self.chunks[0], cy * self.chunks[1], cx * self.chunks[2])
+                    src, dst = [], []
+                    for o, l, h, n in zip(origin, lo, hi, block.shape):
+                        a, b = max(l, o), min(h, o + n)
+                        src.append(slice(a - o, b - o))
+                        dst.append(slice(a - l, b - l))
+                    out[tuple(dst)] = block[tuple(src)]
+        return out
+
+    def __getitem__(self, key) -> np.ndarray:
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (3 - len(key))
+        start, size = [], []
+        for k, n in zip(key, self.shape):
+            if not isinstance(k, slice) or k.step not in (None, 1):
+                raise IndexError("ChunkedVolume supports only contiguous slices")
+            a, b, _ = k.indices(n)
+            start.append(a)
+            size.append(max(0, b - a))
+        return self.read(start, size)
+
+    def to_numpy(self) -> np.ndarray:
+        return self.read((0, 0, 0), self.shape)
+
+
+class PatchDataset:
+    """Random fixed-size patches from a set of chunked volumes.
+
+    Map-style (``len`` / ``[i]``): item *i* is always the same patch for a given *seed*, so it
+    plugs into any data loader, including multiprocess ones with spawned workers (the default on
+    Windows): pickling sends only the volume paths and each worker reopens the files.
+    ``iter_batches`` decodes patches with *workers* reader threads.
+    """
+
+    def __init__(
+        self,
+        paths: Sequence[Path],
+        patch: Sequence[int] = (96, 96, 96),
+        samples: int = 1000,
+        seed: int = 0,
+        cache_bytes: int = CACHE_BYTES,
+    ):
+        self.volumes = [ChunkedVolume(p, cache_bytes=cache_bytes) for p in paths]
+        self.patch = tuple(int(p) for p in patch)
+        self.samples = samples
+        self.seed = seed
+
+    def __len__(self) -> int:
+        return self.samples
+
+    def locate(self, i: int) -> Tuple[int, Tuple[int, int, int]]:
+        """(volume index, patch start) of item *i*; patches near the border are zero-padded."""
+        rng = np.random.default_rng((self.seed, i))
+        v = int(rng.integers(len(self.volumes)))
+        shape = self.volumes[v].shape
+        start = tuple(int(rng.integers(max(1, n - p + 1))) for n, p in zip(shape, self.patch))
+        return v, start
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        if not 0 <= i < self.samples:
+            raise IndexError(i)
+        v, start = self.locate(i)
+        vol = self.volumes[v]
+        out = np.zeros(self.patch, dtype=vol.dtype)
+        box = vol.read(start, self.patch)
+        out[tuple(slice(0, n) for n in box.shape)] = box
+        return out
+
+    def iter_batches(self, batch_size: int = 2, workers: int = 4, indices: Optional[Sequence[int]] = None) -> Iterator[np.ndarray]:
+        """Yield stacked batches in order; patches are decoded by a thread pool a few batches ahead."""
+        indices = list(range(self.samples)) if indices is None else list(indices)
+        batches = [indices[i:i + batch_size] for i in range(0, len(indices), batch_size)]
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            pending = []
+            ahead = max(2, workers)
+            for batch in batches:
+                pending.append([pool.submit(self.__getitem__, i) for i in batch])
+                if len(pending) > ahead:
+                    yield np.stack([f.result() for f in pending.pop(0)])
+            for futures in pending:
+                yield np.stack([f.result() for f in futures])
+
+    def close(self) -> None:
+        for vol in self.volumes:
+            vol.close()
@@ -1,4 +1,4 @@
-"""Pre-process a DICOM series into a normalized NumPy volume.
+r"""Pre-process DICOM series into normalized NumPy volumes.
 
 Steps:
 1. Read DICOM series with SimpleITK.
@@ -11,20 +11,48 @@ Example:
     python preprocess_volume.py \
         --input C:\data\anon_dicom \
         --output C:\data\volumes\patient001.npy
+
+Batch mode reads a manifest (one series directory per line, optionally
+followed by a tab and the output path; ``#`` starts a comment) and runs the
+series in a process pool.  Default outputs keep each series path relative to
+the series' common parent (``p01/CT`` -> ``<output>/p01/CT.npy``), and a batch
+whose outputs would collide is refused before it starts:
+    python preprocess_volume.py --manifest series.txt --output C:\data\volumes --workers 4
+
+``--format cvol`` (or a ``.cvol`` output path) writes the chunked compressed
+store from ``chunked_volume.py`` instead, for random-access patch sampling.
+
+Each worker limits SimpleITK to ``--sitk-threads`` threads so the pool does
+not oversubscribe the CPU.  The volume is normalized chunk by chunk straight
+into a memory-mapped ``.npy`` (``np.lib.format.open_memmap``): no full-size
+int16 or float32 temporary is allocated.  Series whose output is newer than
+every file of the input directory are skipped (``--force`` re-runs them).
 """
 
 from __future__ import annotations
 
 import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import SimpleITK as sitk
 
+try:
+    from backend.dataset_tools.chunked_volume import write_chunked
+except ImportError:  # run as a script: python backend/dataset_tools/preprocess_volume.py
+    from chunked_volume import write_chunked
+
 HU_MIN = -100
 HU_MAX = 400
 TARGET_SPACING = (1.0, 1.0, 1.0)  # (z, y, x) mm
+# Slices normalized per step: bounds the float32 scratch to one chunk
+NORMALIZE_CHUNK_SLICES = 16
 
 def read_sitk_image(dcm_dir: Path) -> sitk.Image:
     reader = sitk.ImageSeriesReader()
@@ -61,9 +89,18 @@ def sitk_to_numpy(img: sitk.Image) -> np.ndarray:
 
 
 def normalize_hu(arr: np.ndarray) -> np.ndarray:
-    arr = np.clip(arr, HU_MIN, HU_MAX)
-    arr = (arr - HU_MIN) / (HU_MAX - HU_MIN)
-    return arr.astype(np.float32)
+    return normalize_hu_into(arr, np.empty(arr.shape, dtype=np.float32))
+
+
+def normalize_hu_into(arr: np.ndarray, out: np.ndarray, chunk_slices: int = NORMALIZE_CHUNK_SLICES) -> np.ndarray:
+    """Clip and scale *arr* into the float32 array *out* (may be a memmap), one chunk of slices at a time."""
+    for z0 in range(0, arr.shape[0], chunk_slices):
+        dst = out[z0:z0 + chunk_slices]
+        np.copyto(dst, arr[z0:z0 + chunk_slices], casting="unsafe")
+        np.clip(dst, HU_MIN, HU_MAX, out=dst)
+        dst -= HU_MIN
+        dst /= HU_MAX - HU_MIN
+    return out
 
 
 def preprocess_series(input_dir: Path) -> np.ndarray:
@@ -74,6 +111,151 @@ def preprocess_series(input_dir: Path) -> np.ndarray:
     return arr
 
 
+def preprocess_to_file(input_dir: Path, output_path: Path) -> Dict:
+    """Preprocess one series straight into a memory-mapped .npy or a chunked .cvol; returns per-stage timings."""
+    t0 = time.perf_counter()
+    img = read_sitk_image(input_dir)
+    t1 = time.perf_counter()
+    img = resample_isotropic(img, TARGET_SPACING)
+    t2 = time.perf_counter()
+    src = sitk.GetArrayViewFromImage(img)  # no copy; valid while img is alive
+    if output_path.suffix.lower() == ".cvol":
+        write_chunked(
+            src, output_path,
+            transform=lambda slab: normalize_hu_into(slab, np.empty(slab.shape, dtype=np.float32)),
+            attrs={"spacing": list(TARGET_SPACING), "hu_range": [HU_MIN, HU_MAX]},
+        )
+    else:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        # Written under a temporary name: an interrupted run must not look up to date
+        tmp_path = output_path.with_name(output_path.name + ".part")
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=src.shape)
+        normalize_hu_into(src, out)
+        out.flush()
+        del out
+        os.replace(tmp_path, output_path)
+    t3 = time.perf_counter()
+    return {
+        "shape": list(src.shape),
+        "read_s": round(t1 - t0, 3),
+        "resample_s": round(t2 - t1, 3),
+        "normalize_s": round(t3 - t2, 3),
+    }
+
+
+def is_up_to_date(input_dir: Path, output_path: Path) -> bool:
+    """True if *output_path* exists and is newer than every file in *input_dir*."""
+    try:
+        out_mtime = output_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return False
+    with os.scandir(input_dir) as entries:
+        newest = max((e.stat().st_mtime_ns for e in entries if e.is_file()), default=0)
+    return out_mtime > newest
+
+
+def read_manifest(manifest: Path, output_dir: Path, suffix: str = ".npy") -> List[Tuple[Path, Path]]:
+    """
+    Parse ``<series_dir>[<TAB><output>]`` lines.  The default output keeps the series path relative
+    to the common parent of those series, so ``p01/CT`` and ``p02/CT`` become ``output_dir/p01/CT<suffix>``
+    and ``output_dir/p02/CT<suffix>`` (a single series: ``output_dir/<series><suffix>``).
+    """
+    entries = []
+    for line in manifest.read_text(encoding="utf-8").splitlines():
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        src, _, dst = (part.strip() for part in line.partition("\t"))
+        entries.append((Path(src), Path(dst) if dst else None))
+    defaults = [os.path.abspath(src) for src, dst in entries if dst is None]
+    root = os.path.commonpath([os.path.dirname(src) for src in defaults]) if defaults else None
+    jobs = []
+    for input_dir, dst in entries:
+        if dst is None:
+            dst = output_dir / f"{os.path.relpath(os.path.abspath(input_dir), root)}{suffix}"
+        jobs.append((input_dir, dst))
+    return jobs
+
+
+def _init_worker(sitk_threads: int) -> None:
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(sitk_threads)
+
+
+def _series_input_bytes(input_dir: Path) -> int:
+    with os.scandir(input_dir) as entries:
+        return sum(e.stat().st_size for e in entries if e.is_file())
+
+
+def _preprocess_task(task: Tuple[str, str, bool]) -> Dict:
+    src, dst, force = task
+    entry: Dict = {"input": src, "output": dst}
+    try:
+        if not force and is_up_to_date(Path(src), Path(dst)):
+            entry["status"] = "skipped"
+            return entry
+        start = time.perf_counter()
+        entry.update(preprocess_to_file(Path(src), Path(dst)))
+        elapsed = time.perf_counter() - start
+        in_mb = _series_input_bytes(Path(src)) / 1024 ** 2
+        entry.update(
+            status="done",
+            seconds=round(elapsed, 3),
+            input_mb=round(in_mb, 1),
+            output_mb=round(os.path.getsize(dst) / 1024 ** 2, 1),
+            mb_per_s=round(in_mb / max(elapsed, 1e-9), 1),
+        )
+    except Exception as exc:  # noqa: BLE001
+        entry.update(status="failed", error=str(exc))
+    return entry
+
+
+def preprocess_batch(
+    jobs: List[Tuple[Path, Path]],
+    workers: Optional[int] = None,
+    sitk_threads: Optional[int] = None,
+    force: bool = False,
+    progress: bool = True,
+) -> Dict:
+    """
+    Preprocess (input_dir, output.npy) pairs in a process pool; returns a per-series timing report.
+    Raises ValueError before any work if two series map to the same output file.
+    """
+    sources: Dict[str, Path] = {}
+    for src, dst in jobs:
+        key = os.path.normcase(os.path.abspath(dst))
+        if key in sources:
+            raise ValueError(f"{src} and {sources[key]} would both be written to {dst}")
+        sources[key] = src
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs) or 1))
+    sitk_threads = sitk_threads or max(1, (os.cpu_count() or 1) // workers)
+    tasks = [(str(src), str(dst), force) for src, dst in jobs]
+    start = time.perf_counter()
+    series = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(sitk_threads,)) as pool:
+        for entry in pool.map(_preprocess_task, tasks):
+            series.append(entry)
+            if entry["status"] == "failed":
+                print(f"[WARN] {entry['input']}: {entry['error']}", file=sys.stderr)
+            elif progress:
+                detail = f"{entry['seconds']} s, {entry['mb_per_s']} MB/s" if entry["status"] == "done" else "up to date"
+                print(f"[{len(series)}/{len(tasks)}] {entry['input']}: {entry['status']} ({detail})")
+
+    elapsed = time.perf_counter() - start
+    done = [e for e in series if e["status"] == "done"]
+    input_mb = sum(e["input_mb"] for e in done)
+    return {
+        "series": series,
+        "done": len(done),
+        "skipped": sum(e["status"] == "skipped" for e in series),
+        "failed": sum(e["status"] == "failed" for e in series),
+        "seconds": round(elapsed, 3),
+        "input_mb": round(input_mb, 1),
+        "mb_per_s": round(input_mb / max(elapsed, 1e-9), 1),
+        "workers": workers,
+        "sitk_threads": sitk_threads,
+    }
+
+
 def save_volume(arr: np.ndarray, output_path: Path) -> None:
     output_path.parent.mkdir(parents=True, exist_ok=True)
     if output_path.suffix.lower() == ".npy":
@@ -86,15 +268,37 @@ def save_volume(arr: np.ndarray, output_path: Path) -> None:
 
 def parse_args():
     p = argparse.ArgumentParser(description="Pre-process DICOM series → NumPy volume")
-    p.add_argument("--input", "-i", type=Path, required=True, help="Folder with anonymized DICOM series")
-    p.add_argument("--output", "-o", type=Path, required=True, help="Output .npy or .nii.gz file")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--input", "-i", type=Path, help="Folder with anonymized DICOM series")
+    src.add_argument("--manifest", "-m", type=Path, help="Text file with one series folder per line (batch mode)")
+    p.add_argument("--output", "-o", type=Path, required=True,
+                   help="Output .npy, .cvol or .nii.gz file (batch mode: output directory)")
+    p.add_argument("--format", choices=["npy", "cvol"], default="npy",
+                   help="Batch output format: memory-mapped .npy or chunked compressed .cvol")
+    p.add_argument("--workers", "-w", type=int, default=None, help="Batch worker processes (default: CPU count)")
+    p.add_argument("--sitk-threads", type=int, default=None,
+                   help="SimpleITK threads per worker (default: CPU count / workers)")
+    p.add_argument("--force", action="store_true", help="Re-process series whose output is up to date")
+    p.add_argument("--report", type=Path, default=None, help="Write the batch timing report as JSON")
     return p.parse_args()
 
 
 def main() -> None:
     args = parse_args()
-    volume = preprocess_series(args.input)
-    save_volume(volume, args.output)
+    if args.manifest:
+        report = preprocess_batch(read_manifest(args.manifest, args.output, f".{args.format}"), workers=args.workers,
+                                  sitk_threads=args.sitk_threads, force=args.force)
+        if args.report:
+            args.report.write_text(json.dumps(report, indent=2))
+        print(
+            f"Processed {report['done']} series, skipped {report['skipped']}, failed {report['failed']} "
+            f"in {report['seconds']} s ({report['mb_per_s']} MB/s)"
+        )
+        return
+    if args.output.suffix.lower() in (".npy", ".cvol"):
+        preprocess_to_file(args.input, args.output)
+    else:
+        save_volume(preprocess_series(args.input), args.output)
     print("Saved pre-processed volume →", args.output)
 
 
@@ -1,46 +1,263 @@
-"""Simplify a mesh (STL/OBJ/GLB/GLTF) using trimesh + pyglet.
+"""Simplify meshes (STL/OBJ/PLY/GLB/GLTF) with quadric decimation (trimesh + fast_simplification).
 
 Usage:
     python simplify_mesh.py -i kidney.glb -o kidney_simpl.glb --ratio 0.3
 
+Batch mode (a directory or a glob pattern as input, an output directory):
+    python simplify_mesh.py -i "library/**/*.glb" -o library_ar --faces 50000 --workers 4
+    python simplify_mesh.py -i library -o library_ar --size 2MB
+
+``--faces`` and ``--size`` set a budget instead of a fixed ratio: the
+decimation ratio is searched (proportional first guess, then bisection) until
+the result is as large as possible without exceeding the budget.  File size is
+measured on the mesh exported in the output format.  Each file is handled by a
+separate worker process; ``manifest.json`` in the output directory records
+faces and bytes before/after, the ratio used and the Hausdorff error (sampled
+on both surfaces, absolute and relative to the bounding-box diagonal).
+
 Requires:
-    pip install trimesh[all]
+    pip install trimesh fast-simplification scipy
 """
 
 from __future__ import annotations
 
 import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 
+import numpy as np
 import trimesh
+from scipy.spatial import cKDTree
 
 SUPPORTED_EXT = {".stl", ".obj", ".ply", ".glb", ".gltf"}
+SEARCH_ITERATIONS = 12
+SEARCH_TOLERANCE = 0.02  # stop once the result is within 2% under the budget
+HAUSDORFF_SAMPLES = 20000
+
 
 def simplify(mesh: trimesh.Trimesh, ratio: float) -> trimesh.Trimesh:
     target = int(mesh.faces.shape[0] * ratio)
     try:
-        simplified = mesh.simplify_quadratic_decimation(target)
+        simplified = mesh.simplify_quadric_decimation(face_count=max(target, 4))
     except Exception as exc:  # noqa: BLE001
         raise RuntimeError(f"Decimation failed: {exc}") from exc
     return simplified
 
 
+def export_bytes(mesh: trimesh.Trimesh, file_type: str) -> int:
+    """Size of *mesh* exported as *file_type* ('glb', 'stl', ...), without touching the disk."""
+    data = mesh.export(file_type=file_type)
+    if isinstance(data, dict):  # .gltf: JSON plus external buffers
+        return sum(len(v) for v in data.values())
+    return len(data.encode() if isinstance(data, str) else data)
+
+
+def search_ratio(
+    mesh: trimesh.Trimesh,
+    measure: Callable[[trimesh.Trimesh], int],
+    budget: int,
+    iterations: int = SEARCH_ITERATIONS,
+    tolerance: float = SEARCH_TOLERANCE,
+) -> Tuple[trimesh.Trimesh, float]:
+    """Largest decimation of *mesh* with ``measure(result) <= budget``; returns (mesh, ratio)."""
+    full = measure(mesh)
+    if full <= budget:
+        return mesh, 1.0
+    lo, hi = 0.0, 1.0
+    best: Optional[Tuple[trimesh.Trimesh, float]] = None
+    ratio = budget / full  # size and face count are roughly proportional
+    for _ in range(iterations):
+        candidate = simplify(mesh, ratio)
+        value = measure(candidate)
+        if value <= budget:
+            if best is None or ratio > best[1]:
+                best = (candidate, ratio)
+            if value >= budget * (1 - tolerance):
+                break
+            lo = ratio
+        else:
+            hi = ratio
+        # Proportional step inside the bracket, bisection if it falls outside
+        guess = ratio * budget / max(value, 1)
+        ratio = guess if lo < guess < hi else (lo + hi) / 2
+    if best is None:
+        raise RuntimeError(f"Cannot reach budget {budget} (smallest result: {value})")
+    return best
+
+
+def hausdorff_error(a: trimesh.Trimesh, b: trimesh.Trimesh, samples: int = HAUSDORFF_SAMPLES) -> Dict[str, float]:
+    """Symmetric Hausdorff and mean surface distance, estimated on points sampled from both surfaces."""
+    pa = np.vstack([a.vertices, trimesh.sample.sample_surface(a, samples, seed=0)[0]])
+    pb = np.vstack([b.vertices, trimesh.sample.sample_surface(b, samples, seed=0)[0]])
+    d_ab, _ = cKDTree(pb).query(pa)
+    d_ba, _ = cKDTree(pa).query(pb)
+    hausdorff = float(max(d_ab.max(), d_ba.max()))
+    diagonal = float(np.linalg.norm(a.extents)) or 1.0
+    return {
+        "hausdorff": hausdorff,
+        "hausdorff_rel": hausdorff / diagonal,
+        "mean_error": float((d_ab.mean() + d_ba.mean()) / 2),
+    }
+
+
+def collect_inputs(pattern: str) -> List[Path]:
+    """Mesh files of a directory (recursively) or of a glob pattern."""
+    path = Path(pattern)
+    if path.is_dir():
+        files = [p for p in path.rglob("*") if p.is_file()]
+    elif path.is_file():
+        files = [path]
+    else:
+        files = [Path(p) for p in glob.glob(pattern, recursive=True)]
+    return sorted(p for p in files if p.suffix.lower() in SUPPORTED_EXT)
+
+
+def simplify_file(
+    src: Path,
+    dst: Path,
+    ratio: Optional[float] = None,
+    faces: Optional[int] = None,
+    size: Optional[int] = None,
+) -> Dict:
+    """Simplify one file to a ratio, a face budget or a file-size budget; returns its manifest entry."""
+    start = time.perf_counter()
+    mesh = trimesh.load(src, force="mesh")
+    file_type = dst.suffix.lower().lstrip(".")
+    if faces is not None:
+        simplified, used = search_ratio(mesh, lambda m: len(m.faces), faces)
+    elif size is not None:
+        simplified, used = search_ratio(mesh, lambda m: export_bytes(m, file_type), size)
+    else:
+        used = ratio if ratio is not None else 0.3
+        simplified = simplify(mesh, used)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    simplified.export(dst)
+    entry = {
+        "input": str(src),
+        "output": str(dst),
+        "faces_before": int(len(mesh.faces)),
+        "faces_after": int(len(simplified.faces)),
+        "bytes_before": src.stat().st_size,
+        "bytes_after": dst.stat().st_size,
+        "ratio": round(float(used), 4),
+    }
+    entry.update(hausdorff_error(mesh, simplified))
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+    return entry
+
+
+def _simplify_task(task: Tuple[str, str, Optional[float], Optional[int], Optional[int]]) -> Dict:
+    src, dst, ratio, faces, size = task
+    try:
+        entry = simplify_file(Path(src), Path(dst), ratio, faces, size)
+        entry["status"] = "done"
+    except Exception as exc:  # noqa: BLE001
+        entry = {"input": src, "output": dst, "status": "failed", "error": str(exc)}
+    return entry
+
+
+def simplify_batch(
+    inputs: List[Path],
+    output_dir: Path,
+    ratio: Optional[float] = None,
+    faces: Optional[int] = None,
+    size: Optional[int] = None,
+    out_format: Optional[str] = None,
+    workers: Optional[int] = None,
+    root: Optional[Path] = None,
+    progress: bool = True,
+) -> Dict:
+    """
+    Simplify *inputs* into *output_dir* in a process pool, keeping paths relative to *root*
+    (default: the common parent of the inputs, so same-named files from a glob do not collide).
+    Raises ValueError before any work if two inputs map to the same output file.
+    """
+    if root is None and inputs:
+        root = Path(os.path.commonpath([str(src.parent) for src in inputs]))
+    tasks, sources = [], {}
+    for src in inputs:
+        dst = output_dir / src.relative_to(root)
+        if out_format:
+            dst = dst.with_suffix("." + out_format.lstrip("."))
+        if dst in sources:
+            raise ValueError(f"{src} and {sources[dst]} would both be written to {dst}")
+        sources[dst] = src
+        tasks.append((str(src), str(dst), ratio, faces, size))
+
+    start = time.perf_counter()
+    files = []
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks) or 1))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for entry in pool.map(_simplify_task, tasks):
+            files.append(entry)
+            if entry["status"] == "failed":
+                print(f"[WARN] {entry['input']}: {entry['error']}", file=sys.stderr)
+            elif progress:
+                print(f"[{len(files)}/{len(tasks)}] {entry['input']}: {entry['faces_before']} → "
+                      f"{entry['faces_after']} faces, Hausdorff {entry['hausdorff']:.4g}")
+
+    return {
+        "budget": {"ratio": ratio, "faces": faces, "size": size},
+        "files": files,
+        "done": sum(e["status"] == "done" for e in files),
+        "failed": sum(e["status"] == "failed" for e in files),
+        "seconds": round(time.perf_counter() - start, 3),
+        "workers": workers,
+    }
+
+
+def parse_size(value: str) -> int:
+    """'2MB' / '500k' / '1048576' -> bytes."""
+    value = value.strip().upper().rstrip("B")
+    for suffix, factor in (("K", 1024), ("M", 1024 ** 2), ("G", 1024 ** 3)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(value)
+
+
 def parse_args():
-    p = argparse.ArgumentParser(description="Simplify mesh with quadratic decimation")
-    p.add_argument("-i", "--input", required=True, type=Path, help="Input mesh file")
-    p.add_argument("-o", "--output", required=True, type=Path, help="Output mesh file")
-    p.add_argument("-r", "--ratio", type=float, default=0.3, help="Fraction of faces to keep (0-1)")
+    p = argparse.ArgumentParser(description="Simplify mesh with quadric decimation")
+    p.add_argument("-i", "--input", required=True, help="Input mesh file, directory or glob pattern")
+    p.add_argument("-o", "--output", required=True, type=Path, help="Output mesh file (batch mode: directory)")
+    budget = p.add_mutually_exclusive_group()
+    budget.add_argument("-r", "--ratio", type=float, default=None, help="Fraction of faces to keep (0-1, default 0.3)")
+    budget.add_argument("-f", "--faces", type=int, default=None, help="Target face count (upper bound)")
+    budget.add_argument("-s", "--size", type=parse_size, default=None, help="Target file size, e.g. 2MB (upper bound)")
+    p.add_argument("--format", default=None, help="Batch output format (glb, stl, ...; default: input format)")
+    p.add_argument("-w", "--workers", type=int, default=None, help="Batch worker processes (default: CPU count)")
+    p.add_argument("--manifest", type=Path, default=None, help="Batch manifest path (default: <output>/manifest.json)")
     return p.parse_args()
 
 
 def main() -> None:
     args = parse_args()
-    if args.input.suffix.lower() not in SUPPORTED_EXT:
-        raise ValueError("Unsupported extension")
-    mesh = trimesh.load(args.input, force='mesh')
-    simplified = simplify(mesh, args.ratio)
-    simplified.export(args.output)
-    print(f"Saved simplified mesh → {args.output} (faces: {simplified.faces.shape[0]})")
+    single = Path(args.input)
+    if single.is_file() and args.output.suffix:
+        if single.suffix.lower() not in SUPPORTED_EXT:
+            raise ValueError("Unsupported extension")
+        entry = simplify_file(single, args.output, args.ratio, args.faces, args.size)
+        print(f"Saved simplified mesh → {args.output} (faces: {entry['faces_after']}, "
+              f"Hausdorff: {entry['hausdorff']:.4g})")
+        return
+
+    out_dir = args.output.resolve()
+    # The output directory may sit inside the input tree: do not re-simplify earlier results
+    inputs = [p for p in collect_inputs(args.input) if out_dir not in p.resolve().parents]
+    if not inputs:
+        raise SystemExit(f"No mesh files match {args.input}")
+    root = single if single.is_dir() else None
+    report = simplify_batch(inputs, args.output, args.ratio, args.faces, args.size,
+                            out_format=args.format, workers=args.workers, root=root)
+    manifest = args.manifest or args.output / "manifest.json"
+    manifest.parent.mkdir(parents=True, exist_ok=True)
+    manifest.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Simplified {report['done']}/{len(inputs)} meshes in {report['seconds']} s → {manifest}")
 
 
 if __name__ == "__main__":
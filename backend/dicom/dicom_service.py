@@ -2,7 +2,8 @@
 ====================
 Общий сервис для работы с DICOM-данными. Содержит утилиты
 для:
-    • сохранения загруженных файлов во временную директорию;
+    • сохранения загруженных файлов во временную директорию
+      (с обезличиванием на лету);
     • поиска файлов одной серии (даже если в ZIP смешаны разные);
     • базовой валидации снимков;
     • конвертации серии в numpy-volume + метаданные.
@@ -17,14 +18,17 @@ import os
 import shutil
 import uuid
 from pathlib import Path
-from typing import List, Tuple
+from typing import BinaryIO, List, Optional, Tuple, Union
 
 import numpy as np
 import pydicom
 import SimpleITK as sitk
 from pydicom.errors import InvalidDicomError
 
-from backend.dicom.parser import find_dicom_series, extended_validate_dicom_file
+from backend.dicom.inline_anonymizer import INGEST_ANONYMIZE, write_anonymized
+from backend.dicom.parallel_reader import DICOM_READER, read_series_parallel
+from backend.dicom.parser import find_dicom_series, extended_validate_dicom_file, log_import_error
+from backend.monitoring.metrics import stage
 
 __all__ = [
     "save_uploaded_files",
@@ -41,16 +45,34 @@ TMP_ROOT.mkdir(parents=True, exist_ok=True)
 # File helpers
 # ---------------------------------------------------------------------------
 
-def save_uploaded_files(files: List[Tuple[str, bytes]]) -> Path:
-    """Сохраняет перечень (filename, raw_bytes) в уникальную папку.
+@stage("ingest")
+def save_uploaded_files(files: List[Tuple[str, Union[bytes, BinaryIO]]], anonymize: Optional[bool] = None) -> Path:
+    """Сохраняет перечень (filename, raw_bytes или поток) в уникальную папку.
+
+    *anonymize* (по умолчанию ``INGEST_ANONYMIZE``): файлы обезличиваются на
+    лету — переписывается только заголовок, пиксели копируются как есть.
+    Файлы, которые не разбираются как DICOM, при этом не сохраняются
+    (ошибка пишется в журнал импорта).
 
     Возвращает путь к созданной директории.
     """
+    if anonymize is None:
+        anonymize = INGEST_ANONYMIZE
     target_dir = TMP_ROOT / f"upload_{uuid.uuid4().hex[:8]}"
     target_dir.mkdir(parents=True, exist_ok=True)
     for fname, raw in files:
-        with open(target_dir / fname, "wb") as fp:
-            fp.write(raw)
+        path = target_dir / Path(fname).name
+        if anonymize:
+            try:
+                write_anonymized(raw, path)
+            except Exception as exc:  # noqa: BLE001
+                log_import_error(fname, f"anonymization failed: {exc}")
+            continue
+        with open(path, "wb") as fp:
+            if isinstance(raw, (bytes, bytearray)):
+                fp.write(raw)
+            else:
+                shutil.copyfileobj(raw, fp, 1024 * 1024)
     return target_dir
 
 
@@ -58,6 +80,7 @@ def save_uploaded_files(files: List[Tuple[str, bytes]]) -> Path:
 # Series utilities
 # ---------------------------------------------------------------------------
 
+@stage("header_scan")
 def collect_series(folder: os.PathLike) -> List[Path]:
     """Ищет все DICOM-файлы (рекурсивно) в *folder*.
 
@@ -92,11 +115,16 @@ def collect_series(folder: os.PathLike) -> List[Path]:
 # ITK helpers
 # ---------------------------------------------------------------------------
 
-def series_to_numpy(series_files: List[Path]) -> Tuple[np.ndarray, Tuple[float, float, float]]:
+@stage("dicom_load")
+def series_to_numpy(series_files: List[Path], reader_kind: Optional[str] = None) -> Tuple[np.ndarray, Tuple[float, float, float]]:
     """Читает список файлов одной серии в 3-D numpy массив.
 
+    *reader_kind* — ``"sitk"`` или ``"parallel"`` (по умолчанию ``DICOM_READER``).
     Возвращает (volume[z,y,x], spacing(x,y,z)).
     """
+    if (reader_kind or DICOM_READER) == "parallel":
+        volume, spacing, _, _ = read_series_parallel(series_files)
+        return volume, spacing
     reader = sitk.ImageSeriesReader()
     reader.SetFileNames([str(fp) for fp in series_files])
     img = reader.Execute()
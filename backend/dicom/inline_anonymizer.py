@@ -0,0 +1,350 @@
+"""inline_anonymizer.py
+====================
+Обезличивание DICOM прямо на входе в пайплайн (/upload_dicom/, PACS).
+
+Файл не копируется целиком и пиксели не декодируются. Начало файла читается
+одним блоком и разбирается в памяти на «сырые» элементы до тега PixelData;
+переписываются только элементы, которые меняет обезличивание по правилам
+офлайн-скрипта ``dataset_tools/anonymize_dicom.py``: удаляются PHI-теги,
+PatientName заменяется, UID экземпляров детерминированно перегенерируются.
+Остальные элементы копируются исходными байтами, а остаток входного потока —
+PixelData и всё, что после него, — дописывается как есть блоками. Кодировка
+(implicit/explicit VR, порядок байт) сохраняется, поэтому пиксели остаются
+валидными.
+
+Файлы без заголовка Part 10 (преамбула + ``DICM``), с Deflated или частным
+синтаксисом передачи идут медленным путём — целиком через pydicom.
+
+Включено по умолчанию (INGEST_ANONYMIZE=0 — отключить). Соль для UID —
+ANON_UID_SALT (иначе случайная на процесс).
+"""
+
+from __future__ import annotations
+
+import bisect
+import functools
+import io
+import os
+import shutil
+import struct
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+import pydicom
+from pydicom.charset import convert_encodings
+from pydicom.datadict import dictionary_VR, tag_for_keyword
+from pydicom.dataelem import DataElement, RawDataElement
+from pydicom.dataset import Dataset
+from pydicom.errors import InvalidDicomError
+from pydicom.filebase import DicomBytesIO
+from pydicom.filewriter import write_data_element
+from pydicom.tag import BaseTag
+from pydicom.uid import UID, DeflatedExplicitVRLittleEndian
+from pydicom.valuerep import EXPLICIT_VR_LENGTH_32, VR
+
+from backend.dataset_tools.anonymize_dicom import (
+    KEEP_UID_KEYWORDS,
+    PHI_TAGS,
+    anonymize_dataset,
+    remap_uid,
+    remap_uids,
+)
+
+__all__ = [
+    "INGEST_ANONYMIZE",
+    "anonymize_stream",
+    "write_anonymized",
+]
+
+
+INGEST_ANONYMIZE = os.environ.get("INGEST_ANONYMIZE", "1") == "1"
+COPY_CHUNK = 1024 * 1024
+HEADER_PROBE = 64 * 1024
+UNDEFINED_LENGTH = 0xFFFFFFFF
+
+_PHI = {tag_for_keyword(k) for k in PHI_TAGS}
+_KEEP_UIDS = {tag_for_keyword(k) for k in KEEP_UID_KEYWORDS}
+_ANONYMIZED = b"ANONYMIZED"
+_PATIENT_NAME = tag_for_keyword("PatientName")
+_SOP_INSTANCE_UID = tag_for_keyword("SOPInstanceUID")
+_SPECIFIC_CHARSET = tag_for_keyword("SpecificCharacterSet")
+_TRANSFER_SYNTAX = tag_for_keyword("TransferSyntaxUID")
+_PIXEL_DATA = tag_for_keyword("PixelData")
+_ITEM, _ITEM_DELIMITER, _SEQUENCE_DELIMITER = 0xFFFEE000, 0xFFFEE00D, 0xFFFEE0DD
+_META_END = 0x00030000  # первый тег после группы 0002
+_VRS = {vr.value.encode("ascii"): vr.value for vr in VR}
+_LONG_VRS = {str(vr.value) for vr in EXPLICIT_VR_LENGTH_32}
+# тег + длина (implicit VR, а также элементы последовательностей) и тег + VR + 16-битная длина (explicit VR)
+_IMPLICIT_LE, _IMPLICIT_BE = struct.Struct("<HHL"), struct.Struct(">HHL")
+_EXPLICIT_LE, _EXPLICIT_BE = struct.Struct("<HH2sH"), struct.Struct(">HH2sH")
+_LONG_LE, _LONG_BE = struct.Struct("<L"), struct.Struct(">L")
+
+
+class _SlowPath(Exception):
+    """Заголовок нельзя переписать поэлементно — нужен полный разбор pydicom."""
+
+
+class _Truncated(Exception):
+    """Заголовок не поместился в прочитанный блок."""
+
+
+def anonymize_stream(src: BinaryIO, dst: BinaryIO, salt: Optional[str] = None) -> int:
+    """
+    Обезличенный заголовок src -> dst, затем байты пикселей без изменений.
+    Возвращает размер нового заголовка в байтах. Ошибки разбора DICOM пробрасываются.
+    """
+    start = src.tell()
+    try:
+        header, rest = _rewrite_header(src, salt)
+    except _SlowPath:
+        src.seek(start)
+        return _anonymize_full(src, dst, salt)
+    dst.write(header)
+    dst.write(rest)
+    shutil.copyfileobj(src, dst, COPY_CHUNK)
+    return len(header)
+
+
+def _rewrite_header(src: BinaryIO, salt: Optional[str]) -> Tuple[bytes, memoryview]:
+    """
+    Новый заголовок (преамбула, file meta, набор данных до PixelData) и уже
+    прочитанные байты после него; src остаётся сразу за ними.
+
+    Заголовок читается одним блоком и разбирается в памяти: поэлементное
+    чтение через ``data_element_generator`` (десятки мелких read и объектов
+    pydicom на файл) было главной статьёй расходов обезличивания на срезах серии.
+    """
+    buf = src.read(HEADER_PROBE)
+    eof = len(buf) < HEADER_PROBE
+    while True:
+        try:
+            meta, elements, end, (implicit, little) = _scan_header(buf, eof)
+            break
+        except _Truncated:
+            # заголовок длиннее блока — дочитываем
+            more = src.read(len(buf))
+            eof = len(more) < len(buf)
+            buf += more
+    tags = [e[0] for e in elements]
+    if _SOP_INSTANCE_UID not in tags:
+        # без UID экземпляра это не DICOM-снимок (или заголовок повреждён)
+        raise InvalidDicomError("Not a DICOM instance (no SOPInstanceUID)")
+    if _PATIENT_NAME not in tags:
+        # как и anonymize_dataset: PatientName есть всегда — часть ПО без него не работает
+        elements.insert(bisect.bisect(tags, _PATIENT_NAME), (_PATIENT_NAME, "PN", b"", 0, 0))
+
+    body = _encode(meta, buf, False, True, salt, None)
+    header = b"".join((
+        buf[:132],
+        # (0002,0000) FileMetaInformationGroupLength пересчитывается: длина UID в meta могла измениться
+        struct.pack("<HH2sHL", 0x0002, 0x0000, b"UL", 4, len(body)),
+        body,
+        _encode(elements, buf, implicit, little, salt, _charset(elements)),
+    ))
+    return header, memoryview(buf)[end:]
+
+
+def _scan_header(buf: bytes, eof: bool):
+    """(meta, элементы набора данных до PixelData, смещение PixelData, кодировка) из буфера."""
+    if len(buf) < 132 and not eof:
+        raise _Truncated()
+    if buf[128:132] != b"DICM":
+        raise _SlowPath()
+    meta, pos = _scan(buf, 132, False, True, eof, _META_END)
+    implicit, little = _syntax_encoding(_value(meta, _TRANSFER_SYNTAX))
+    elements, pos = _scan(buf, pos, implicit, little, eof, _PIXEL_DATA)
+    return meta, elements, pos, (implicit, little)
+
+
+@functools.lru_cache(maxsize=64)
+def _syntax_encoding(syntax: Optional[bytes]) -> Tuple[bool, bool]:
+    """(implicit VR, little endian) для синтаксиса передачи; остальное — медленным путём."""
+    if not syntax:
+        raise _SlowPath()
+    syntax = UID(syntax.decode("ascii", "replace").rstrip("\0 "))
+    if syntax == DeflatedExplicitVRLittleEndian or syntax.is_private or not syntax.is_transfer_syntax:
+        raise _SlowPath()
+    return syntax.is_implicit_VR, syntax.is_little_endian
+
+
+def _scan(buf: bytes, pos: int, implicit: bool, little: bool, eof: bool, stop: int):
+    """
+    Элементы ``buf[pos:]`` (PS3.5, 7.1) до первого тега >= stop (теги идут по
+    возрастанию) или до конца данных — кортежи (tag, VR, значение, начало,
+    конец элемента в buf) — и смещение, где разбор остановился.
+    Последовательности неопределённой длины проходятся по элементам; всё, что
+    не разобрать однозначно, уходит в медленный путь (pydicom).
+    """
+    if implicit:
+        head = _IMPLICIT_LE if little else _IMPLICIT_BE
+    else:
+        head = _EXPLICIT_LE if little else _EXPLICIT_BE
+    long_length = _LONG_LE if little else _LONG_BE
+    elements = []
+    size = len(buf)
+    while True:
+        if pos + 8 > size:
+            if eof and pos == size:
+                return elements, pos
+            raise (_SlowPath() if eof else _Truncated())
+        if implicit:
+            group, number, length = head.unpack_from(buf, pos)
+            vr = None
+        else:
+            group, number, vr_bytes, length = head.unpack_from(buf, pos)
+        tag = group << 16 | number
+        # до VR: разделители элементов последовательности (FFFE,E00D) идут без VR и в explicit
+        if tag >= stop:
+            return elements, pos
+        start = pos + 8
+        if not implicit:
+            vr = _VRS.get(vr_bytes)
+            if vr is None:
+                raise _SlowPath()
+            if vr in _LONG_VRS:
+                if pos + 12 > size:
+                    raise (_SlowPath() if eof else _Truncated())
+                (length,) = long_length.unpack_from(buf, pos + 8)
+                start = pos + 12
+        if length == UNDEFINED_LENGTH:
+            if (vr or _dictionary_vr(tag)) != "SQ":
+                raise _SlowPath()
+            end = _skip_items(buf, start, implicit, little, eof)
+            # значение — элементы без разделителя (FFFE,E0DD): pydicom читает его как SQ определённой длины
+            value = buf[start:end - 8]
+        else:
+            end = start + length
+            if end > size:
+                raise (_SlowPath() if eof else _Truncated())
+            value = buf[start:end]
+        elements.append((tag, vr, value, pos, end))
+        pos = end
+
+
+def _skip_items(buf: bytes, pos: int, implicit: bool, little: bool, eof: bool) -> int:
+    """Смещение сразу за разделителем последовательности неопределённой длины."""
+    item = _IMPLICIT_LE if little else _IMPLICIT_BE
+    while True:
+        if pos + 8 > len(buf):
+            raise (_SlowPath() if eof else _Truncated())
+        group, number, length = item.unpack_from(buf, pos)
+        tag = group << 16 | number
+        pos += 8
+        if tag == _SEQUENCE_DELIMITER:
+            return pos
+        if tag != _ITEM:
+            raise _SlowPath()
+        if length == UNDEFINED_LENGTH:
+            _, pos = _scan(buf, pos, implicit, little, eof, _ITEM_DELIMITER)
+            pos += 8
+        else:
+            pos += length
+
+
+def _encode(elements, buf: bytes, implicit: bool, little: bool, salt: Optional[str], charset) -> bytes:
+    """Кодирует элементы в исходной кодировке: нетронутые — исходными байтами.
+
+    Подряд идущие нетронутые элементы копируются из buf одним срезом, а
+    заменяемые значения (PatientName, UID) пишутся сразу байтами — без
+    DataElement и write_data_element, которые на каждом файле серии стоили
+    больше, чем весь остальной разбор заголовка.
+    """
+    parts = []
+    endian = "<" if little else ">"
+    run_start = run_end = 0  # текущий отрезок buf из нетронутых элементов
+    for tag, vr, value, start, end in elements:
+        vr = vr or _dictionary_vr(tag)
+        if tag & 0xFFFF == 0:
+            # Групповые длины (gggg,0000) после правок неверны; они устарели и необязательны
+            replacement = b""
+        elif tag == _PATIENT_NAME:
+            replacement = _raw_element_header(tag, "PN", len(_ANONYMIZED), implicit, endian) + _ANONYMIZED
+        elif tag in _PHI:
+            replacement = b""
+        elif vr == "UI" and value and tag not in _KEEP_UIDS:
+            value = _remapped_uids(value, salt)
+            replacement = _raw_element_header(tag, "UI", len(value), implicit, endian) + value
+        elif vr == "SQ" and (implicit or b"UI" in value):
+            # ссылки на другие объекты (ReferencedSOPInstanceUID) лежат внутри последовательностей;
+            # в explicit VR у каждого вложенного UID есть байты «UI», без них SQ копируется как есть
+            out = DicomBytesIO()
+            out.is_implicit_VR, out.is_little_endian = implicit, little
+            write_data_element(out, _remapped_sequence(tag, value, implicit, little, salt, charset), charset)
+            replacement = out.getvalue()
+        else:
+            if start != run_end:
+                parts.append(buf[run_start:run_end])
+                run_start = start
+            run_end = end
+            continue
+        parts.append(buf[run_start:run_end])
+        parts.append(replacement)
+        run_start = run_end = 0
+    parts.append(buf[run_start:run_end])
+    return b"".join(parts)
+
+
+def _remapped_uids(value: bytes, salt: Optional[str]) -> bytes:
+    """Значение UI (возможно, многозначное) с перегенерированными UID, дополненное до чётной длины."""
+    uids = [u.rstrip("\0 ") for u in value.decode("ascii").split("\\")]
+    encoded = "\\".join(remap_uid(u, salt) for u in uids).encode("ascii")
+    return encoded + b"\0" if len(encoded) % 2 else encoded
+
+
+def _remapped_sequence(tag: int, value: bytes, implicit: bool, little: bool, salt: Optional[str], charset) -> DataElement:
+    ds = Dataset()
+    ds.set_original_encoding(implicit, little, convert_encodings(charset or "ISO_IR 6"))
+    ds[tag] = RawDataElement(BaseTag(tag), "SQ", len(value), value, 0, implicit, little)
+    remap_uids(ds, salt)
+    return ds[tag]
+
+
+def _raw_element_header(tag: int, vr: Optional[str], length: int, implicit: bool, endian: str) -> bytes:
+    """Тег и длина элемента в кодировке файла (PS3.5, 7.1)."""
+    head = struct.pack(endian + "HH", tag >> 16, tag & 0xFFFF)
+    if implicit:
+        return head + struct.pack(endian + "L", length)
+    if vr in _LONG_VRS:
+        return head + vr.encode("ascii") + b"\0\0" + struct.pack(endian + "L", length)
+    return head + vr.encode("ascii") + struct.pack(endian + "H", length)
+
+
+@functools.lru_cache(maxsize=4096)
+def _dictionary_vr(tag) -> Optional[str]:
+    try:
+        return dictionary_VR(tag)
+    except KeyError:  # частные и неизвестные теги копируются как есть
+        return None
+
+
+def _value(elements, tag: int) -> Optional[bytes]:
+    return next((value for t, _, value, _, _ in elements if t == tag), None)
+
+
+def _charset(elements) -> Optional[List[str]]:
+    value = _value(elements, _SPECIFIC_CHARSET)
+    return [t.strip() for t in value.decode("ascii").split("\\")] if value else None
+
+
+def _anonymize_full(src: BinaryIO, dst: BinaryIO, salt: Optional[str]) -> int:
+    """Медленный путь: полный разбор и перезапись через pydicom."""
+    ds = pydicom.dcmread(src, force=True)
+    if "SOPInstanceUID" not in ds:
+        # force=True «разбирает» и произвольные байты — без UID экземпляра это не DICOM
+        raise InvalidDicomError("Not a DICOM instance (no SOPInstanceUID)")
+    anonymize_dataset(ds, salt)
+    start = dst.tell()
+    pydicom.dcmwrite(dst, ds)
+    return dst.tell() - start
+
+
+def write_anonymized(src: Union[bytes, BinaryIO], out_path, salt: Optional[str] = None) -> int:
+    """Пишет обезличенный файл в out_path из байтов или потока; при ошибке разбора файл не остаётся."""
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        src = io.BytesIO(src)
+    try:
+        with open(out_path, "wb") as dst:
+            return anonymize_stream(src, dst, salt)
+    except Exception:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        raise
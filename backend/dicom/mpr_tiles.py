@@ -0,0 +1,271 @@
+"""mpr_tiles.py
+====================
+Сервер срезов (MPR) и миниатюр серии для вьюера Unity.
+
+Серия открывается один раз (``TileServer.open``) через кэш объёмов —
+дальше срезы читаются из того же массива (в памяти или memory-mapped
+``.npy``), без повторного декодирования DICOM и даже без повторного
+сканирования папки. Открытые объёмы адресуются коротким ``volume_id``.
+
+Каждый тайл — аксиальный, корональный или сагиттальный срез:
+
+    • окно/уровень HU применяется таблицей (LUT) на весь диапазон dtype;
+    • корональный и сагиттальный срезы растягиваются по z с учётом spacing,
+      верх изображения — краниальный конец;
+    • опционально накладывается маска результата сегментации;
+    • кодирование PNG или WebP; готовые тайлы лежат в LRU с лимитом байт.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from backend.monitoring.metrics import register_cache
+
+__all__ = [
+    "window_lut",
+    "apply_window",
+    "TileServer",
+    "get_tile_server",
+    "AXES",
+]
+
+
+MPR_TILE_CACHE_BYTES = int(os.environ.get("MPR_TILE_CACHE_BYTES", 64 * 1024 ** 2))
+MPR_MAX_VOLUMES = int(os.environ.get("MPR_MAX_VOLUMES", 4))
+
+AXES = {"axial": 0, "coronal": 1, "sagittal": 2}
+FORMATS = {"png": ("PNG", "image/png"), "webp": ("WEBP", "image/webp")}
+OVERLAY_RGB = np.array([255, 64, 64], dtype=np.float32)
+OVERLAY_ALPHA = 0.4
+
+
+@lru_cache(maxsize=32)
+def window_lut(dtype_str: str, window: float, level: float) -> Tuple[np.ndarray, int]:
+    """LUT uint8 на весь диапазон целого dtype (int8/16, uint8/16) и смещение индекса (min dtype)."""
+    info = np.iinfo(np.dtype(dtype_str))
+    values = np.arange(info.min, info.max + 1, dtype=np.float32)
+    lut = _window_values(values, window, level)
+    lut.flags.writeable = False
+    return lut, int(info.min)
+
+
+def _window_values(values: np.ndarray, window: float, level: float) -> np.ndarray:
+    lo = level - window / 2.0
+    scaled = (values - lo) * (255.0 / max(window, 1e-6))
+    return np.clip(scaled, 0, 255).astype(np.uint8)
+
+
+def apply_window(arr: np.ndarray, window: float, level: float) -> np.ndarray:
+    """HU -> uint8 по окну/уровню; для 8/16-битных целых — через LUT."""
+    if np.issubdtype(arr.dtype, np.integer) and arr.dtype.itemsize <= 2:
+        lut, offset = window_lut(arr.dtype.str, float(window), float(level))
+        idx = arr.astype(np.intp)
+        idx -= offset
+        return np.take(lut, idx)
+    return _window_values(arr.astype(np.float32), window, level)
+
+
+def _encode(img: Image.Image, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "PNG":
+        img.save(buf, format="PNG", compress_level=1)
+    else:
+        img.save(buf, format="WEBP", quality=85, method=2)
+    return buf.getvalue()
+
+
+class _Volume:
+    __slots__ = ("folder", "array", "spacing")
+
+    def __init__(self, folder: str, array: np.ndarray, spacing):
+        self.folder = folder
+        self.array = array
+        self.spacing = tuple(float(s) for s in spacing)  # (x, y, z)
+
+
+class TileServer:
+    """Открытые объёмы (LRU) + LRU закодированных тайлов с лимитом по байтам."""
+
+    def __init__(self, cache_bytes: int = MPR_TILE_CACHE_BYTES, max_volumes: int = MPR_MAX_VOLUMES):
+        self.cache_bytes = cache_bytes
+        self.max_volumes = max_volumes
+        self._volumes: "OrderedDict[str, _Volume]" = OrderedDict()
+        self._folders: Dict[str, str] = {}
+        self._tiles: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._tiles_used = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ------------------------------------------------------------------
+    # Volumes
+    # ------------------------------------------------------------------
+
+    def open(self, dicom_folder) -> Dict:
+        """Открывает серию (через кэш объёмов) и возвращает volume_id и размеры по осям."""
+        from backend.segmentation.segmentation import load_dicom_series_cached
+
+        folder = os.path.abspath(str(dicom_folder))
+        _, array, spacing, _, _ = load_dicom_series_cached(folder)
+        volume_id = hashlib.sha256(f"{folder}|{array.shape}|{tuple(spacing)}".encode()).hexdigest()[:16]
+        with self._lock:
+            self._folders[volume_id] = folder
+            self._volumes[volume_id] = _Volume(folder, array, spacing)
+            self._volumes.move_to_end(volume_id)
+            while len(self._volumes) > self.max_volumes:
+                self._volumes.popitem(last=False)
+        nz, ny, nx = array.shape
+        return {
+            "volume_id": volume_id,
+            "shape": [nz, ny, nx],
+            "spacing": list(spacing),
+            "slices": {"axial": nz, "coronal": ny, "sagittal": nx},
+        }
+
+    def _volume(self, volume_id: str) -> _Volume:
+        with self._lock:
+            vol = self._volumes.get(volume_id)
+            if vol is not None:
+                self._volumes.move_to_end(volume_id)
+                return vol
+            folder = self._folders.get(volume_id)
+        if folder is None:
+            raise KeyError(volume_id)
+        self.open(folder)  # вытеснен из LRU — повторное открытие попадёт в кэш объёмов
+        with self._lock:
+            return self._volumes[volume_id]
+
+    # ------------------------------------------------------------------
+    # Tiles
+    # ------------------------------------------------------------------
+
+    def _cache_get(self, key) -> Optional[bytes]:
+        with self._lock:
+            data = self._tiles.get(key)
+            if data is not None:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return data
+
+    def _cache_put(self, key, data: bytes) -> None:
+        if len(data) > self.cache_bytes:
+            return
+        with self._lock:
+            if key in self._tiles:
+                return
+            self._tiles[key] = data
+            self._tiles_used += len(data)
+            while self._tiles_used > self.cache_bytes:
+                _, evicted = self._tiles.popitem(last=False)
+                self._tiles_used -= len(evicted)
+
+    @staticmethod
+    def _plane(array: np.ndarray, axis: int, index: int) -> np.ndarray:
+        if not 0 <= index < array.shape[axis]:
+            raise IndexError(f"Slice {index} out of range 0..{array.shape[axis] - 1}")
+        return np.take(array, index, axis=axis)
+
+    def render(
+        self,
+        volume_id: str,
+        axis: str,
+        index: int,
+        window: float = 400.0,
+        level: float = 40.0,
+        fmt: str = "png",
+        mask=None,
+        mask_key: Optional[str] = None,
+        size: Optional[int] = None,
+    ) -> Tuple[bytes, str]:
+        """
+        Тайл среза: (байты, media type). axis — axial | coronal | sagittal; mask — PackedMask
+        той же формы для наложения (mask_key различает маски в кэше); size — длинная сторона, px.
+        KeyError — неизвестный volume_id, IndexError — срез вне объёма, ValueError — параметры.
+        """
+        if axis not in AXES:
+            raise ValueError(f"axis must be one of {sorted(AXES)}")
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {sorted(FORMATS)}")
+        key = (volume_id, axis, int(index), float(window), float(level), fmt, mask_key, size)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached, FORMATS[fmt][1]
+
+        vol = self._volume(volume_id)
+        ax = AXES[axis]
+        gray = apply_window(self._plane(vol.array, ax, index), window, level)
+        if mask is not None:
+            if tuple(mask.shape) != vol.array.shape:
+                raise ValueError(f"Mask shape {tuple(mask.shape)} does not match volume {vol.array.shape}")
+            overlay = mask.plane(ax, index).astype(bool)
+            rgb = np.repeat(gray[..., None], 3, axis=2).astype(np.float32)
+            rgb[overlay] = rgb[overlay] * (1 - OVERLAY_ALPHA) + OVERLAY_RGB * OVERLAY_ALPHA
+            img = Image.fromarray(rgb.astype(np.uint8))
+        else:
+            img = Image.fromarray(gray)
+        if ax != 0:
+            # (z, ·): краниальный конец сверху, высота по z-spacing относительно пикселя плоскости
+            img = img.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+            sx, sy, sz = vol.spacing
+            in_plane = sx if ax == 1 else sy
+            height = max(1, int(round(img.height * sz / in_plane)))
+            if height != img.height:
+                img = img.resize((img.width, height), Image.Resampling.BILINEAR)
+        if size:
+            img.thumbnail((size, size), Image.Resampling.BILINEAR)
+        data = _encode(img, FORMATS[fmt][0])
+        self._cache_put(key, data)
+        return data, FORMATS[fmt][1]
+
+    def thumbnail(self, volume_id: str, size: int = 128, fmt: str = "webp",
+                  window: float = 400.0, level: float = 40.0) -> Tuple[bytes, str]:
+        """Миниатюра серии: центральный аксиальный срез, длинная сторона size px."""
+        vol = self._volume(volume_id)
+        return self.render(volume_id, "axial", vol.array.shape[0] // 2, window, level, fmt, size=size)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "tiles": len(self._tiles),
+                "tile_bytes": self._tiles_used,
+                "volumes": len(self._volumes),
+            }
+
+
+_default_server: Optional[TileServer] = None
+_default_lock = threading.Lock()
+
+
+def get_tile_server() -> TileServer:
+    """Общий экземпляр сервера тайлов (создаётся лениво)."""
+    global _default_server
+    with _default_lock:
+        if _default_server is None:
+            _default_server = TileServer()
+        return _default_server
+
+
+def _cache_counts() -> Optional[Tuple[int, int]]:
+    """(попадания, промахи) общего экземпляра для /metrics; None, пока он не создан."""
+    server = _default_server
+    if server is None:
+        return None
+    return server.hits, server.misses
+
+
+register_cache("mpr_tiles", _cache_counts)
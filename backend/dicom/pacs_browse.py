@@ -0,0 +1,222 @@
+"""pacs_browse.py
+====================
+Просмотр исследований и серий на сконфигурированном Orthanc-сервере
+для мастера загрузки (Unity ``PacsPullWizard``).
+
+Все ответы кэшируются в памяти с коротким TTL (``PACS_BROWSE_TTL``), так что
+листание списка и повторное открытие исследования не порождают новых
+запросов к PACS. Превью серий (описание + число срезов) запрашиваются
+пакетно: один ``/tools/find`` на все серии, которых ещё нет в кэше.
+
+Параметры подключения берутся из окружения: ``ORTHANC_URL``,
+``ORTHANC_USERNAME``, ``ORTHANC_PASSWORD``.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import requests
+
+from backend.monitoring.metrics import register_cache
+
+__all__ = [
+    "BROWSE_MAX_PAGE",
+    "BROWSE_MAX_PREVIEW",
+    "TTLCache",
+    "OrthancBrowser",
+    "get_browser",
+]
+
+
+ORTHANC_URL = os.environ.get("ORTHANC_URL", "http://localhost:8042")
+ORTHANC_USERNAME = os.environ.get("ORTHANC_USERNAME")
+ORTHANC_PASSWORD = os.environ.get("ORTHANC_PASSWORD")
+BROWSE_TTL = float(os.environ.get("PACS_BROWSE_TTL", 30))
+BROWSE_MAX_ENTRIES = 4096
+# Limit=0 для Orthanc /tools/find — «без ограничения»: страница и пакет превью всегда ограничены
+BROWSE_MAX_PAGE = 500
+BROWSE_MAX_PREVIEW = 500
+
+
+def _check_page(offset: int, limit: int) -> None:
+    if offset < 0:
+        raise ValueError(f"offset must be >= 0, got {offset}")
+    if not 1 <= limit <= BROWSE_MAX_PAGE:
+        raise ValueError(f"limit must be in 1..{BROWSE_MAX_PAGE}, got {limit}")
+
+
+class TTLCache:
+    """Потокобезопасный словарь с ограниченным временем жизни и размером."""
+
+    def __init__(self, ttl: float = BROWSE_TTL, max_entries: int = BROWSE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                self._data.pop(key, None)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+def _tag(entry: Dict, name: str) -> str:
+    return entry.get("MainDicomTags", {}).get(name) or entry.get("PatientMainDicomTags", {}).get(name, "")
+
+
+def _study_summary(study: Dict) -> Dict:
+    return {
+        "id": study.get("ID"),
+        "study_uid": _tag(study, "StudyInstanceUID"),
+        "patient_id": _tag(study, "PatientID"),
+        "patient_name": _tag(study, "PatientName"),
+        "study_date": _tag(study, "StudyDate"),
+        "description": _tag(study, "StudyDescription"),
+        "series_count": len(study.get("Series", [])),
+    }
+
+
+def _series_summary(series: Dict) -> Dict:
+    return {
+        "id": series.get("ID"),
+        "series_uid": _tag(series, "SeriesInstanceUID"),
+        "modality": _tag(series, "Modality"),
+        "series_number": _tag(series, "SeriesNumber"),
+        "description": _tag(series, "SeriesDescription"),
+        "instance_count": len(series.get("Instances", [])),
+    }
+
+
+class OrthancBrowser:
+    """Кэширующий клиент Orthanc REST API для просмотра worklist'а."""
+
+    def __init__(
+        self,
+        base_url: str = ORTHANC_URL,
+        username: Optional[str] = ORTHANC_USERNAME,
+        password: Optional[str] = ORTHANC_PASSWORD,
+        ttl: float = BROWSE_TTL,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        if username and password:
+            self.session.auth = (username, password)
+        self.cache = TTLCache(ttl)
+
+    def _find(self, query: Dict) -> List[Dict]:
+        r = self.session.post(f"{self.base_url}/tools/find", json=query)
+        r.raise_for_status()
+        return r.json()
+
+    def list_studies(self, offset: int = 0, limit: int = 50, filters: Optional[Dict[str, str]] = None) -> Dict:
+        """
+        Страница исследований; *filters* — DICOM-теги для C-FIND (PatientID, StudyDate ...).
+        ValueError — offset < 0 или limit вне 1..BROWSE_MAX_PAGE.
+        """
+        _check_page(offset, limit)
+        filters = {k: v for k, v in (filters or {}).items() if v}
+        key = ("studies", offset, limit, tuple(sorted(filters.items())))
+        page = self.cache.get(key)
+        if page is None:
+            studies = self._find({
+                "Level": "Study",
+                "Expand": True,
+                "Query": filters,
+                "Since": offset,
+                "Limit": limit,
+            })
+            page = [_study_summary(s) for s in studies]
+            self.cache.set(key, page)
+        return {"items": page, "offset": offset, "limit": limit}
+
+    def list_series(self, study_id: str, offset: int = 0, limit: int = 100) -> Dict:
+        """Серии исследования с числом срезов; пагинация по закэшированному списку (границы — как у list_studies)."""
+        _check_page(offset, limit)
+        key = ("series", study_id)
+        series = self.cache.get(key)
+        if series is None:
+            r = self.session.get(f"{self.base_url}/studies/{study_id}/series")
+            r.raise_for_status()
+            series = [_series_summary(s) for s in r.json()]
+            self.cache.set(key, series)
+            for item in series:
+                self.cache.set(("preview", item["series_uid"]), item)
+        return {
+            "items": series[offset:offset + limit],
+            "offset": offset,
+            "limit": limit,
+            "total": len(series),
+        }
+
+    def preview_series(self, series_uids: List[str]) -> List[Dict]:
+        """Пакетное превью серий: один запрос к PACS на все отсутствующие в кэше UID (не больше BROWSE_MAX_PREVIEW)."""
+        if len(series_uids) > BROWSE_MAX_PREVIEW:
+            raise ValueError(f"At most {BROWSE_MAX_PREVIEW} series per preview request")
+        previews: Dict[str, Dict] = {}
+        missing = []
+        for uid in series_uids:
+            cached = self.cache.get(("preview", uid))
+            if cached is None:
+                missing.append(uid)
+            else:
+                previews[uid] = cached
+        if missing:
+            # Множественное значение через '\' — стандартный UID list matching в C-FIND
+            found = self._find({
+                "Level": "Series",
+                "Expand": True,
+                "Query": {"SeriesInstanceUID": "\\".join(missing)},
+            })
+            for series in found:
+                item = _series_summary(series)
+                previews[item["series_uid"]] = item
+                self.cache.set(("preview", item["series_uid"]), item)
+        return [previews[uid] for uid in series_uids if uid in previews]
+
+
+_browser: Optional[OrthancBrowser] = None
+_browser_lock = threading.Lock()
+
+
+def get_browser() -> OrthancBrowser:
+    """Общий экземпляр клиента для сконфигурированного Orthanc."""
+    global _browser
+    with _browser_lock:
+        if _browser is None:
+            _browser = OrthancBrowser()
+        return _browser
+
+
+def _cache_counts() -> Optional[Tuple[int, int]]:
+    """(попадания, промахи) общего экземпляра для /metrics; None, пока он не создан."""
+    browser = _browser
+    if browser is None:
+        return None
+    return browser.cache.hits, browser.cache.misses
+
+
+register_cache("pacs_browse", _cache_counts)
@@ -1,26 +1,75 @@
 # Модуль для импорта DICOM-серий из PACS (Orthanc/DICOMweb)
 import os
+from contextlib import contextmanager
+
 import requests
 
-def download_dicom_series_orthanc(orthanc_url, series_uid, out_dir, username=None, password=None):
+from backend.dicom.inline_anonymizer import INGEST_ANONYMIZE, write_anonymized
+from backend.dicom.series_cache import get_series_cache
+from backend.monitoring.metrics import stage
+
+
+def _auth(username=None, password=None):
+    return (username, password) if username and password else None
+
+
+def list_series_instances(orthanc_url, series_uid, username=None, password=None):
+    """
+    Возвращает список идентификаторов экземпляров (instances) серии в Orthanc.
+    """
+    url = f"{orthanc_url}/series/{series_uid}/instances"
+    r = requests.get(url, auth=_auth(username, password))
+    r.raise_for_status()
+    return [inst["ID"] if isinstance(inst, dict) else inst for inst in r.json()]
+
+
+def download_dicom_series_orthanc(orthanc_url, series_uid, out_dir, username=None, password=None, instances=None,
+                                  anonymize=None):
     """
     Загружает DICOM-серию из Orthanc по SeriesInstanceUID через DICOMweb REST API.
     Сохраняет все файлы в out_dir.
+    Если список instances уже получен, повторный запрос к PACS не делается.
+    anonymize (по умолчанию INGEST_ANONYMIZE): заголовок обезличивается при записи, пиксели — как есть.
     """
+    if anonymize is None:
+        anonymize = INGEST_ANONYMIZE
     os.makedirs(out_dir, exist_ok=True)
+    auth = _auth(username, password)
     # Получаем список экземпляров (instances) в серии
-    url = f"{orthanc_url}/series/{series_uid}/instances"
-    auth = (username, password) if username and password else None
-    r = requests.get(url, auth=auth)
-    r.raise_for_status()
-    instances = r.json()
+    if instances is None:
+        instances = list_series_instances(orthanc_url, series_uid, username, password)
     for instance_id in instances:
         # Скачиваем сам DICOM-файл
         instance_url = f"{orthanc_url}/instances/{instance_id}/file"
         r = requests.get(instance_url, auth=auth)
         r.raise_for_status()
         out_path = os.path.join(out_dir, f"{instance_id}.dcm")
-        with open(out_path, "wb") as f:
-            f.write(r.content)
+        if anonymize:
+            write_anonymized(r.content, out_path)
+        else:
+            with open(out_path, "wb") as f:
+                f.write(r.content)
     return out_dir
 
+
+@contextmanager
+def fetch_dicom_series_cached(orthanc_url, series_uid, username=None, password=None, cache=None):
+    """
+    Контекстный менеджер: локальная папка с серией из кэша серий, закреплённая (не вытесняется)
+    до выхода из блока ``with``. Серия скачивается из Orthanc только если её нет в кэше
+    (или набор срезов изменился).
+    """
+    cache = cache or get_series_cache()
+    with stage("pacs_fetch"):
+        instances = list_series_instances(orthanc_url, series_uid, username, password)
+        path = cache.acquire(
+            series_uid,
+            instances,
+            lambda target: download_dicom_series_orthanc(
+                orthanc_url, series_uid, str(target), username, password, instances=instances
+            ),
+        )
+    try:
+        yield str(path)
+    finally:
+        cache.release(path)
@@ -0,0 +1,172 @@
+"""parallel_reader.py
+====================
+Альтернативный reader DICOM-серии: параллельное декодирование пикселей
+в заранее выделенный объём.
+
+``sitk.ImageSeriesReader`` декодирует срезы последовательно, а затем
+``sitk.GetArrayFromImage`` делает полную копию объёма. Здесь:
+
+    1. заголовки читаются без пикселей (``stop_before_pixels``), срезы
+       сортируются по проекции ImagePositionPatient на нормаль к срезу;
+    2. итоговый массив (z, y, x) выделяется один раз;
+    3. срезы декодируются в пуле потоков и сразу пишутся на своё место с
+       применением RescaleSlope/RescaleIntercept. Несжатые 16-битные пиксели
+       читаются из файла по смещению прямо в срез объёма, сжатые transfer
+       syntax'ы декодирует pydicom (при наличии плагинов: pylibjpeg, gdcm ...).
+
+Возвращаемые spacing/origin/direction совпадают с тем, что даёт SimpleITK.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pydicom
+
+__all__ = [
+    "read_series_parallel",
+    "DICOM_READER",
+    "DICOM_READER_WORKERS",
+]
+
+
+# "sitk" (по умолчанию) или "parallel"
+DICOM_READER = os.environ.get("DICOM_READER", "sitk").lower()
+DICOM_READER_WORKERS = int(os.environ.get("DICOM_READER_WORKERS", 0)) or None
+
+
+class _SliceHeader:
+    """Заголовок среза + положение несжатых пикселей в файле (если применимо)."""
+
+    __slots__ = ("ds", "pixel_offset")
+
+    def __init__(self, ds, pixel_offset: Optional[int] = None):
+        self.ds = ds
+        self.pixel_offset = pixel_offset
+
+
+def _read_header(path: str) -> _SliceHeader:
+    with open(path, "rb") as fp:
+        ds = pydicom.dcmread(fp, stop_before_pixels=True)
+        # После stop_before_pixels файл стоит на начале элемента (7FE0,0010)
+        element_start = fp.tell()
+        head = fp.read(12)
+    tsyntax = ds.file_meta.get("TransferSyntaxUID") if hasattr(ds, "file_meta") else None
+    native = (
+        tsyntax is not None
+        and not tsyntax.is_compressed
+        and tsyntax.is_little_endian
+        and int(ds.get("SamplesPerPixel", 1)) == 1
+        and int(ds.get("BitsAllocated", 0)) == 16
+        and int(ds.get("NumberOfFrames", 1) or 1) == 1
+    )
+    if not native or len(head) < 8 or head[:4] != b"\xe0\x7f\x10\x00":
+        return _SliceHeader(ds)
+    if tsyntax.is_implicit_VR:
+        offset, length = element_start + 8, int.from_bytes(head[4:8], "little")
+    else:
+        offset, length = element_start + 12, int.from_bytes(head[8:12], "little")
+    if length != int(ds.Rows) * int(ds.Columns) * 2:
+        return _SliceHeader(ds)
+    return _SliceHeader(ds, offset)
+
+
+def _rescale(ds) -> Tuple[float, float]:
+    return float(ds.get("RescaleSlope", 1) or 1), float(ds.get("RescaleIntercept", 0) or 0)
+
+
+def _output_dtype(headers: Sequence) -> np.dtype:
+    """Подбирает dtype результата по диапазону хранимых значений и rescale."""
+    rescales = [_rescale(ds) for ds in headers]
+    if not all(float(s).is_integer() and float(i).is_integer() for s, i in rescales):
+        return np.dtype(np.float32)
+    ds = headers[0]
+    bits = int(ds.get("BitsStored", ds.get("BitsAllocated", 16)))
+    if int(ds.get("PixelRepresentation", 0)):
+        lo, hi = -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+    else:
+        lo, hi = 0, (1 << bits) - 1
+    out_lo = min(min(lo * s, hi * s) + i for s, i in rescales)
+    out_hi = max(max(lo * s, hi * s) + i for s, i in rescales)
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= out_lo and out_hi <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.float32)
+
+
+def _sort_slices(headers: Sequence) -> Tuple[List[int], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Порядок срезов и оси (row, col, normal) + позиции вдоль нормали."""
+    iop = [float(v) for v in headers[0].get("ImageOrientationPatient", [1, 0, 0, 0, 1, 0])]
+    row, col = np.array(iop[:3]), np.array(iop[3:])
+    normal = np.cross(row, col)
+    if all("ImagePositionPatient" in ds for ds in headers):
+        positions = np.array([[float(v) for v in ds.ImagePositionPatient] for ds in headers])
+        order = list(np.argsort(positions @ normal, kind="stable"))
+    else:
+        positions = None
+        order = sorted(range(len(headers)), key=lambda k: int(headers[k].get("InstanceNumber", k)))
+    return order, row, col, normal, positions
+
+
+def read_series_parallel(
+    series_files: Sequence[os.PathLike],
+    max_workers: Optional[int] = DICOM_READER_WORKERS,
+) -> Tuple[np.ndarray, Tuple[float, float, float], Tuple[float, float, float], Tuple[float, ...]]:
+    """Читает серию в (volume[z,y,x], spacing(x,y,z), origin, direction) параллельно."""
+    paths = [str(Path(fp)) for fp in series_files]
+    if not paths:
+        raise FileNotFoundError("Пустой список файлов серии")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        slice_headers = list(pool.map(_read_header, paths))
+        headers = [h.ds for h in slice_headers]
+        order, row, col, normal, positions = _sort_slices(headers)
+
+        first = headers[order[0]]
+        rows, cols = int(first.Rows), int(first.Columns)
+        pixel_spacing = [float(v) for v in first.get("PixelSpacing", [1.0, 1.0])]
+        if positions is not None and len(order) > 1:
+            along = positions[order] @ normal
+            z_spacing = float(np.mean(np.diff(along)))
+        else:
+            z_spacing = float(first.get("SliceThickness", 1.0) or 1.0)
+        spacing = (pixel_spacing[1], pixel_spacing[0], z_spacing)
+        origin = tuple(float(v) for v in first.get("ImagePositionPatient", [0.0, 0.0, 0.0]))
+        direction = tuple(float(v) for v in np.stack([row, col, normal], axis=1).ravel())
+
+        volume = np.empty((len(order), rows, cols), dtype=_output_dtype(headers))
+
+        def decode(z: int) -> None:
+            index = order[z]
+            header = slice_headers[index]
+            slope, intercept = _rescale(header.ds)
+            target = volume[z]
+            if header.pixel_offset is not None:
+                # Несжатые 16-битные пиксели: читаем байты без разбора датасета
+                stored = np.dtype("<i2" if int(header.ds.get("PixelRepresentation", 0)) else "<u2")
+                with open(paths[index], "rb") as fp:
+                    fp.seek(header.pixel_offset)
+                    if stored == target.dtype and slope == 1.0:
+                        fp.readinto(memoryview(target).cast("B"))
+                        pixels = None
+                    else:
+                        pixels = np.fromfile(fp, dtype=stored, count=rows * cols).reshape(rows, cols)
+            else:
+                pixels = pydicom.dcmread(paths[index]).pixel_array
+            if pixels is not None:
+                if slope == 1.0:
+                    np.copyto(target, pixels, casting="unsafe")
+                else:
+                    np.multiply(pixels, slope, out=target, casting="unsafe")
+            if intercept:
+                target += target.dtype.type(intercept)
+
+        # list() пробрасывает исключения из потоков
+        list(pool.map(decode, range(len(order))))
+
+    return volume, spacing, origin, direction
@@ -43,9 +43,21 @@ def save_dicom_image(ds, out_path):
         print("Нет данных изображения в DICOM-файле.")
         return False
     arr = ds.pixel_array
-    # Приведение к 8-битному диапазону
+    # Приведение к 8-битному диапазону: HU (slope/intercept) и окно из DICOM,
+    # иначе — по фактическому диапазону значений (в т.ч. отрицательных)
     if arr.dtype != np.uint8:
-        arr = (arr / arr.max() * 255).astype(np.uint8)
+        from backend.dicom.mpr_tiles import apply_window
+        slope = float(ds.get('RescaleSlope', 1) or 1)
+        intercept = float(ds.get('RescaleIntercept', 0) or 0)
+        values = arr * slope + intercept if (slope, intercept) != (1.0, 0.0) else arr
+        center, width = ds.get('WindowCenter'), ds.get('WindowWidth')
+        if center is not None and width is not None:
+            center = float(center[0] if isinstance(center, pydicom.multival.MultiValue) else center)
+            width = float(width[0] if isinstance(width, pydicom.multival.MultiValue) else width)
+        else:
+            lo, hi = float(values.min()), float(values.max())
+            center, width = (lo + hi) / 2.0, max(hi - lo, 1.0)
+        arr = apply_window(values, width, center)
     img = Image.fromarray(arr)
     img.save(out_path)
     print(f"Изображение сохранено: {out_path}")
@@ -127,8 +139,8 @@ def find_dicom_series(folder):
     import glob
     for ext in ("*.dcm", "*"):
         dicom_files.extend(glob.glob(os.path.join(folder, "**", ext), recursive=True))
-    # Фильтрация по сигнатуре DICOM
-    dicom_files = [f for f in dicom_files if is_dicom_file(f)]
+    # "*.dcm" и "*" находят одни и те же файлы: убираем дубли до чтения сигнатур
+    dicom_files = [f for f in dict.fromkeys(dicom_files) if is_dicom_file(f)]
     return dicom_files
 
 def validate_dicom_file(filepath):
@@ -158,11 +170,11 @@ def extended_validate_dicom_file(filepath):
     """
     try:
         ds = pydicom.dcmread(filepath, stop_before_pixels=True)
-        spacing = ds.get((0x0028, 0x0030), None)
-        rows = ds.get((0x0028, 0x0010), None)
-        cols = ds.get((0x0028, 0x0011), None)
-        orientation = ds.get((0x0020, 0x0037), None)
-        instance_number = ds.get((0x0020, 0x0013), None)
+        spacing = ds.get("PixelSpacing", None)
+        rows = ds.get("Rows", None)
+        cols = ds.get("Columns", None)
+        orientation = ds.get("ImageOrientationPatient", None)
+        instance_number = ds.get("InstanceNumber", None)
         if not spacing or not rows or not cols:
             return False, "Отсутствуют ключевые параметры (spacing, rows, cols)"
         if orientation is None or len(orientation) != 6:
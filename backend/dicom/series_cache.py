@@ -0,0 +1,252 @@
+"""series_cache.py
+====================
+Локальный content-addressed кэш DICOM-серий, загруженных из PACS.
+
+Ключ записи строится из SeriesInstanceUID, количества экземпляров и хэша
+их идентификаторов: повторный импорт той же серии не ходит в PACS, а
+изменившаяся серия (добавились/удалены срезы) получает новый ключ.
+
+Особенности:
+    • общий бюджет по байтам (``PACS_CACHE_MAX_BYTES``) с LRU-вытеснением;
+    • блокировка по ключу — два параллельных запроса одной серии приводят
+      ровно к одной загрузке, второй запрос ждёт и получает готовую папку;
+    • папка выдаётся закреплённой (``acquire``/``release`` или ``pinned``):
+      пока серия используется, вытеснение её не трогает — поиск с
+      закреплением и вытеснение идут под общей блокировкой;
+    • загрузка идёт во временную папку и публикуется атомарным ``os.replace``,
+      поэтому недокачанная серия никогда не попадёт в кэш.
+
+Блокировки действуют в пределах одного процесса (uvicorn с одним worker'ом).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from backend.monitoring.metrics import register_cache
+
+__all__ = [
+    "SeriesCache",
+    "series_cache_key",
+    "get_series_cache",
+]
+
+
+CACHE_ROOT = Path(os.environ.get("PACS_CACHE_DIR", Path("data") / "dicom_samples" / "pacs_cache"))
+CACHE_MAX_BYTES = int(os.environ.get("PACS_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+
+MANIFEST_NAME = "cache_manifest.json"
+
+
+def series_cache_key(series_uid: str, instance_ids: Iterable[str]) -> str:
+    """Строит ключ кэша по UID серии, числу экземпляров и их идентификаторам."""
+    ids = sorted(instance_ids)
+    h = hashlib.sha256()
+    h.update(series_uid.encode("utf-8"))
+    h.update(f"\n{len(ids)}\n".encode("utf-8"))
+    for instance_id in ids:
+        h.update(instance_id.encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()[:32]
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class SeriesCache:
+    """Кэш серий на диске с бюджетом по байтам и LRU-вытеснением."""
+
+    def __init__(self, root: os.PathLike = CACHE_ROOT, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._global_lock = threading.Lock()
+        # key -> [блокировка, число ожидающих/держащих]; запись удаляется, когда она никому не нужна
+        self._key_locks: Dict[str, list] = {}
+        self._pins: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    # ------------------------------------------------------------------
+    # Locking
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _key_lock(self, key: str) -> Iterator[None]:
+        with self._global_lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._global_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[key]
+
+    def _pin(self, key: str) -> Optional[Path]:
+        # под self._global_lock: запись есть в кэше -> закрепить и вернуть папку
+        path = self.path_for(key)
+        manifest = path / MANIFEST_NAME
+        if not manifest.exists():
+            return None
+        now = time.time()
+        os.utime(manifest, (now, now))
+        self._pins[key] = self._pins.get(key, 0) + 1
+        return path
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key
+
+    def acquire(
+        self,
+        series_uid: str,
+        instance_ids: List[str],
+        fetch: Callable[[Path], None],
+    ) -> Path:
+        """Возвращает закреплённую папку с серией, при промахе скачивает её через *fetch*.
+
+        *fetch(target_dir)* должен записать все файлы серии в ``target_dir``.
+        Папка не вытесняется до парного ``release(path)``.
+        """
+        key = series_cache_key(series_uid, instance_ids)
+        with self._key_lock(key):
+            with self._global_lock:
+                cached = self._pin(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
+            tmp_dir = self.root / f".{key}.{uuid.uuid4().hex[:8]}.partial"
+            tmp_dir.mkdir(parents=True)
+            try:
+                fetch(tmp_dir)
+                size = _dir_size(tmp_dir)
+                with open(tmp_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+                    json.dump({
+                        "series_uid": series_uid,
+                        "instance_count": len(instance_ids),
+                        "bytes": size,
+                        "created": time.time(),
+                    }, f)
+                target = self.path_for(key)
+                with self._global_lock:
+                    if target.exists():
+                        shutil.rmtree(target)  # остаток без манифеста: закреплён быть не может
+                    os.replace(tmp_dir, target)
+                    self._pin(key)
+            except BaseException:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+            self.evict()
+            return target
+
+    def release(self, path: os.PathLike) -> None:
+        """Снимает закрепление, полученное ``acquire``."""
+        key = Path(path).name
+        with self._global_lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+
+    @contextmanager
+    def pinned(
+        self,
+        series_uid: str,
+        instance_ids: List[str],
+        fetch: Callable[[Path], None],
+    ) -> Iterator[Path]:
+        """``acquire`` на время блока ``with``."""
+        path = self.acquire(series_uid, instance_ids, fetch)
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def entries(self) -> List[Tuple[str, int, float]]:
+        """Список записей (key, bytes, last_access), начиная с самых старых."""
+        result = []
+        for path in self.root.iterdir():
+            manifest = path / MANIFEST_NAME
+            if path.name.startswith(".") or not manifest.exists():
+                continue
+            try:
+                with open(manifest, "r", encoding="utf-8") as f:
+                    size = int(json.load(f).get("bytes", 0))
+                atime = manifest.stat().st_mtime
+            except (OSError, ValueError):
+                continue
+            result.append((path.name, size, atime))
+        result.sort(key=lambda e: e[2])
+        return result
+
+    def total_bytes(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, protect: Iterable[str] = ()) -> List[str]:
+        """
+        Удаляет самые давно использованные незакреплённые серии, пока кэш не уложится в бюджет.
+        Закреплённые (и *protect*) остаются, даже если бюджет превышен.
+        """
+        protect = set(protect)
+        removed = []
+        with self._global_lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for key, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                if key in protect or self._pins.get(key):
+                    continue
+                shutil.rmtree(self.path_for(key), ignore_errors=True)
+                total -= size
+                removed.append(key)
+        return removed
+
+
+_default_cache: Optional[SeriesCache] = None
+_default_lock = threading.Lock()
+
+
+def get_series_cache() -> SeriesCache:
+    """Общий экземпляр кэша (создаётся лениво)."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = SeriesCache()
+        return _default_cache
+
+
+def _cache_counts() -> Optional[Tuple[int, int]]:
+    """(попадания, промахи) общего экземпляра для /metrics; None, пока он не создан."""
+    cache = _default_cache
+    if cache is None:
+        return None
+    return cache.hits, cache.misses
+
+
+register_cache("pacs_series", _cache_counts)
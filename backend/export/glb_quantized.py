@@ -0,0 +1,170 @@
+"""glb_quantized.py
+====================
+Компактный GLB для загрузки на планшеты: квантование по KHR_mesh_quantization.
+
+    • позиции — int16 (normalized) в пределах bounding box'а меша; масштаб и
+      сдвиг вынесены в transform узла (масштаб равномерный, поэтому нормали
+      не искажаются);
+    • нормали — int8 (normalized) vec3. Октаэдрическое кодирование в
+      стандарт glTF не входит (нужен нестандартный декодер в клиенте), поэтому
+      используется штатный вариант KHR_mesh_quantization;
+    • треугольники упорядочены по коду Мортона центроидов, вершины —
+      по первому использованию: соседние треугольники делят вершины, что
+      улучшает попадания в вершинный кэш GPU и сжатие при передаче;
+    • индексы — uint16, если вершин меньше 65536.
+
+Итог — обычный GLB 2.0 с ``extensionsRequired: ["KHR_mesh_quantization"]``
+(поддерживается glTFast/Unity, three.js, Babylon). Позиции+нормали занимают
+12 байт на вершину вместо 24.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import struct
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import trimesh
+
+__all__ = [
+    "GLB_QUANTIZE",
+    "reorder_for_locality",
+    "quantize_positions",
+    "encode_quantized_glb",
+    "export_glb",
+]
+
+
+GLB_QUANTIZE = os.environ.get("GLB_QUANTIZE", "0") == "1"
+
+_BYTE, _SHORT, _UNSIGNED_SHORT, _UNSIGNED_INT = 5120, 5122, 5123, 5125
+_ARRAY_BUFFER, _ELEMENT_ARRAY_BUFFER = 34962, 34963
+_INT16_MAX = 32767
+
+
+def _part1by2(v: np.ndarray) -> np.ndarray:
+    v = v.astype(np.uint64) & 0x3FF
+    v = (v | (v << 16)) & 0x030000FF
+    v = (v | (v << 8)) & 0x0300F00F
+    v = (v | (v << 4)) & 0x030C30C3
+    v = (v | (v << 2)) & 0x09249249
+    return v
+
+
+def reorder_for_locality(vertices: np.ndarray, faces: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Сортирует треугольники по 30-битному коду Мортона центроида и перенумеровывает вершины
+    в порядке первого использования. Возвращает (order вершин: new -> old, новые faces).
+    """
+    centroids = vertices[faces].mean(axis=1)
+    lo = centroids.min(axis=0)
+    span = np.maximum(centroids.max(axis=0) - lo, 1e-12)
+    cells = np.clip(((centroids - lo) / span * 1023).astype(np.int64), 0, 1023)
+    codes = _part1by2(cells[:, 0]) | (_part1by2(cells[:, 1]) << 1) | (_part1by2(cells[:, 2]) << 2)
+    faces = faces[np.argsort(codes, kind="stable")]
+
+    flat = faces.ravel()
+    first_use = np.full(len(vertices), len(flat), dtype=np.int64)
+    np.minimum.at(first_use, flat, np.arange(len(flat)))
+    order = np.argsort(first_use, kind="stable")
+    order = order[first_use[order] < len(flat)]  # неиспользуемые вершины отбрасываются
+    remap = np.empty(len(vertices), dtype=np.int64)
+    remap[order] = np.arange(len(order))
+    return order, remap[faces]
+
+
+def quantize_positions(vertices: np.ndarray) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Позиции -> int16 (normalized) вокруг центра bbox с равномерным масштабом: (q, translation, scale)."""
+    lo, hi = vertices.min(axis=0), vertices.max(axis=0)
+    center = (lo + hi) / 2.0
+    scale = float(max((hi - lo).max() / 2.0, 1e-12))
+    q = np.round((vertices - center) / scale * _INT16_MAX)
+    return np.clip(q, -_INT16_MAX, _INT16_MAX).astype(np.int16), center, scale
+
+
+def _pad4(data: bytes, fill: bytes = b"\0") -> bytes:
+    return data + fill * (-len(data) % 4)
+
+
+def encode_quantized_glb(mesh: trimesh.Trimesh) -> Tuple[bytes, Dict]:
+    """Кодирует меш в квантованный GLB; возвращает (байты, статистика с max_error в единицах меша)."""
+    vertices = np.asarray(mesh.vertices, dtype=np.float64)
+    faces = np.asarray(mesh.faces, dtype=np.int64)
+    normals = np.asarray(mesh.vertex_normals, dtype=np.float64)
+    order, faces = reorder_for_locality(vertices, faces)
+    vertices, normals = vertices[order], normals[order]
+    n_verts = len(vertices)
+
+    q_pos, translation, scale = quantize_positions(vertices)
+    pos = np.zeros((n_verts, 4), dtype=np.int16)  # шаг 8 байт: атрибуты выравниваются по 4
+    pos[:, :3] = q_pos
+    nrm = np.zeros((n_verts, 4), dtype=np.int8)
+    nrm[:, :3] = np.clip(np.round(normals * 127.0), -127, 127)
+    index_type, index_dtype = (_UNSIGNED_SHORT, np.uint16) if n_verts < 65536 else (_UNSIGNED_INT, np.uint32)
+    indices = faces.astype(index_dtype).ravel()
+
+    blobs = [pos.tobytes(), nrm.tobytes(), indices.tobytes()]
+    views, offset = [], 0
+    for blob, target, stride in zip(blobs, (_ARRAY_BUFFER, _ARRAY_BUFFER, _ELEMENT_ARRAY_BUFFER), (8, 4, None)):
+        view = {"buffer": 0, "byteOffset": offset, "byteLength": len(blob), "target": target}
+        if stride:
+            view["byteStride"] = stride
+        views.append(view)
+        offset += len(_pad4(blob))
+    binary = b"".join(_pad4(b) for b in blobs)
+
+    gltf = {
+        "asset": {"version": "2.0", "generator": "glb_quantized"},
+        "extensionsUsed": ["KHR_mesh_quantization"],
+        "extensionsRequired": ["KHR_mesh_quantization"],
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{
+            "mesh": 0,
+            "translation": [float(v) for v in translation],
+            "scale": [scale] * 3,
+        }],
+        "meshes": [{"primitives": [{"attributes": {"POSITION": 0, "NORMAL": 1}, "indices": 2, "mode": 4}]}],
+        "accessors": [
+            {
+                "bufferView": 0, "componentType": _SHORT, "normalized": True, "count": n_verts, "type": "VEC3",
+                "min": [float(v) / _INT16_MAX for v in q_pos.min(axis=0)],
+                "max": [float(v) / _INT16_MAX for v in q_pos.max(axis=0)],
+            },
+            {"bufferView": 1, "componentType": _BYTE, "normalized": True, "count": n_verts, "type": "VEC3"},
+            {"bufferView": 2, "componentType": index_type, "count": int(indices.size), "type": "SCALAR"},
+        ],
+        "bufferViews": views,
+        "buffers": [{"byteLength": len(binary)}],
+    }
+    json_chunk = _pad4(json.dumps(gltf, separators=(",", ":")).encode("utf-8"), b" ")
+    total = 12 + 8 + len(json_chunk) + 8 + len(binary)
+    glb = b"".join([
+        struct.pack("<4sII", b"glTF", 2, total),
+        struct.pack("<I4s", len(json_chunk), b"JSON"), json_chunk,
+        struct.pack("<I4s", len(binary), b"BIN\0"), binary,
+    ])
+
+    decoded = q_pos.astype(np.float64) / _INT16_MAX * scale + translation
+    stats = {
+        "bytes": len(glb),
+        "vertices": int(n_verts),
+        "faces": int(len(faces)),
+        "max_error": float(np.abs(decoded - vertices).max()) if n_verts else 0.0,
+    }
+    return glb, stats
+
+
+def export_glb(mesh: trimesh.Trimesh, path, quantize: Optional[bool] = None) -> str:
+    """GLB-экспорт: квантованный (quantize или GLB_QUANTIZE=1) либо обычный float32 через trimesh."""
+    if quantize is None:
+        quantize = GLB_QUANTIZE
+    if not quantize:
+        mesh.export(path)
+        return str(path)
+    glb, _ = encode_quantized_glb(mesh)
+    with open(path, "wb") as f:
+        f.write(glb)
+    return str(path)
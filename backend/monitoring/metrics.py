@@ -0,0 +1,400 @@
+"""metrics.py
+====================
+Метрики сервиса в текстовом формате Prometheus (``GET /metrics``).
+
+    • ``stage("dicom_load")`` — контекстный менеджер и декоратор: длительность
+      шага пайплайна в гистограмму ``pipeline_stage_seconds{stage=...}``;
+    • ``track_job("segmentation")`` — длительность, статус и пиковый RSS
+      задания; RSS опрашивает общий поток (раз в ``METRICS_RSS_INTERVAL`` с),
+      пока выполняется хотя бы одно задание;
+    • ``MetricsMiddleware`` — число запросов и гистограмма задержки по шаблону
+      маршрута (``/task_status/{task_id}``, а не конкретный путь);
+    • ``register_gauge`` / ``register_cache`` — значения, которые снимаются в
+      момент запроса /metrics: глубина очереди, попадания и промахи кэшей.
+
+Без внешних зависимостей. ``METRICS_ENABLED=0`` отключает сбор: ``stage`` и
+``track_job`` сводятся к проверке флага, middleware пропускает запросы насквозь.
+Пиковый RSS — память всего процесса за время задания (параллельные задания
+видят общий пик).
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import ContextDecorator, contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+__all__ = [
+    "CONTENT_TYPE",
+    "METRICS_ENABLED",
+    "Counter",
+    "Histogram",
+    "MetricsMiddleware",
+    "current_rss",
+    "peak_rss",
+    "register_cache",
+    "register_gauge",
+    "render_metrics",
+    "stage",
+    "track_job",
+]
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+# Период опроса RSS во время заданий, секунды
+METRICS_RSS_INTERVAL = float(os.environ.get("METRICS_RSS_INTERVAL", 0.05))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы гистограмм: задержки HTTP, шаги пайплайна (секунды), память заданий (байты)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+RSS_BUCKETS = tuple(float(2 ** p) * 1024 ** 2 for p in range(7, 16))  # 128 МБ .. 32 ГБ
+
+LabelKey = Tuple[str, ...]
+Sample = Tuple[Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]  # (имя, тип, описание, значения)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._lines())
+        return lines
+
+    def _lines(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонный счётчик с метками."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _lines(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(dict(zip(self.labelnames, k)))} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами (``_bucket`` накопительные, как требует Prometheus)."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        self._values: Dict[LabelKey, List] = {}  # ключ -> [счётчики по корзинам, сумма, количество]
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        i = next((n for n, b in enumerate(self.buckets) if value <= b), len(self.buckets))
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def _lines(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = []
+        for key, (counts, total, n) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, c in zip(self.buckets + (math.inf,), counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{_labels({**labels, 'le': _fmt(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(labels)} {n}")
+        return lines
+
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route template and status", ("method", "endpoint", "status"))
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency", REQUEST_BUCKETS,
+                            ("method", "endpoint"))
+STAGE_SECONDS = Histogram("pipeline_stage_seconds", "Duration of pipeline stages", STAGE_BUCKETS, ("stage",))
+JOBS = Counter("jobs_total", "Finished jobs by kind and status", ("job", "status"))
+JOB_SECONDS = Histogram("job_duration_seconds", "Job duration", STAGE_BUCKETS, ("job",))
+JOB_PEAK_RSS = Histogram("job_peak_rss_bytes", "Peak process RSS while a job was running", RSS_BUCKETS, ("job",))
+
+_METRICS: List[_Metric] = [REQUESTS, REQUEST_SECONDS, STAGE_SECONDS, JOBS, JOB_SECONDS, JOB_PEAK_RSS]
+_collectors: List[Callable[[], Iterable[Family]]] = []
+_caches: Dict[str, Callable[[], Optional[Tuple[int, int]]]] = {}
+
+
+# ---------------------------------------------------------------------------
+# Память процесса
+# ---------------------------------------------------------------------------
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def peak_rss() -> Optional[int]:
+    """Пиковый RSS процесса, байты (None без модуля ``resource``, т.е. на Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int(peak) if sys.platform == "darwin" else int(peak) * 1024
+
+
+def current_rss() -> Optional[int]:
+    """Текущий RSS процесса, байты; без ``/proc`` — пиковый."""
+    try:
+        with open("/proc/self/statm", "rb") as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return peak_rss()
+
+
+class _JobPeak:
+    __slots__ = ("peak",)
+
+    def __init__(self, rss: int):
+        self.peak = rss
+
+
+class _RssSampler:
+    """Один поток на все задания: работает, только пока есть активные задания."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._jobs: set = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, job: _JobPeak) -> None:
+        with self._lock:
+            self._jobs.add(job)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+
+    def remove(self, job: _JobPeak) -> None:
+        with self._lock:
+            self._jobs.discard(job)
+
+    def _run(self) -> None:
+        while True:
+            rss = current_rss() or 0
+            with self._lock:
+                if not self._jobs:
+                    self._thread = None
+                    return
+                for job in self._jobs:
+                    if rss > job.peak:
+                        job.peak = rss
+            time.sleep(self.interval)
+
+
+_sampler = _RssSampler(METRICS_RSS_INTERVAL)
+
+
+# ---------------------------------------------------------------------------
+# Инструментирование
+# ---------------------------------------------------------------------------
+
+class _Stage(ContextDecorator):
+    __slots__ = ("name", "_t0")
+
+    def __init__(self, name: str):
+        self.name = name
+        self._t0: Optional[float] = None
+
+    def _recreate_cm(self) -> "_Stage":
+        # Декоратор: свой экземпляр на каждый вызов, иначе потоки делят _t0
+        return _Stage(self.name)
+
+    def __enter__(self) -> "_Stage":
+        if METRICS_ENABLED:
+            self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        if self._t0 is not None:
+            STAGE_SECONDS.observe(time.perf_counter() - self._t0, stage=self.name)
+        return False
+
+
+def stage(name: str) -> _Stage:
+    """Время шага *name* в ``pipeline_stage_seconds``; годится и как декоратор (``@stage("threshold")``)."""
+    return _Stage(name)
+
+
+@contextmanager
+def track_job(kind: str) -> Iterator[None]:
+    """Длительность, статус (ok/error) и пиковый RSS задания *kind*."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    job = _JobPeak(current_rss() or 0)
+    _sampler.add(job)
+    t0 = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        _sampler.remove(job)
+        job.peak = max(job.peak, current_rss() or 0)
+        JOB_SECONDS.observe(time.perf_counter() - t0, job=kind)
+        JOB_PEAK_RSS.observe(job.peak, job=kind)
+        JOBS.inc(job=kind, status=status)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: ``http_requests_total`` и ``http_request_duration_seconds`` по шаблону маршрута.
+
+    Запросы, не попавшие ни в один маршрут, считаются под ``endpoint="unmatched"``,
+    чтобы произвольные пути не раздували число временных рядов.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        t0 = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Маршрутизатор Starlette кладёт найденный маршрут в тот же scope
+            endpoint = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope.get("method", "")
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, method=method, endpoint=endpoint)
+            REQUESTS.inc(method=method, endpoint=endpoint, status=str(status))
+
+
+# ---------------------------------------------------------------------------
+# Значения, снимаемые при запросе /metrics
+# ---------------------------------------------------------------------------
+
+def register_gauge(name: str, help: str, func: Callable[[], Union[float, Dict[str, float]]],
+                   labelname: Optional[str] = None) -> None:
+    """Gauge, вычисляемый при каждом запросе /metrics.
+
+    *func* возвращает число, а при заданном *labelname* — словарь {значение метки: число}.
+    """
+
+    def collect() -> Iterable[Family]:
+        value = func()
+        if labelname is None:
+            samples = [({}, float(value))]
+        else:
+            samples = [({labelname: k}, float(v)) for k, v in sorted(value.items())]
+        yield name, "gauge", help, samples
+
+    _collectors.append(collect)
+
+
+def register_cache(name: str, func: Callable[[], Optional[Tuple[int, int]]]) -> None:
+    """Кэш *name* в ``cache_hits_total`` / ``cache_misses_total``.
+
+    *func* возвращает (попадания, промахи) или None, пока кэш не создан.
+    Доля попаданий: ``rate(cache_hits_total[5m]) / (rate(cache_hits_total[5m]) + rate(cache_misses_total[5m]))``.
+    """
+    _caches[name] = func
+
+
+def _collect_caches() -> Iterable[Family]:
+    hits, misses = [], []
+    for name, func in sorted(_caches.items()):
+        counts = func()
+        if counts is None:
+            continue
+        hits.append(({"cache": name}, float(counts[0])))
+        misses.append(({"cache": name}, float(counts[1])))
+    yield "cache_hits_total", "counter", "Cache hits", hits
+    yield "cache_misses_total", "counter", "Cache misses", misses
+
+
+def _collect_process() -> Iterable[Family]:
+    rss, peak = current_rss(), peak_rss()
+    if rss is not None:
+        yield "process_resident_memory_bytes", "gauge", "Resident set size", [({}, float(rss))]
+    if peak is not None:
+        yield "process_peak_rss_bytes", "gauge", "Peak resident set size since start", [({}, float(peak))]
+
+
+_collectors.extend([_collect_caches, _collect_process])
+
+
+def render_metrics() -> str:
+    """Все метрики в текстовом формате Prometheus 0.0.4."""
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        for name, kind, help, samples in collect():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{_labels(labels)} {_fmt(value)}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,149 @@
+"""histogram.py
+====================
+HU-гистограмма серии для мгновенного предпросмотра порогов.
+
+Гистограмма считается один раз на серию (чанками, ``np.bincount`` по 1 HU)
+и кэшируется. По кумулятивной гистограмме число вокселей и объём (мл)
+для любого диапазона [min, max] получаются двумя обращениями к массиву,
+без повторной сегментации. Автоподбор порогов (Otsu / multi-Otsu) тоже
+работает по гистограмме, а не по полному объёму.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from skimage.filters import threshold_multiotsu, threshold_otsu
+
+from backend.segmentation.segmentation import load_dicom_series_cached
+from backend.segmentation.volume_cache import series_fingerprint
+
+__all__ = [
+    "HUHistogram",
+    "compute_hu_histogram",
+    "get_histogram",
+    "histogram_for_series",
+]
+
+
+HISTOGRAM_CHUNK_SLICES = 32
+HISTOGRAM_CACHE_SIZE = 64
+# Otsu — перебинируем до этого размера; multi-Otsu растёт как bins^(classes-1),
+# поэтому для classes > 2 бинов намного меньше, а число классов ограничено
+OTSU_MAX_BINS = 512
+MULTIOTSU_MAX_BINS = 128
+MAX_OTSU_CLASSES = 4
+
+
+class HUHistogram:
+    """Гистограмма целых значений HU с кумулятивной суммой для O(1)-запросов."""
+
+    def __init__(self, counts: np.ndarray, min_value: int, voxel_volume_mm3: float):
+        self.counts = counts.astype(np.int64, copy=False)
+        self.min_value = int(min_value)
+        self.voxel_volume_mm3 = float(voxel_volume_mm3)
+        # cumulative[k] = число вокселей со значением < min_value + k
+        self.cumulative = np.concatenate(([0], np.cumsum(self.counts)))
+
+    @property
+    def max_value(self) -> int:
+        return self.min_value + len(self.counts) - 1
+
+    @property
+    def total(self) -> int:
+        return int(self.cumulative[-1])
+
+    def count_range(self, lo: float, hi: float) -> int:
+        """Число вокселей с lo <= HU <= hi."""
+        n = len(self.counts)
+        a = int(np.clip(np.ceil(lo) - self.min_value, 0, n))
+        b = int(np.clip(np.floor(hi) - self.min_value + 1, 0, n))
+        return int(self.cumulative[b] - self.cumulative[a]) if b > a else 0
+
+    def preview(self, lo: float, hi: float) -> Dict:
+        voxels = self.count_range(lo, hi)
+        return {
+            "threshold": [lo, hi],
+            "voxels": voxels,
+            "fraction": voxels / self.total if self.total else 0.0,
+            "volume_ml": voxels * self.voxel_volume_mm3 / 1000.0,
+        }
+
+    def _binned(self, max_bins: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(counts, bin_centers) с не более чем max_bins бинами; ValueError при max_bins < 1."""
+        if max_bins < 1:
+            raise ValueError(f"bins must be >= 1, got {max_bins}")
+        width = max(1, int(np.ceil(len(self.counts) / max_bins)))
+        pad = (-len(self.counts)) % width
+        counts = np.pad(self.counts, (0, pad)).reshape(-1, width).sum(axis=1)
+        centers = self.min_value + np.arange(len(counts)) * width + (width - 1) / 2.0
+        return counts, centers
+
+    def auto_thresholds(self, classes: int = 2) -> List[float]:
+        """Пороги Otsu (classes=2) или multi-Otsu по гистограмме; ValueError вне 2..MAX_OTSU_CLASSES."""
+        if not 2 <= classes <= MAX_OTSU_CLASSES:
+            raise ValueError(f"classes must be in 2..{MAX_OTSU_CLASSES}, got {classes}")
+        if classes == 2:
+            return [float(threshold_otsu(hist=self._binned(OTSU_MAX_BINS)))]
+        hist = self._binned(MULTIOTSU_MAX_BINS)
+        return [float(t) for t in threshold_multiotsu(hist=hist, classes=classes)]
+
+    def summary(self, bins: int = 64) -> Dict:
+        counts, centers = self._binned(bins)
+        return {
+            "min": self.min_value,
+            "max": self.max_value,
+            "total_voxels": self.total,
+            "voxel_volume_mm3": self.voxel_volume_mm3,
+            "bin_centers": centers.tolist(),
+            "counts": counts.tolist(),
+        }
+
+
+def compute_hu_histogram(array: np.ndarray, spacing, chunk_slices: int = HISTOGRAM_CHUNK_SLICES) -> HUHistogram:
+    """Гистограмма объёма с шагом 1 HU; память — только на один чанк."""
+    vmin, vmax = int(np.floor(array.min())), int(np.floor(array.max()))
+    counts = np.zeros(vmax - vmin + 1, dtype=np.int64)
+    integer = np.issubdtype(array.dtype, np.integer)
+    for z0 in range(0, array.shape[0], chunk_slices):
+        chunk = array[z0:z0 + chunk_slices].ravel()
+        idx = chunk.astype(np.int64) if integer else np.floor(chunk).astype(np.int64)
+        idx -= vmin
+        counts += np.bincount(idx, minlength=len(counts))
+    voxel_volume = float(np.prod(spacing))
+    return HUHistogram(counts, vmin, voxel_volume)
+
+
+_cache: "OrderedDict[str, HUHistogram]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_histogram(histogram_id: str) -> Optional[HUHistogram]:
+    """Гистограмма из кэша по id (ключу серии) или None."""
+    with _cache_lock:
+        hist = _cache.get(histogram_id)
+        if hist is not None:
+            _cache.move_to_end(histogram_id)
+        return hist
+
+
+def _put(histogram_id: str, hist: HUHistogram) -> None:
+    with _cache_lock:
+        _cache[histogram_id] = hist
+        _cache.move_to_end(histogram_id)
+        while len(_cache) > HISTOGRAM_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def histogram_for_series(dicom_folder) -> Tuple[str, HUHistogram]:
+    """Возвращает (histogram_id, гистограмма) серии; объём читается через кэш объёмов."""
+    histogram_id = series_fingerprint(dicom_folder)[2]
+    hist = get_histogram(histogram_id)
+    if hist is None:
+        _, array, spacing, _, _ = load_dicom_series_cached(dicom_folder)
+        hist = compute_hu_histogram(array, spacing)
+        _put(histogram_id, hist)
+    return histogram_id, hist
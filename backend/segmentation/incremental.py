@@ -0,0 +1,152 @@
+"""incremental.py
+====================
+Инкрементальный пересчёт меша при небольшом изменении порогов.
+
+При сдвиге порога на несколько HU меняется лишь малая часть маски. Меш
+хранится поблочно: блок ``b`` — слой кубов marching cubes между срезами
+``[b*B, (b+1)*B]`` (соседние блоки делят граничный срез). При обновлении
+маски сравниваются упакованные срезы старой и новой ``PackedMask``,
+пересчитываются только блоки, задетые изменившимися срезами, и меш
+собирается заново из готовых блоков. Результат совпадает с marching cubes
+по всему объёму (дубликаты вершин на стыках сливаются).
+
+Состояние хранится в памяти по job_id (ограниченный LRU).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import trimesh
+from skimage import measure
+
+from backend.segmentation.packed_mask import PackedMask, threshold_packed
+from backend.segmentation.segmentation import EmptyMaskError, load_dicom_series_cached
+
+__all__ = [
+    "IncrementalMesher",
+    "segment_incremental",
+    "INCREMENTAL_BLOCK_SLICES",
+]
+
+
+INCREMENTAL_BLOCK_SLICES = int(os.environ.get("INCREMENTAL_BLOCK_SLICES", 16))
+INCREMENTAL_MAX_JOBS = 8
+
+_Block = Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]
+
+
+def _window(lo: int, hi: int, pad: int, size: int) -> Tuple[int, int]:
+    """Окно [lo-pad, hi+pad) в пределах [0, size), не уже 2 вокселей (минимум для marching cubes)."""
+    a, b = max(lo - pad, 0), min(hi + pad, size)
+    if b - a < 2:
+        b = min(a + 2, size)
+        a = max(b - 2, 0)
+    return a, b
+
+
+class IncrementalMesher:
+    """Поблочный меш бинарной маски с пересчётом только изменившихся блоков."""
+
+    def __init__(self, spacing, block_slices: int = INCREMENTAL_BLOCK_SLICES):
+        self.spacing = np.asarray(spacing, dtype=np.float32)
+        self.block_slices = block_slices
+        self.mask: Optional[PackedMask] = None
+        self.blocks: List[_Block] = []
+        self.lock = threading.Lock()
+
+    def _block_range(self, b: int) -> Tuple[int, int]:
+        nz = self.mask.shape[0]
+        z0 = b * self.block_slices
+        return z0, min(z0 + self.block_slices, nz - 1)
+
+    def _extract_block(self, b: int) -> _Block:
+        mask = self.mask
+        z0, z1 = self._block_range(b)
+        counts = mask.slice_counts[z0:z1 + 1]
+        if not counts.any():
+            return None
+        _, ny, nx = mask.shape
+        slab = np.zeros((z1 - z0 + 1, ny, nx), dtype=np.uint8)
+        for k, z in enumerate(range(z0, z1 + 1)):
+            if mask.slice_counts[z]:
+                slab[k] = mask.slice(z)
+        if slab.min() == slab.max():
+            return None  # полностью заполненный слой: в объёме без паддинга поверхности нет
+        ys = np.flatnonzero(slab.any(axis=(0, 2)))
+        xs = np.flatnonzero(slab.any(axis=(0, 1)))
+        y0, y1 = _window(ys[0], ys[-1] + 1, 1, ny)
+        x0, x1 = _window(xs[0], xs[-1] + 1, 1, nx)
+        roi = slab[:, y0:y1, x0:x1]
+        if roi.min() == roi.max():
+            return None
+        verts, faces, normals, _ = measure.marching_cubes(roi, level=0.5, spacing=tuple(self.spacing))
+        verts += np.array([z0, y0, x0], dtype=verts.dtype) * self.spacing
+        return verts, faces, normals
+
+    def update(self, mask: PackedMask) -> Dict[str, int]:
+        """Принимает новую маску, пересчитывает затронутые блоки; возвращает статистику."""
+        nz = mask.shape[0]
+        n_blocks = max((nz - 2) // self.block_slices + 1, 1)
+        if self.mask is None or self.mask.shape != mask.shape:
+            changed_blocks = set(range(n_blocks))
+            self.blocks = [None] * n_blocks
+        else:
+            changed = np.flatnonzero((self.mask.bits != mask.bits).any(axis=1))
+            # Срез z входит в слои кубов z-1 и z
+            layers = np.concatenate([changed - 1, changed])
+            layers = layers[(layers >= 0) & (layers < nz - 1)]
+            changed_blocks = set((layers // self.block_slices).tolist())
+        self.mask = mask
+        for b in sorted(changed_blocks):
+            self.blocks[b] = self._extract_block(b)
+        return {"changed_blocks": len(changed_blocks), "total_blocks": n_blocks}
+
+    def mesh(self) -> trimesh.Trimesh:
+        """Склеивает блоки в один меш (вершины на стыках сливаются)."""
+        parts = [blk for blk in self.blocks if blk is not None]
+        if not parts:
+            raise EmptyMaskError("Segmentation mask is empty – nothing to export.")
+        offsets = np.cumsum([0] + [len(v) for v, _, _ in parts[:-1]])
+        verts = np.concatenate([v for v, _, _ in parts])
+        faces = np.concatenate([f + off for (_, f, _), off in zip(parts, offsets)])
+        normals = np.concatenate([n for _, _, n in parts])
+        return trimesh.Trimesh(vertices=verts, faces=faces, vertex_normals=normals, process=True)
+
+
+_jobs: "OrderedDict[str, Tuple[str, IncrementalMesher]]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _get_job(job_id: str, series_key: str, spacing) -> IncrementalMesher:
+    with _jobs_lock:
+        entry = _jobs.get(job_id)
+        if entry is None or entry[0] != series_key:
+            entry = (series_key, IncrementalMesher(spacing))
+        _jobs[job_id] = entry
+        _jobs.move_to_end(job_id)
+        while len(_jobs) > INCREMENTAL_MAX_JOBS:
+            _jobs.popitem(last=False)
+        return entry[1]
+
+
+def segment_incremental(dicom_folder, out_dir, job_id: str, threshold=(30, 300)) -> Dict:
+    """
+    Пересегментация с новыми порогами: пересчитываются только изменившиеся блоки меша
+    предыдущего результата того же job_id. Пишет out_dir/mask.glb.
+    """
+    _, array, spacing, _, _ = load_dicom_series_cached(dicom_folder)
+    series_key = f"{os.path.abspath(str(dicom_folder))}|{array.shape}|{tuple(spacing)}"
+    mesher = _get_job(job_id, series_key, spacing)
+    mask = threshold_packed(array, threshold)
+    with mesher.lock:
+        stats = mesher.update(mask)
+        mesh = mesher.mesh()
+    os.makedirs(out_dir, exist_ok=True)
+    gltf_path = os.path.join(out_dir, "mask.glb")
+    mesh.export(gltf_path)
+    return {"job_id": job_id, "gltf": gltf_path, "faces": int(len(mesh.faces)), **stats}
@@ -0,0 +1,172 @@
+"""mask_slices.py
+====================
+PNG-срезы маски: параллельный экспорт и отдача по запросу.
+
+Экспорт (``write_mask_pngs``) пишет только непустые срезы — заполненность
+берётся из ``PackedMask.slice_counts`` без распаковки объёма — и делает это
+пулом потоков (zlib и запись файла отпускают GIL). Рядом пишется
+``index.json`` со списком существующих срезов: отсутствующий срез пуст.
+
+Ленивый режим (MASK_PNG_MODE=lazy) файлы не пишет вовсе: маска
+регистрируется в ``MaskSliceCache``, а эндпоинт кодирует нужный срез при
+первом запросе. Готовые PNG хранятся в LRU; если маски нет в памяти
+(рестарт сервера), она поднимается из ``mask.nii.gz`` каталога результата.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import SimpleITK as sitk
+from PIL import Image
+
+from backend.monitoring.metrics import register_cache
+from backend.segmentation.packed_mask import PackedMask
+
+__all__ = [
+    "encode_slice_png",
+    "write_mask_pngs",
+    "MaskSliceCache",
+    "get_mask_slice_cache",
+    "MASK_PNG_MODE",
+]
+
+
+MASK_PNG_MODE = os.environ.get("MASK_PNG_MODE", "eager")  # eager | lazy
+MASK_PNG_WORKERS = int(os.environ.get("MASK_PNG_WORKERS", 0)) or None
+MASK_SLICE_CACHE_ENTRIES = int(os.environ.get("MASK_SLICE_CACHE_ENTRIES", 512))
+# Сколько масок держать в памяти для ленивой отдачи (бит-упакованные, ~1/8 байта на воксель)
+MASK_REGISTRY_ENTRIES = 4
+# Маски сжимаются отлично и при минимальном уровне; он в разы быстрее уровня по умолчанию
+PNG_COMPRESS_LEVEL = 1
+
+
+def encode_slice_png(slice_: np.ndarray) -> bytes:
+    """uint8 срез 0/1 -> PNG (оттенки серого 0/255)."""
+    buf = io.BytesIO()
+    Image.fromarray(slice_ * np.uint8(255)).save(buf, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    return buf.getvalue()
+
+
+def _slice_name(z: int) -> str:
+    return f"mask_{z:03d}.png"
+
+
+def write_mask_pngs(mask: PackedMask, out_dir, workers: Optional[int] = MASK_PNG_WORKERS, lazy: bool = False) -> Dict:
+    """
+    Пишет PNG непустых срезов пулом потоков и index.json; при lazy=True — только index.json.
+    Возвращает содержимое индекса.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    slices = [int(z) for z in mask.nonempty_slices()]
+
+    def _write(z: int) -> None:
+        with open(os.path.join(out_dir, _slice_name(z)), "wb") as f:
+            f.write(encode_slice_png(mask.slice(z)))
+
+    if not lazy and slices:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_write, slices))
+    index = {
+        "shape": list(mask.shape),
+        "slices": slices,
+        "pattern": "mask_{z:03d}.png",
+        "lazy": lazy,
+    }
+    with open(os.path.join(out_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    return index
+
+
+class MaskSliceCache:
+    """Маски результатов (по каталогу результата) + LRU закодированных PNG-срезов."""
+
+    def __init__(self, max_entries: int = MASK_SLICE_CACHE_ENTRIES, max_masks: int = MASK_REGISTRY_ENTRIES):
+        self.max_entries = max_entries
+        self.max_masks = max_masks
+        self._masks: "OrderedDict[str, PackedMask]" = OrderedDict()
+        self._png: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(result_dir) -> str:
+        return os.path.abspath(str(result_dir))
+
+    def register(self, result_dir, mask: PackedMask) -> None:
+        key = self._key(result_dir)
+        with self._lock:
+            self._masks[key] = mask
+            self._masks.move_to_end(key)
+            while len(self._masks) > self.max_masks:
+                self._masks.popitem(last=False)
+            for k in [k for k in self._png if k[0] == key]:
+                del self._png[k]
+
+    def get_mask(self, result_dir) -> PackedMask:
+        """Маска результата из памяти или из result_dir/mask.nii.gz; FileNotFoundError, если её нет."""
+        key = self._key(result_dir)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+        path = os.path.join(key, "mask.nii.gz")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No segmentation mask in {result_dir}")
+        image = sitk.ReadImage(path)  # view ниже валиден, только пока жив image
+        mask = PackedMask.from_dense(sitk.GetArrayViewFromImage(image))
+        self.register(key, mask)
+        return mask
+
+    def png(self, result_dir, z: int) -> bytes:
+        """PNG среза z; IndexError, если z вне объёма."""
+        key = self._key(result_dir)
+        with self._lock:
+            data = self._png.get((key, z))
+            if data is not None:
+                self._png.move_to_end((key, z))
+                self.hits += 1
+                return data
+            self.misses += 1
+        mask = self.get_mask(key)
+        if not 0 <= z < mask.shape[0]:
+            raise IndexError(f"Slice {z} out of range 0..{mask.shape[0] - 1}")
+        data = encode_slice_png(mask.slice(z))
+        with self._lock:
+            self._png[(key, z)] = data
+            while len(self._png) > self.max_entries:
+                self._png.popitem(last=False)
+        return data
+
+
+_default_cache: Optional[MaskSliceCache] = None
+_default_lock = threading.Lock()
+
+
+def get_mask_slice_cache() -> MaskSliceCache:
+    """Общий экземпляр кэша срезов (создаётся лениво)."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = MaskSliceCache()
+        return _default_cache
+
+
+def _cache_counts() -> Optional[Tuple[int, int]]:
+    """(попадания, промахи) общего экземпляра для /metrics; None, пока он не создан."""
+    cache = _default_cache
+    if cache is None:
+        return None
+    return cache.hits, cache.misses
+
+
+register_cache("mask_slices", _cache_counts)
@@ -0,0 +1,161 @@
+"""mesh_chunks.py
+====================
+Прогрессивная выдача меша в AR-клиент октодеревом чанков.
+
+Уровень ``l`` — меш, децимированный до бюджета MESH_CHUNK_FACES[l] (0 —
+без децимации), разрезанный по сетке 2^l × 2^l × 2^l ячеек общего
+bounding box'а: треугольник попадает в ячейку своего центроида (без
+отсечения — чанки стыкуются по рёбрам исходного меша). Уровень 0 — один
+грубый чанк-оболочка.
+
+Чанки пишутся в ``<out_dir>/chunks/L{l}_{x}_{y}_{z}.glb`` от грубого к
+точному, и после каждого записанного чанка атомарно обновляется
+``chunks/manifest.json`` (границы ячейки и самих треугольников, число
+граней, ``version``). Клиент опрашивает манифест, сразу показывает
+уровень 0 и заменяет ячейку уровня l, когда готовы все её непустые
+дочерние ячейки уровня l+1 (индексы ``2*x + {0,1}`` по каждой оси).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import trimesh
+
+from backend.export.glb_quantized import export_glb
+from backend.segmentation.mesh_lod import parse_face_budgets
+from backend.segmentation.segmentation import decimate_mesh
+
+__all__ = [
+    "MESH_CHUNKS",
+    "MESH_CHUNK_FACES",
+    "split_octree",
+    "ChunkManifest",
+    "build_mesh_chunks",
+]
+
+
+MESH_CHUNKS = os.environ.get("MESH_CHUNKS", "0") == "1"
+MESH_CHUNK_FACES = parse_face_budgets(os.environ.get("MESH_CHUNK_FACES", "5000,40000,0"))
+MESH_CHUNK_WORKERS = int(os.environ.get("MESH_CHUNK_WORKERS", 0)) or None
+
+
+def split_octree(
+    mesh: trimesh.Trimesh, depth: int, lo: np.ndarray, hi: np.ndarray
+) -> List[Tuple[Tuple[int, int, int], trimesh.Trimesh]]:
+    """Разбивает меш по ячейкам 2^depth на ось в границах [lo, hi]; пустые ячейки пропускаются."""
+    n = 2 ** depth
+    faces = np.asarray(mesh.faces)
+    vertices = np.asarray(mesh.vertices)
+    centroids = vertices[faces].mean(axis=1)
+    span = np.maximum(hi - lo, 1e-9)
+    cells = np.clip(((centroids - lo) / span * n).astype(np.int64), 0, n - 1)
+    keys = (cells[:, 0] * n + cells[:, 1]) * n + cells[:, 2]
+    order = np.argsort(keys, kind="stable")
+    unique, starts = np.unique(keys[order], return_index=True)
+    result = []
+    for key, group in zip(unique, np.split(order, starts[1:])):
+        used, local = np.unique(faces[group], return_inverse=True)
+        cell = (int(key // (n * n)), int(key // n % n), int(key % n))
+        result.append((cell, trimesh.Trimesh(vertices[used], local.reshape(-1, 3), process=False)))
+    return result
+
+
+class ChunkManifest:
+    """manifest.json чанков: каждое изменение увеличивает version и пишется атомарно (tmp + replace)."""
+
+    def __init__(self, chunks_dir: str, lo: np.ndarray, hi: np.ndarray, level_faces: Sequence[int]):
+        self.path = os.path.join(chunks_dir, "manifest.json")
+        self._lock = threading.Lock()
+        self.data = {
+            "version": 0,
+            "status": "building",
+            "bounds": [[float(v) for v in lo], [float(v) for v in hi]],
+            "levels": [
+                {"level": level, "grid": 2 ** level, "budget": int(budget), "faces": None, "chunks": None}
+                for level, budget in enumerate(level_faces)
+            ],
+            "chunks": [],
+        }
+        self._write()
+
+    def _write(self) -> None:
+        self.data["version"] += 1
+        tmp = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.path)
+
+    def add_chunk(self, entry: Dict) -> None:
+        with self._lock:
+            self.data["chunks"].append(entry)
+            self._write()
+
+    def level_done(self, level: int, faces: int, chunks: int) -> None:
+        with self._lock:
+            self.data["levels"][level].update({"faces": faces, "chunks": chunks})
+            self._write()
+
+    def finish(self, status: str = "done", detail: Optional[str] = None) -> None:
+        with self._lock:
+            self.data["status"] = status
+            if detail:
+                self.data["detail"] = detail
+            self._write()
+
+
+def _cell_bounds(lo: np.ndarray, hi: np.ndarray, n: int, cell) -> List[List[float]]:
+    size = (hi - lo) / n
+    start = lo + size * np.asarray(cell)
+    return [[float(v) for v in start], [float(v) for v in start + size]]
+
+
+def build_mesh_chunks(
+    mesh: trimesh.Trimesh,
+    out_dir,
+    level_faces: Optional[Sequence[int]] = None,
+    workers: Optional[int] = MESH_CHUNK_WORKERS,
+) -> Dict:
+    """
+    Пишет чанки всех уровней в out_dir/chunks и манифест; возвращает итоговый манифест.
+    Чанки одного уровня экспортируются пулом потоков, уровни — строго от грубого к точному.
+    """
+    level_faces = MESH_CHUNK_FACES if level_faces is None else level_faces
+    chunks_dir = os.path.join(out_dir, "chunks")
+    os.makedirs(chunks_dir, exist_ok=True)
+    lo, hi = (np.asarray(b, dtype=np.float64) for b in mesh.bounds)
+    manifest = ChunkManifest(chunks_dir, lo, hi, level_faces)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for level, budget in enumerate(level_faces):
+                level_mesh = decimate_mesh(mesh, budget) if budget else mesh
+                n = 2 ** level
+
+                def _export(item, level=level, n=n):
+                    cell, sub = item
+                    name = f"L{level}_{cell[0]}_{cell[1]}_{cell[2]}.glb"
+                    path = os.path.join(chunks_dir, name)
+                    export_glb(sub, path)
+                    manifest.add_chunk({
+                        "name": name,
+                        "level": level,
+                        "cell": list(cell),
+                        "cell_bounds": _cell_bounds(lo, hi, n, cell),
+                        "bounds": [[float(v) for v in b] for b in sub.bounds],
+                        "faces": int(len(sub.faces)),
+                        "bytes": os.path.getsize(path),
+                    })
+
+                parts = split_octree(level_mesh, level, lo, hi)
+                list(pool.map(_export, parts))
+                manifest.level_done(level, int(len(level_mesh.faces)), len(parts))
+    except Exception as e:
+        manifest.finish("error", str(e))
+        raise
+    manifest.finish()
+    return manifest.data
@@ -0,0 +1,77 @@
+"""mesh_lod.py
+====================
+Цепочка LOD (LOD0/LOD1/LOD2) для экспорта в AR-клиент.
+
+Меш marching cubes легко насчитывает миллионы граней, а бюджет AR (C3) —
+не больше 50k. Уровни детализации строятся на сервере квадрик-децимацией
+общего меша до заданных бюджетов граней (LOD_FACE_BUDGETS), параллельно в
+пуле потоков: каждый уровень децимируется из исходного меша независимо,
+поэтому ошибки не накапливаются от уровня к уровню. Клиенту (Unity
+``LODGenerator``) остаётся только собрать LODGroup из готовых GLB.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import trimesh
+
+from backend.export.glb_quantized import export_glb
+from backend.segmentation.segmentation import decimate_mesh
+
+__all__ = [
+    "LOD_FACE_BUDGETS",
+    "parse_face_budgets",
+    "submit_lod_chain",
+    "build_lod_chain",
+]
+
+
+def parse_face_budgets(value: str) -> List[int]:
+    """'50000,20000,5000' -> [50000, 20000, 5000]; пустая строка — LOD отключены."""
+    return [int(v) for v in value.replace(" ", "").split(",") if v]
+
+
+LOD_FACE_BUDGETS = parse_face_budgets(os.environ.get("LOD_FACE_BUDGETS", "50000,20000,5000"))
+LOD_WORKERS = int(os.environ.get("LOD_WORKERS", 0)) or None
+
+
+def _export_level(mesh: trimesh.Trimesh, level: int, budget: int, path: str) -> Dict:
+    lod = decimate_mesh(mesh, budget)
+    export_glb(lod, path)
+    return {"level": level, "budget": int(budget), "faces": int(len(lod.faces)), "path": path}
+
+
+def submit_lod_chain(
+    pool: ThreadPoolExecutor,
+    mesh: trimesh.Trimesh,
+    out_dir,
+    budgets: Sequence[int] = LOD_FACE_BUDGETS,
+    prefix: str = "mask",
+) -> List[Future]:
+    """Ставит уровни в переданный пул (чтобы параллелить с другим экспортом); Future -> dict уровня."""
+    os.makedirs(out_dir, exist_ok=True)
+    return [
+        pool.submit(_export_level, mesh, level, budget, os.path.join(out_dir, f"{prefix}_lod{level}.glb"))
+        for level, budget in enumerate(budgets)
+    ]
+
+
+def build_lod_chain(
+    mesh: trimesh.Trimesh,
+    out_dir,
+    budgets: Optional[Sequence[int]] = None,
+    prefix: str = "mask",
+    workers: Optional[int] = LOD_WORKERS,
+) -> List[Dict]:
+    """
+    Пишет <prefix>_lod{i}.glb для каждого бюджета граней; возвращает
+    [{"level", "budget", "faces", "path"}, ...] по возрастанию уровня.
+    """
+    budgets = LOD_FACE_BUDGETS if budgets is None else budgets
+    if not budgets:
+        return []
+    with ThreadPoolExecutor(max_workers=workers or len(budgets)) as pool:
+        return [f.result() for f in submit_lod_chain(pool, mesh, out_dir, budgets, prefix)]
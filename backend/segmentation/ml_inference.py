@@ -0,0 +1,287 @@
+"""ml_inference.py
+====================
+Подключаемые сегментаторы: пороговый и ML (ONNX Runtime, CPU).
+
+Общий интерфейс ``Segmenter.segment(array) -> PackedMask`` позволяет
+пайплайну (``segment_and_export_full(..., segmenter=...)``) не зависеть от
+способа сегментации. ``get_segmenter()`` выбирает реализацию по переменной
+окружения SEGMENTER (threshold | onnx).
+
+``OnnxSegmenter`` — инференс скользящим окном:
+
+    • окна размером с вход модели, шаг ``patch * (1 - overlap)``;
+    • окна с одинаковым z-началом собираются в батчи;
+    • вероятности смешиваются гауссовыми весами (центр окна важнее краёв);
+    • аккумуляторы занимают лишь ``patch_z`` срезов: окна идут по
+      возрастанию z, и срезы, которых больше не коснётся ни одно окно,
+      сразу порогуются в PackedMask. Память не зависит от глубины объёма;
+    • размер батча ограничен ``max_memory_bytes`` (аккумуляторы + вход и
+      выход батча); если не помещается даже один патч — ValueError.
+
+Число потоков ONNX Runtime задаётся явно (intra_op / inter_op), чтобы
+инференс не конкурировал с остальным сервером за все ядра.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.monitoring.metrics import stage
+from backend.segmentation.packed_mask import PackedMask, threshold_packed
+
+__all__ = [
+    "Segmenter",
+    "ThresholdSegmenter",
+    "OnnxSegmenter",
+    "gaussian_weights",
+    "window_starts",
+    "get_segmenter",
+]
+
+
+SEGMENTER = os.environ.get("SEGMENTER", "threshold")
+ONNX_MODEL_PATH = os.environ.get("ONNX_MODEL_PATH", "")
+ONNX_INTRA_OP_THREADS = int(os.environ.get("ONNX_INTRA_OP_THREADS", 0))
+ONNX_INTER_OP_THREADS = int(os.environ.get("ONNX_INTER_OP_THREADS", 1))
+ML_OVERLAP = float(os.environ.get("ML_OVERLAP", 0.5))
+ML_BATCH_SIZE = int(os.environ.get("ML_BATCH_SIZE", 4))
+ML_MAX_MEMORY_BYTES = int(os.environ.get("ML_MAX_MEMORY_BYTES", 1 << 30))  # 1 GiB
+
+
+class Segmenter(ABC):
+    """Сегментатор: объём (z, y, x) -> бинарная PackedMask той же формы."""
+
+    name = "base"
+
+    @abstractmethod
+    def segment(self, array: np.ndarray) -> PackedMask:
+        ...
+
+
+class ThresholdSegmenter(Segmenter):
+    """Пороговая сегментация (текущий алгоритм по умолчанию)."""
+
+    name = "threshold"
+
+    def __init__(self, threshold=(30, 300)):
+        self.threshold = threshold
+
+    @stage("threshold")
+    def segment(self, array: np.ndarray) -> PackedMask:
+        return threshold_packed(array, self.threshold)
+
+
+def window_starts(size: int, patch: int, stride: int) -> List[int]:
+    """Начала окон вдоль оси: шаг stride, последнее окно прижато к краю."""
+    if size <= patch:
+        return [0]
+    starts = list(range(0, size - patch, stride))
+    starts.append(size - patch)
+    return starts
+
+
+def gaussian_weights(patch: Sequence[int], sigma_scale: float = 0.125) -> np.ndarray:
+    """Гауссово окно (максимум 1) размера patch; края не обнуляются, чтобы сумма весов была > 0."""
+    axes = []
+    for n in patch:
+        x = np.arange(n, dtype=np.float32) - (n - 1) / 2.0
+        sigma = max(n * sigma_scale, 1e-3)
+        axes.append(np.exp(-0.5 * (x / sigma) ** 2))
+    w = axes[0][:, None, None] * axes[1][None, :, None] * axes[2][None, None, :]
+    w /= w.max()
+    np.maximum(w, 1e-3, out=w)
+    return w.astype(np.float32)
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _softmax_channel(x: np.ndarray, channel: int) -> np.ndarray:
+    x = x - x.max(axis=1, keepdims=True)
+    e = np.exp(x)
+    return e[:, channel] / e.sum(axis=1)
+
+
+class OnnxSegmenter(Segmenter):
+    """
+    Инференс ONNX-модели (N, 1, z, y, x) -> (N, C, z, y, x) скользящим окном на CPU.
+    C == 1 — sigmoid (вероятность органа), C > 1 — softmax и канал foreground_channel.
+    """
+
+    name = "onnx"
+
+    def __init__(
+        self,
+        model_path: str,
+        patch_size: Optional[Tuple[int, int, int]] = None,
+        overlap: float = ML_OVERLAP,
+        batch_size: int = ML_BATCH_SIZE,
+        hu_window: Optional[Tuple[float, float]] = (-100.0, 400.0),
+        activation: Optional[str] = "auto",
+        foreground_channel: int = 1,
+        probability_threshold: float = 0.5,
+        intra_op_threads: int = ONNX_INTRA_OP_THREADS,
+        inter_op_threads: int = ONNX_INTER_OP_THREADS,
+        max_memory_bytes: int = ML_MAX_MEMORY_BYTES,
+    ):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:  # pragma: no cover - зависит от окружения
+            raise ImportError("onnxruntime is required for OnnxSegmenter (pip install onnxruntime)") from e
+        if not 0.0 <= overlap < 1.0:
+            raise ValueError("overlap must be in [0, 1)")
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = intra_op_threads
+        opts.inter_op_num_threads = inter_op_threads
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+        model_patch = self.session.get_inputs()[0].shape[2:]
+        if patch_size is None:
+            if len(model_patch) != 3 or not all(isinstance(n, int) for n in model_patch):
+                raise ValueError("Model input has dynamic spatial size – pass patch_size explicitly")
+            patch_size = tuple(model_patch)
+        self.patch_size = tuple(int(n) for n in patch_size)
+        self.overlap = overlap
+        self.batch_size = max(int(batch_size), 1)
+        self.hu_window = hu_window
+        self.activation = activation
+        self.foreground_channel = foreground_channel
+        self.probability_threshold = probability_threshold
+        self.max_memory_bytes = max_memory_bytes
+        self.weights = gaussian_weights(self.patch_size)
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _normalize(self, patch: np.ndarray, out: np.ndarray) -> None:
+        if self.hu_window is None:
+            out[...] = patch
+            return
+        lo, hi = self.hu_window
+        np.clip(patch, lo, hi, out=out)
+        out -= lo
+        out /= hi - lo
+
+    def _probabilities(self, logits: np.ndarray) -> np.ndarray:
+        if logits.ndim == 4:
+            logits = logits[:, None]
+        channels = logits.shape[1]
+        activation = self.activation
+        if activation == "auto":
+            activation = "sigmoid" if channels == 1 else "softmax"
+        if activation == "softmax":
+            return _softmax_channel(logits, self.foreground_channel)
+        probs = logits[:, 0] if channels == 1 else logits[:, self.foreground_channel]
+        return _sigmoid(probs) if activation == "sigmoid" else probs
+
+    def _fit_batch(self, plane: Tuple[int, int]) -> int:
+        pz = self.patch_size[0]
+        patch_bytes = int(np.prod(self.patch_size)) * 4
+        accum_bytes = 2 * pz * plane[0] * plane[1] * 4
+        # вход батча + выход (до 2 каналов логитов) + вероятности
+        per_item = patch_bytes * 4
+        budget = self.max_memory_bytes - accum_bytes
+        if budget < per_item:
+            raise ValueError(
+                f"ML_MAX_MEMORY_BYTES={self.max_memory_bytes} is too small for patch {self.patch_size} "
+                f"on a {plane[0]}x{plane[1]} plane (needs at least {accum_bytes + per_item} bytes)"
+            )
+        return max(1, min(self.batch_size, budget // per_item))
+
+    def _windows(self, shape) -> Iterator[Tuple[int, List[Tuple[int, int]]]]:
+        strides = [max(1, int(round(p * (1.0 - self.overlap)))) for p in self.patch_size]
+        zs, ys, xs = (window_starts(n, p, s) for n, p, s in zip(shape, self.patch_size, strides))
+        for z in zs:
+            yield z, [(y, x) for y in ys for x in xs]
+
+    # ------------------------------------------------------------------
+    # Inference
+    # ------------------------------------------------------------------
+
+    def predict_patches(self, batch: np.ndarray) -> np.ndarray:
+        """Прогон батча (N, pz, py, px) float32 -> вероятности (N, pz, py, px)."""
+        logits = self.session.run(None, {self.input_name: batch[:, None]})[0]
+        return self._probabilities(np.asarray(logits, dtype=np.float32))
+
+    @stage("inference")
+    def segment(self, array: np.ndarray) -> PackedMask:
+        orig_shape = array.shape
+        pad = [(0, max(p - n, 0)) for n, p in zip(orig_shape, self.patch_size)]
+        if any(after for _, after in pad):
+            fill = self.hu_window[0] if self.hu_window is not None else 0
+            array = np.pad(array, pad, mode="constant", constant_values=fill)
+        nz, ny, nx = array.shape
+        pz, py, px = self.patch_size
+        batch_size = self._fit_batch((ny, nx))
+
+        result = PackedMask.empty(orig_shape)
+        acc = np.zeros((pz, ny, nx), dtype=np.float32)
+        wsum = np.zeros_like(acc)
+        batch = np.empty((batch_size, pz, py, px), dtype=np.float32)
+        base = 0  # z-координата acc[0]
+
+        def flush(upto: int) -> None:
+            # Срезы [base, upto) окончательны: нормировка, порог, упаковка
+            nonlocal base
+            n = upto - base
+            if n <= 0:
+                return
+            prob = acc[:n]
+            np.divide(prob, np.maximum(wsum[:n], 1e-6), out=prob)
+            keep = min(upto, orig_shape[0]) - base
+            if keep > 0:
+                fg = prob[:keep, :orig_shape[1], :orig_shape[2]] >= self.probability_threshold
+                result._write_chunk(base, fg)
+            acc[:pz - n] = acc[n:]
+            wsum[:pz - n] = wsum[n:]
+            acc[pz - n:] = 0
+            wsum[pz - n:] = 0
+            base = upto
+
+        for z, positions in self._windows((nz, ny, nx)):
+            flush(z)
+            dz = z - base
+            for k0 in range(0, len(positions), batch_size):
+                chunk = positions[k0:k0 + batch_size]
+                for i, (y, x) in enumerate(chunk):
+                    self._normalize(array[z:z + pz, y:y + py, x:x + px], batch[i])
+                probs = self.predict_patches(batch[:len(chunk)])
+                for i, (y, x) in enumerate(chunk):
+                    acc[dz:dz + pz, y:y + py, x:x + px] += probs[i] * self.weights
+                    wsum[dz:dz + pz, y:y + py, x:x + px] += self.weights
+        flush(nz)
+        return result
+
+
+_default_segmenter: Optional[Segmenter] = None
+_default_lock = threading.Lock()
+
+
+def get_segmenter(kind: Optional[str] = None, threshold=(30, 300)) -> Segmenter:
+    """
+    Сегментатор по kind (или SEGMENTER): "threshold" — новый ThresholdSegmenter(threshold),
+    "onnx" — общий OnnxSegmenter по ONNX_MODEL_PATH (сессия создаётся один раз).
+    """
+    global _default_segmenter
+    kind = kind or SEGMENTER
+    if kind == "threshold":
+        return ThresholdSegmenter(threshold)
+    if kind != "onnx":
+        raise ValueError(f"Unknown segmenter: {kind}")
+    with _default_lock:
+        if _default_segmenter is None:
+            if not ONNX_MODEL_PATH:
+                raise ValueError("ONNX_MODEL_PATH is not set")
+            _default_segmenter = OnnxSegmenter(ONNX_MODEL_PATH)
+        return _default_segmenter
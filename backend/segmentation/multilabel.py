@@ -0,0 +1,180 @@
+"""multilabel.py
+====================
+Многометочная сегментация за один проход с параллельным построением мешей.
+
+Вместо отдельного полного прогона пайплайна на каждый орган (почка,
+запрещённые зоны для троакаров) объём читается один раз, а карта меток
+строится одним векторизованным проходом: по диапазонам HU собирается
+таблица ``lut[HU] -> label`` и применяется к объёму чанками (``np.take``).
+При пересечении диапазонов побеждает метка, указанная позже.
+
+Меши по меткам извлекаются параллельно (пул потоков), на выходе:
+многометочный NIfTI, по одному GLB на орган и сами ``trimesh``-меши,
+которые можно сразу передать в ``calculate_trocar_points(forbidden_meshes=...)``.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.segmentation.packed_mask import THRESHOLD_CHUNK_SLICES, threshold_packed
+from backend.segmentation.segmentation import (
+    EmptyMaskError,
+    load_dicom_series_cached,
+    mask_to_mesh,
+    save_mask_nifti,
+)
+
+__all__ = [
+    "LabelSpec",
+    "parse_label_specs",
+    "label_map_from_ranges",
+    "segment_multilabel",
+]
+
+
+MULTILABEL_WORKERS = int(os.environ.get("MULTILABEL_WORKERS", 0)) or None
+# Для dtype шире int16 таблица строится по фактическому [min, max], но не больше этого размера
+MAX_LUT_SIZE = 1 << 20
+# Имя метки становится именем файла <name>.glb
+_LABEL_NAME = re.compile(r"[A-Za-z0-9_-]+")
+
+
+@dataclass
+class LabelSpec:
+    """Именованный диапазон интенсивностей -> метка."""
+
+    name: str
+    threshold: Tuple[float, float]
+    label: int
+    forbidden: bool = False
+
+
+def parse_label_specs(items: Sequence[Dict]) -> List[LabelSpec]:
+    """
+    Разбирает [{"name": "kidney", "min": 30, "max": 300, "forbidden": false}, ...]; метки 1..N по порядку.
+    Имена — только [A-Za-z0-9_-] и уникальны без учёта регистра (файлы на нечувствительных к регистру ФС).
+    """
+    specs = []
+    for k, item in enumerate(items, start=1):
+        label = int(item.get("label", k))
+        if not 0 < label < 256:
+            raise ValueError(f"Label must be in 1..255: {label}")
+        name = str(item["name"])
+        if not _LABEL_NAME.fullmatch(name):
+            raise ValueError(f"Label name must match [A-Za-z0-9_-]+: {name!r}")
+        specs.append(LabelSpec(
+            name=name,
+            threshold=(float(item["min"]), float(item["max"])),
+            label=label,
+            forbidden=bool(item.get("forbidden", False)),
+        ))
+    names = [s.name.lower() for s in specs]
+    if len(set(names)) != len(names):
+        raise ValueError("Label names must be unique")
+    return specs
+
+
+def _build_lut(specs: Sequence[LabelSpec], vmin: int, vmax: int) -> np.ndarray:
+    lut = np.zeros(vmax - vmin + 1, dtype=np.uint8)
+    for spec in specs:
+        lo = max(int(np.ceil(spec.threshold[0])), vmin)
+        hi = min(int(np.floor(spec.threshold[1])), vmax)
+        if lo <= hi:
+            lut[lo - vmin:hi - vmin + 1] = spec.label
+    return lut
+
+
+def label_map_from_ranges(
+    array: np.ndarray,
+    specs: Sequence[LabelSpec],
+    chunk_slices: int = THRESHOLD_CHUNK_SLICES,
+) -> np.ndarray:
+    """Карта меток uint8 (z, y, x) за один проход по объёму."""
+    out = np.zeros(array.shape, dtype=np.uint8)
+    if np.issubdtype(array.dtype, np.integer):
+        if array.dtype.itemsize <= 2:
+            info = np.iinfo(array.dtype)
+            vmin, vmax = int(info.min), int(info.max)
+        else:
+            vmin, vmax = int(array.min()), int(array.max())
+        if vmax - vmin < MAX_LUT_SIZE:
+            lut = _build_lut(specs, vmin, vmax)
+            for z0 in range(0, array.shape[0], chunk_slices):
+                chunk = array[z0:z0 + chunk_slices]
+                idx = chunk.astype(np.intp)
+                idx -= vmin
+                np.take(lut, idx, out=out[z0:z0 + chunk.shape[0]])
+            return out
+    # Вещественный объём: последовательное наложение диапазонов по чанкам
+    scratch = np.empty((chunk_slices,) + array.shape[1:], dtype=np.bool_)
+    for z0 in range(0, array.shape[0], chunk_slices):
+        chunk = array[z0:z0 + chunk_slices]
+        n = chunk.shape[0]
+        target = out[z0:z0 + n]
+        for spec in specs:
+            lo, hi = spec.threshold
+            sel = scratch[:n]
+            np.greater_equal(chunk, lo, out=sel)
+            sel &= chunk <= hi
+            target[sel] = spec.label
+    return out
+
+
+def segment_multilabel(
+    dicom_folder,
+    out_dir,
+    specs: Sequence[LabelSpec],
+    workers: Optional[int] = MULTILABEL_WORKERS,
+) -> Dict:
+    """
+    Один проход: загрузка (через кэш объёмов), карта меток, labels.nii.gz,
+    параллельно — <name>.glb на каждую метку. В результате "meshes" — trimesh-объекты по имени.
+    """
+    image, array, spacing, _, _ = load_dicom_series_cached(dicom_folder)
+    label_map = label_map_from_ranges(array, specs)
+    if not label_map.any():
+        raise EmptyMaskError("Segmentation mask is empty – nothing to export.")
+    os.makedirs(out_dir, exist_ok=True)
+    nifti_path = os.path.join(out_dir, "labels.nii.gz")
+
+    def _mesh(spec: LabelSpec):
+        mask = threshold_packed(label_map, (spec.label, spec.label))
+        if mask.is_empty:
+            return spec, None, 0
+        mesh = mask_to_mesh(mask, spacing)
+        mesh.export(os.path.join(out_dir, f"{spec.name}.glb"))
+        return spec, mesh, mask.voxel_count
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_mesh, spec) for spec in specs]
+        save_mask_nifti(label_map, image, nifti_path)
+        results = [f.result() for f in futures]
+
+    labels, meshes = {}, {}
+    for spec, mesh, voxels in results:
+        labels[spec.name] = {
+            "label": spec.label,
+            "threshold": list(spec.threshold),
+            "forbidden": spec.forbidden,
+            "voxels": int(voxels),
+            "gltf": os.path.join(out_dir, f"{spec.name}.glb") if mesh is not None else None,
+            "faces": int(len(mesh.faces)) if mesh is not None else 0,
+        }
+        if mesh is not None:
+            meshes[spec.name] = mesh
+    with open(os.path.join(out_dir, "labels.json"), "w", encoding="utf-8") as f:
+        json.dump(labels, f, ensure_ascii=False, indent=2)
+    return {
+        "nifti": nifti_path,
+        "labels": labels,
+        "meshes": meshes,
+        "forbidden_mesh_paths": [v["gltf"] for v in labels.values() if v["forbidden"] and v["gltf"]],
+    }
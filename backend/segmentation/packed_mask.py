@@ -0,0 +1,213 @@
+"""packed_mask.py
+====================
+Компактное представление бинарной маски: 1 бит на воксель.
+
+Маска хранится посрезово упакованной через ``np.packbits`` вместе с
+bounding box'ом и числом положительных вокселей в каждом срезе. Этого
+достаточно, чтобы:
+
+    • проверить пустоту маски без сканирования объёма (``is_empty``);
+    • пропускать пустые срезы при экспорте PNG (``slice_counts``);
+    • строить mesh только по ROI (``crop``), не распаковывая весь объём.
+
+``threshold_packed`` строит такую маску по объёму чанками по срезам, не
+выделяя полноразмерных булевых временных массивов.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+__all__ = [
+    "PackedMask",
+    "threshold_packed",
+    "clip_threshold",
+    "THRESHOLD_CHUNK_SLICES",
+]
+
+
+THRESHOLD_CHUNK_SLICES = 16
+
+BBox = Tuple[Tuple[int, int], Tuple[int, int], Tuple[int, int]]
+
+
+def clip_threshold(dtype: np.dtype, threshold) -> Optional[Tuple]:
+    """Приводит пороги к диапазону dtype; None, если диапазон пуст для этого типа."""
+    lo, hi = threshold
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        if lo > info.max or hi < info.min or lo > hi:
+            return None
+        lo, hi = max(int(np.ceil(lo)), info.min), min(int(np.floor(hi)), info.max)
+    return lo, hi
+
+
+def _threshold_chunk(chunk: np.ndarray, lo, hi, out: np.ndarray, scratch: np.ndarray) -> None:
+    np.greater_equal(chunk, lo, out=out)
+    np.less_equal(chunk, hi, out=scratch)
+    np.logical_and(out, scratch, out=out)
+
+
+@dataclass
+class PackedMask:
+    """Бит-упакованная маска (z, y, x) с bounding box'ом и заполненностью срезов."""
+
+    bits: np.ndarray            # uint8 (z, ceil(y*x/8))
+    shape: Tuple[int, int, int]
+    slice_counts: np.ndarray    # int64 (z,) — число вокселей маски в каждом срезе
+    bbox: Optional[BBox]        # ((z0, z1), (y0, y1), (x0, x1)), полуинтервалы; None для пустой
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def empty(cls, shape: Tuple[int, int, int]) -> "PackedMask":
+        nz, ny, nx = shape
+        return cls(
+            bits=np.zeros((nz, (ny * nx + 7) // 8), dtype=np.uint8),
+            shape=tuple(shape),
+            slice_counts=np.zeros(nz, dtype=np.int64),
+            bbox=None,
+        )
+
+    @classmethod
+    def from_dense(cls, mask: np.ndarray, chunk_slices: int = THRESHOLD_CHUNK_SLICES) -> "PackedMask":
+        packed = cls.empty(mask.shape)
+        for z0 in range(0, mask.shape[0], chunk_slices):
+            packed._write_chunk(z0, mask[z0:z0 + chunk_slices] != 0)
+        return packed
+
+    @classmethod
+    def from_roi(
+        cls,
+        shape: Tuple[int, int, int],
+        roi: np.ndarray,
+        offset: Tuple[int, int, int],
+        chunk_slices: int = THRESHOLD_CHUNK_SLICES,
+    ) -> "PackedMask":
+        """Обратная к ``crop``: вставляет плотную ROI по смещению в пустую маску формы shape."""
+        packed = cls.empty(shape)
+        z_off, y_off, x_off = offset
+        rz, ry, rx = roi.shape
+        buf = np.zeros((chunk_slices,) + tuple(shape[1:]), dtype=np.bool_)
+        for k0 in range(0, rz, chunk_slices):
+            part = roi[k0:k0 + chunk_slices]
+            n = part.shape[0]
+            buf[:n, y_off:y_off + ry, x_off:x_off + rx] = part != 0
+            packed._write_chunk(z_off + k0, buf[:n])
+        return packed
+
+    def _write_chunk(self, z0: int, chunk: np.ndarray) -> None:
+        """Упаковывает булев чанк срезов [z0, z0+len) и обновляет статистику."""
+        n = chunk.shape[0]
+        flat = chunk.reshape(n, -1)
+        self.bits[z0:z0 + n] = np.packbits(flat, axis=1)
+        counts = np.count_nonzero(flat, axis=1)
+        self.slice_counts[z0:z0 + n] = counts
+        if not counts.any():
+            return
+        zs = np.flatnonzero(counts)
+        ys = np.flatnonzero(chunk.any(axis=(0, 2)))
+        xs = np.flatnonzero(chunk.any(axis=(0, 1)))
+        box = ((z0 + zs[0], z0 + zs[-1] + 1), (ys[0], ys[-1] + 1), (xs[0], xs[-1] + 1))
+        if self.bbox is None:
+            self.bbox = tuple((int(a), int(b)) for a, b in box)
+        else:
+            self.bbox = tuple(
+                (int(min(a0, b0)), int(max(a1, b1))) for (a0, a1), (b0, b1) in zip(self.bbox, box)
+            )
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    @property
+    def is_empty(self) -> bool:
+        return self.bbox is None
+
+    @property
+    def voxel_count(self) -> int:
+        return int(self.slice_counts.sum())
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes + self.slice_counts.nbytes
+
+    def nonempty_slices(self) -> np.ndarray:
+        return np.flatnonzero(self.slice_counts)
+
+    def slice(self, z: int) -> np.ndarray:
+        """Распаковывает один срез в uint8 (y, x)."""
+        _, ny, nx = self.shape
+        return np.unpackbits(self.bits[z], count=ny * nx).reshape(ny, nx)
+
+    def plane(self, axis: int, index: int) -> np.ndarray:
+        """
+        Плоскость маски uint8 по оси axis (0 — аксиальная (y, x), 1 — корональная (z, x),
+        2 — сагиттальная (z, y)). Для осей 1 и 2 читаются только нужные байты каждого среза.
+        """
+        nz, ny, nx = self.shape
+        if axis == 0:
+            return self.slice(index)
+        if axis == 1:
+            start = index * nx
+            b0, b1 = start // 8, (start + nx + 7) // 8
+            bits = np.unpackbits(self.bits[:, b0:b1], axis=1)
+            return bits[:, start - b0 * 8:start - b0 * 8 + nx]
+        if axis == 2:
+            pos = np.arange(ny) * nx + index
+            return (self.bits[:, pos >> 3] >> (7 - (pos & 7)).astype(np.uint8)) & 1
+        raise ValueError(f"Invalid axis: {axis}")
+
+    def to_dense(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Полная uint8-маска (z, y, x); распаковка посрезово, без лишних копий.
+        out — переиспользуемый буфер формы shape: обнуляется целиком, в т.ч. для пустой маски.
+        """
+        nz, ny, nx = self.shape
+        if out is None:
+            out = np.zeros(self.shape, dtype=np.uint8)
+        else:
+            out[...] = 0
+        if self.is_empty:
+            return out
+        for z in range(*self.bbox[0]):
+            if self.slice_counts[z]:
+                out[z] = np.unpackbits(self.bits[z], count=ny * nx).reshape(ny, nx)
+        return out
+
+    def crop(self, pad: int = 0) -> Tuple[np.ndarray, Tuple[int, int, int]]:
+        """Плотная uint8-маска по bounding box'у (+pad, в пределах объёма) и её смещение (z, y, x)."""
+        if self.is_empty:
+            raise ValueError("Mask is empty")
+        _, ny, nx = self.shape
+        lo = [max(a - pad, 0) for a, _ in self.bbox]
+        hi = [min(b + pad, n) for (_, b), n in zip(self.bbox, self.shape)]
+        roi = np.zeros([h - l for l, h in zip(lo, hi)], dtype=np.uint8)
+        for z in range(self.bbox[0][0], self.bbox[0][1]):
+            if self.slice_counts[z]:
+                full = np.unpackbits(self.bits[z], count=ny * nx).reshape(ny, nx)
+                roi[z - lo[0]] = full[lo[1]:hi[1], lo[2]:hi[2]]
+        return roi, tuple(lo)
+
+
+def threshold_packed(array: np.ndarray, threshold, chunk_slices: int = THRESHOLD_CHUNK_SLICES) -> PackedMask:
+    """Пороговая сегментация сразу в PackedMask; временные буферы — только на один чанк."""
+    mask = PackedMask.empty(array.shape)
+    bounds = clip_threshold(array.dtype, threshold)
+    if bounds is None:
+        return mask
+    lo, hi = bounds
+    plane = array.shape[1:]
+    out = np.empty((chunk_slices,) + plane, dtype=np.bool_)
+    scratch = np.empty_like(out)
+    for z0 in range(0, array.shape[0], chunk_slices):
+        chunk = array[z0:z0 + chunk_slices]
+        n = chunk.shape[0]
+        _threshold_chunk(chunk, lo, hi, out[:n], scratch[:n])
+        mask._write_chunk(z0, out[:n])
+    return mask
@@ -0,0 +1,139 @@
+"""postprocess.py
+====================
+Постобработка маски между порогом и построением меша (этап C1 дорожной карты).
+
+    • заполнение полостей (``BinaryFillhole``);
+    • оставление наибольшей связной компоненты
+      (``ConnectedComponent`` + ``RelabelComponent``);
+    • сглаживание меша (Лаплас / Таубин).
+
+Морфологические фильтры SimpleITK многопоточные и запускаются только на
+bounding box'е маски с полем в 1 воксель (``PackedMask.crop``): вне bbox
+маска пуста, поэтому результат совпадает с обработкой полного объёма, а
+объём работы пропорционален органу, а не всему КТ. Сглаживание — разреженная
+матрица смежности вершин (scipy.sparse), одна итерация — одно умножение.
+
+Время каждого шага (мс) записывается в переданный словарь ``timings``.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import numpy as np
+import SimpleITK as sitk
+import trimesh
+from scipy import sparse
+
+from backend.segmentation.packed_mask import PackedMask
+
+__all__ = [
+    "postprocess_mask",
+    "fill_holes",
+    "largest_component",
+    "smooth_mesh",
+    "POSTPROCESS_THREADS",
+    "SMOOTH_ITERATIONS",
+]
+
+
+# Потоков на фильтр SimpleITK (0 — значение SimpleITK по умолчанию, обычно число CPU)
+POSTPROCESS_THREADS = int(os.environ.get("POSTPROCESS_THREADS", 0))
+SMOOTH_ITERATIONS = int(os.environ.get("POSTPROCESS_SMOOTH_ITERATIONS", 10))
+
+
+@contextmanager
+def _timed(timings: Optional[Dict[str, float]], step: str):
+    t0 = time.perf_counter()
+    yield
+    if timings is not None:
+        timings[step] = round((time.perf_counter() - t0) * 1000.0, 3)
+
+
+def _run(flt, image: sitk.Image) -> sitk.Image:
+    if POSTPROCESS_THREADS > 0:
+        flt.SetNumberOfThreads(POSTPROCESS_THREADS)
+    return flt.Execute(image)
+
+
+def fill_holes(image: sitk.Image) -> sitk.Image:
+    """Заполняет полости, не связанные с фоном на границе изображения."""
+    flt = sitk.BinaryFillholeImageFilter()
+    flt.SetForegroundValue(1)
+    flt.SetFullyConnected(False)
+    return _run(flt, image)
+
+
+def largest_component(image: sitk.Image) -> sitk.Image:
+    """Оставляет наибольшую связную компоненту (uint8 0/1)."""
+    labels = _run(sitk.ConnectedComponentImageFilter(), image)
+    relabel = sitk.RelabelComponentImageFilter()
+    relabel.SetSortByObjectSize(True)
+    labels = _run(relabel, labels)
+    return sitk.Cast(labels == 1, sitk.sitkUInt8)
+
+
+def postprocess_mask(
+    mask,
+    fill: bool = True,
+    keep_largest: bool = True,
+    timings: Optional[Dict[str, float]] = None,
+) -> PackedMask:
+    """
+    Заполнение полостей и наибольшая компонента на ROI маски (numpy или PackedMask).
+    Возвращает новую PackedMask той же формы; пустая маска возвращается как есть.
+    """
+    packed = mask if isinstance(mask, PackedMask) else PackedMask.from_dense(mask)
+    if packed.is_empty or not (fill or keep_largest):
+        return packed
+    with _timed(timings, "crop"):
+        roi, offset = packed.crop(pad=1)
+        image = sitk.GetImageFromArray(roi)
+    if fill:
+        with _timed(timings, "fill_holes"):
+            image = fill_holes(image)
+    if keep_largest:
+        with _timed(timings, "largest_component"):
+            image = largest_component(image)
+    with _timed(timings, "pack"):
+        result = PackedMask.from_roi(packed.shape, sitk.GetArrayViewFromImage(image), offset)
+    return result
+
+
+def _vertex_adjacency(mesh: trimesh.Trimesh) -> sparse.csr_matrix:
+    """Строчно-нормированная матрица смежности вершин: (W @ v) — среднее по соседям."""
+    n = len(mesh.vertices)
+    edges = mesh.edges_unique
+    rows = np.concatenate([edges[:, 0], edges[:, 1]])
+    cols = np.concatenate([edges[:, 1], edges[:, 0]])
+    adj = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+    degree = np.asarray(adj.sum(axis=1)).ravel()
+    degree[degree == 0] = 1.0
+    return sparse.diags(1.0 / degree) @ adj
+
+
+def smooth_mesh(
+    mesh: trimesh.Trimesh,
+    iterations: int = SMOOTH_ITERATIONS,
+    lamb: float = 0.5,
+    mu: Optional[float] = -0.53,
+    timings: Optional[Dict[str, float]] = None,
+) -> trimesh.Trimesh:
+    """
+    Сглаживание Лапласа по всем вершинам сразу (разреженное умножение на итерацию).
+    При mu != None — фильтр Таубина (шаг lamb, затем mu), почти без усадки объёма.
+    """
+    if iterations <= 0 or len(mesh.vertices) == 0:
+        return mesh
+    with _timed(timings, "smooth"):
+        weights = _vertex_adjacency(mesh)
+        verts = np.array(mesh.vertices, dtype=np.float64)
+        for _ in range(iterations):
+            verts += lamb * (weights @ verts - verts)
+            if mu is not None:
+                verts += mu * (weights @ verts - verts)
+        return trimesh.Trimesh(vertices=verts, faces=mesh.faces, process=False)
+
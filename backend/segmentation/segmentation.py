@@ -2,23 +2,50 @@
 # Здесь будут реализованы алгоритмы сегментации и 3D-реконструкции
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import SimpleITK as sitk
 from skimage import measure
 import trimesh
 
+from backend.dicom.parallel_reader import DICOM_READER, read_series_parallel
+from backend.export.glb_quantized import export_glb
+from backend.monitoring.metrics import stage
+from backend.segmentation.packed_mask import (
+    THRESHOLD_CHUNK_SLICES,
+    PackedMask,
+    clip_threshold,
+    threshold_packed,
+)
+from backend.segmentation.mask_slices import MASK_PNG_MODE, get_mask_slice_cache, write_mask_pngs
+from backend.segmentation.ml_inference import get_segmenter
+from backend.segmentation.postprocess import postprocess_mask, smooth_mesh
+from backend.segmentation.volume_cache import VolumeGeometry, get_volume_cache
+
+# Кэш декодированных объёмов (память + диск); отключается VOLUME_CACHE_ENABLED=0
+VOLUME_CACHE_ENABLED = os.environ.get("VOLUME_CACHE_ENABLED", "1") != "0"
+# Бюджет граней для грубого превью (GLB), отдаваемого до окончания полной сегментации
+PREVIEW_FACE_BUDGET = int(os.environ.get("PREVIEW_FACE_BUDGET", 20000))
+
 class EmptyMaskError(ValueError):
     """Raised when a segmentation mask is completely empty (all zeros)."""
 
-def load_dicom_series(dicom_folder):
+@stage("dicom_load")
+def load_dicom_series(dicom_folder, reader_kind=None):
     """
     Загружает серию DICOM в 3D-массив (numpy) и возвращает image, array, spacing, origin, direction
+    reader_kind: "sitk" (ImageSeriesReader) или "parallel" (многопоточное декодирование
+    в заранее выделенный массив, image заменяется на VolumeGeometry). По умолчанию — DICOM_READER.
     """
+    dicom_folder = str(dicom_folder)
     reader = sitk.ImageSeriesReader()
     series_IDs = reader.GetGDCMSeriesIDs(dicom_folder)
     if not series_IDs:
         raise FileNotFoundError(f"Нет DICOM-серий в папке: {dicom_folder}")
     series_file_names = reader.GetGDCMSeriesFileNames(dicom_folder, series_IDs[0])
+    if (reader_kind or DICOM_READER) == "parallel":
+        array, spacing, origin, direction = read_series_parallel(series_file_names)
+        return VolumeGeometry(spacing, origin, direction), array, spacing, origin, direction
     reader.SetFileNames(series_file_names)
     image = reader.Execute()
     array = sitk.GetArrayFromImage(image)  # (z, y, x)
@@ -27,87 +54,215 @@ def load_dicom_series(dicom_folder):
     direction = image.GetDirection()
     return image, array, spacing, origin, direction
 
-def simple_threshold_segmentation(array, threshold=(30, 300)):
+def load_dicom_series_cached(dicom_folder):
+    """
+    То же, что load_dicom_series, но через кэш объёмов: повторная загрузка той же серии
+    не декодирует DICOM. Вместо sitk.Image возвращает VolumeGeometry (годится как reference).
+    """
+    if not VOLUME_CACHE_ENABLED:
+        return load_dicom_series(dicom_folder)
+    return get_volume_cache().load(dicom_folder, load_dicom_series)
+
+def threshold_into(array, threshold=(30, 300), out=None, chunk_slices=THRESHOLD_CHUNK_SLICES):
+    """
+    Пороговая сегментация чанками по срезам в заранее выделенный uint8-массив out.
+    Временные буферы — только на один чанк, без полноразмерных булевых массивов и astype.
+    """
+    if out is None:
+        out = np.empty(array.shape, dtype=np.uint8)
+    bounds = clip_threshold(array.dtype, threshold)
+    if bounds is None:
+        out[...] = 0
+        return out
+    lo, hi = bounds
+    scratch = np.empty((chunk_slices,) + array.shape[1:], dtype=np.bool_)
+    for z0 in range(0, array.shape[0], chunk_slices):
+        chunk = array[z0:z0 + chunk_slices]
+        n = chunk.shape[0]
+        target = out[z0:z0 + n].view(np.bool_)
+        np.greater_equal(chunk, lo, out=target)
+        np.less_equal(chunk, hi, out=scratch[:n])
+        np.logical_and(target, scratch[:n], out=target)
+    return out
+
+@stage("threshold")
+def simple_threshold_segmentation(array, threshold=(30, 300), packed=False):
     """
     Простая пороговая сегментация (например, для почки)
-    Возвращает бинарную маску (numpy array)
+    Возвращает бинарную маску (numpy array uint8) или PackedMask при packed=True
     """
-    mask = np.logical_and(array >= threshold[0], array <= threshold[1])
-    return mask.astype(np.uint8)
+    if packed:
+        return threshold_packed(array, threshold)
+    return threshold_into(array, threshold)
 
+@stage("nifti")
 def save_mask_nifti(mask, reference_image, out_path):
     """
-    Сохраняет маску в формате NIfTI, используя reference_image для геометрии
+    Сохраняет маску в формате NIfTI, используя reference_image (sitk.Image или VolumeGeometry) для геометрии
     """
+    if isinstance(mask, PackedMask):
+        mask = mask.to_dense()
     mask_img = sitk.GetImageFromArray(mask)
-    mask_img.CopyInformation(reference_image)
+    mask_img.SetSpacing(reference_image.GetSpacing())
+    mask_img.SetOrigin(reference_image.GetOrigin())
+    mask_img.SetDirection(reference_image.GetDirection())
     sitk.WriteImage(mask_img, out_path)
     return out_path
 
-def save_mask_png(mask, out_dir):
+@stage("png")
+def save_mask_png(mask, out_dir, lazy=None):
     """
-    Сохраняет каждый срез маски как PNG в out_dir
+    Сохраняет непустые срезы маски (numpy или PackedMask) как PNG в out_dir пулом потоков
+    и index.json со списком срезов; отсутствующий в индексе срез пуст.
+    lazy (по умолчанию MASK_PNG_MODE == "lazy"): PNG не пишутся, срезы отдаются по запросу.
     """
-    from PIL import Image
-    os.makedirs(out_dir, exist_ok=True)
-    for i, slice_ in enumerate(mask):
-        img = Image.fromarray((slice_ * 255).astype(np.uint8))
-        img.save(os.path.join(out_dir, f"mask_{i:03d}.png"))
+    packed = mask if isinstance(mask, PackedMask) else PackedMask.from_dense(mask)
+    if lazy is None:
+        lazy = MASK_PNG_MODE == "lazy"
+    return write_mask_pngs(packed, out_dir, lazy=lazy)
 
 def _ensure_non_empty(mask):
     """Raise EmptyMaskError if mask has no positive voxels."""
-    if not np.any(mask):
+    empty = mask.is_empty if isinstance(mask, PackedMask) else not np.any(mask)
+    if empty:
         raise EmptyMaskError("Segmentation mask is empty – nothing to export.")
 
+@stage("marching_cubes")
+def mask_to_mesh(mask, spacing):
+    """
+    Marching cubes по бинарной маске (numpy или PackedMask) -> trimesh.Trimesh.
+    Считается только по bounding box'у маски (+1 воксель), вершины сдвигаются обратно.
+    """
+    _ensure_non_empty(mask)
+    packed = mask if isinstance(mask, PackedMask) else PackedMask.from_dense(mask)
+    roi, offset = packed.crop(pad=1)
+    verts, faces, normals, values = measure.marching_cubes(roi, level=0.5, spacing=spacing)
+    verts += np.asarray(offset, dtype=verts.dtype) * np.asarray(spacing, dtype=verts.dtype)
+    return trimesh.Trimesh(vertices=verts, faces=faces, vertex_normals=normals, process=True)
+
 def mask_to_stl(mask, spacing, out_path):
     """
     Преобразует бинарную маску (3D numpy) в STL-модель через marching cubes
     """
-    _ensure_non_empty(mask)
-    verts, faces, normals, values = measure.marching_cubes(mask, level=0.5, spacing=spacing)
-    mesh = trimesh.Trimesh(vertices=verts, faces=faces, vertex_normals=normals, process=True)
-    mesh.export(out_path)
+    mask_to_mesh(mask, spacing).export(out_path)
     return out_path
 
-def mask_to_gltf(mask, spacing, out_path):
+def mask_to_gltf(mask, spacing, out_path, quantize=None):
     """
     Преобразует бинарную маску (3D numpy) в GLTF-модель через marching cubes
+    quantize: компактный GLB (KHR_mesh_quantization); по умолчанию GLB_QUANTIZE
     """
-    _ensure_non_empty(mask)
-    verts, faces, normals, values = measure.marching_cubes(mask, level=0.5, spacing=spacing)
-    mesh = trimesh.Trimesh(vertices=verts, faces=faces, vertex_normals=normals, process=True)
-    mesh.export(out_path)
+    export_glb(mask_to_mesh(mask, spacing), out_path, quantize=quantize)
     return out_path
 
+def decimate_mesh(mesh, face_count):
+    """
+    Квадрик-децимация до face_count граней (trimesh + fast_simplification).
+    Если меш уже меньше бюджета — возвращает исходный меш; сбой децимации (в т.ч. нет
+    fast_simplification) — RuntimeError, а не молча недецимированный LOD сверх бюджета.
+    """
+    if face_count is None or len(mesh.faces) <= face_count:
+        return mesh
+    try:
+        return mesh.simplify_quadric_decimation(face_count=int(face_count))
+    except Exception as exc:  # noqa: BLE001
+        raise RuntimeError(f"Decimation failed: {exc}") from exc
+
+def segment_preview(array, spacing, out_dir, threshold=(30, 300), factor=2, face_count=PREVIEW_FACE_BUDGET):
+    """
+    Грубое превью: сегментация объёма, прореженного в factor раз по каждой оси (view, без копии),
+    marching cubes и децимация. Возвращает путь к preview.glb (None, если превью пустое).
+    """
+    small = array[::factor, ::factor, ::factor]
+    small_spacing = tuple(float(sp) * factor for sp in spacing)
+    mask = threshold_packed(small, threshold)
+    result = {"preview_gltf": None, "factor": factor, "faces": 0}
+    if mask.is_empty:
+        return result
+    mesh = decimate_mesh(mask_to_mesh(mask, small_spacing), face_count)
+    os.makedirs(out_dir, exist_ok=True)
+    preview_path = os.path.join(out_dir, "preview.glb")
+    mesh.export(preview_path)
+    result.update(preview_gltf=preview_path, faces=int(len(mesh.faces)))
+    return result
+
 def segment_and_export(dicom_folder, out_dir, threshold=(30, 300)):
     """
     Полный пайплайн: загрузка DICOM, сегментация, экспорт маски (NIfTI, PNG)
     """
-    image, array, spacing, origin, direction = load_dicom_series(dicom_folder)
-    mask = simple_threshold_segmentation(array, threshold)
+    image, array, spacing, origin, direction = load_dicom_series_cached(dicom_folder)
+    mask = simple_threshold_segmentation(array, threshold, packed=True)
     os.makedirs(out_dir, exist_ok=True)
     nifti_path = os.path.join(out_dir, "mask.nii.gz")
     save_mask_nifti(mask, image, nifti_path)
     save_mask_png(mask, os.path.join(out_dir, "mask_png"))
+    get_mask_slice_cache().register(out_dir, mask)
     return nifti_path
 
-def segment_and_export_full(dicom_folder, out_dir, threshold=(30, 300)):
+def segment_and_export_full(dicom_folder, out_dir, threshold=(30, 300), preview_factor=None, on_preview=None,
+                            postprocess=False, segmenter=None, lod_budgets=None, mesh_chunks=None):
     """
     Полный пайплайн: загрузка DICOM, сегментация, экспорт маски (NIfTI, PNG), STL, GLTF
+    preview_factor (2 или 4): сначала строится грубое превью на прореженном объёме и передаётся
+    в on_preview(preview) — клиент показывает его, пока идёт полное разрешение.
+    postprocess: заполнение полостей + наибольшая компонента (на ROI маски) и сглаживание меша;
+    время шагов (мс) возвращается в "postprocess_timings".
+    segmenter: Segmenter из ml_inference (по умолчанию — get_segmenter(), т.е. SEGMENTER, порог threshold).
+    lod_budgets: бюджеты граней mask_lod{i}.glb (по умолчанию LOD_FACE_BUDGETS; [] — без LOD),
+    уровни строятся параллельно с экспортом STL/GLB и возвращаются в "lods".
+    mesh_chunks (по умолчанию MESH_CHUNKS): октодерево GLB-чанков в out_dir/chunks для прогрессивной
+    загрузки; манифест обновляется по мере готовности чанков, путь к нему — в "chunk_manifest".
     """
-    image, array, spacing, origin, direction = load_dicom_series(dicom_folder)
-    mask = simple_threshold_segmentation(array, threshold)
+    # mesh_lod и mesh_chunks импортируют этот модуль — импорт здесь, а не на уровне модуля
+    from backend.segmentation.mesh_chunks import MESH_CHUNKS, build_mesh_chunks
+    from backend.segmentation.mesh_lod import LOD_FACE_BUDGETS, submit_lod_chain
+    image, array, spacing, origin, direction = load_dicom_series_cached(dicom_folder)
+    preview = None
+    if preview_factor:
+        preview = segment_preview(array, spacing, out_dir, threshold, factor=preview_factor)
+        if on_preview is not None:
+            on_preview(preview)
+    # Бит-упакованная маска: 1 бит/воксель + bbox, без полноразмерных временных массивов
+    if segmenter is None:
+        segmenter = get_segmenter(threshold=threshold)
+    mask = segmenter.segment(array)
+    _ensure_non_empty(mask)
+    timings = {}
+    if postprocess:
+        mask = postprocess_mask(mask, timings=timings)
     os.makedirs(out_dir, exist_ok=True)
     nifti_path = os.path.join(out_dir, "mask.nii.gz")
     save_mask_nifti(mask, image, nifti_path)
     save_mask_png(mask, os.path.join(out_dir, "mask_png"))
+    get_mask_slice_cache().register(out_dir, mask)
+    # Один marching cubes на оба формата
+    mesh = mask_to_mesh(mask, spacing)
+    if postprocess:
+        mesh = smooth_mesh(mesh, timings=timings)
+    budgets = LOD_FACE_BUDGETS if lod_budgets is None else lod_budgets
     stl_path = os.path.join(out_dir, "mask.stl")
-    mask_to_stl(mask, spacing, stl_path)
     gltf_path = os.path.join(out_dir, "mask.glb")
-    mask_to_gltf(mask, spacing, gltf_path)
-    return {
+    chunked = MESH_CHUNKS if mesh_chunks is None else mesh_chunks
+    with stage("export"), ThreadPoolExecutor(max_workers=len(budgets) + 2) as pool:
+        # чанки первыми: грубый уровень должен появиться у клиента как можно раньше
+        chunks_future = pool.submit(build_mesh_chunks, mesh, out_dir) if chunked else None
+        lod_futures = submit_lod_chain(pool, mesh, out_dir, budgets)
+        mesh.export(stl_path)
+        export_glb(mesh, gltf_path)
+        lods = [f.result() for f in lod_futures]
+        if chunks_future is not None:
+            chunks_future.result()
+    result = {
         "nifti": nifti_path,
         "stl": stl_path,
         "gltf": gltf_path,
-        "mask_png_dir": os.path.join(out_dir, "mask_png")
+        "mask_png_dir": os.path.join(out_dir, "mask_png"),
+        "lods": lods,
     }
+    if preview is not None:
+        result["preview_gltf"] = preview["preview_gltf"]
+    if chunked:
+        result["chunk_manifest"] = os.path.join(out_dir, "chunks", "manifest.json")
+    if postprocess:
+        result["postprocess_timings"] = timings
+    return result
@@ -0,0 +1,266 @@
+"""volume_cache.py
+====================
+Двухуровневый кэш загруженных DICOM-объёмов.
+
+Повторная сегментация той же серии (подбор порогов) не должна заново
+декодировать каждый срез. Кэш хранит:
+
+    • в памяти — ограниченный по байтам LRU уже декодированных массивов;
+    • на диске — сырые ``.npy`` (int16, если значения помещаются) и JSON с
+      геометрией (spacing/origin/direction); читаются через
+      ``np.load(mmap_mode='r')``, т.е. без копирования в память процесса.
+
+Ключ — SeriesInstanceUID + отпечаток файлов серии (имена, размеры, mtime),
+так что изменение любого файла автоматически инвалидирует запись.
+Массивы из кэша возвращаются только для чтения.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import SimpleITK as sitk
+
+from backend.monitoring.metrics import register_cache
+
+__all__ = [
+    "VolumeGeometry",
+    "VolumeCache",
+    "series_fingerprint",
+    "get_volume_cache",
+]
+
+
+VOLUME_CACHE_DIR = Path(os.environ.get("VOLUME_CACHE_DIR", Path("data") / "cache" / "volumes"))
+VOLUME_CACHE_MEMORY_BYTES = int(os.environ.get("VOLUME_CACHE_MEMORY_BYTES", 2 * 1024 ** 3))
+VOLUME_CACHE_DISK_BYTES = int(os.environ.get("VOLUME_CACHE_DISK_BYTES", 20 * 1024 ** 3))
+
+
+class VolumeGeometry(NamedTuple):
+    """Геометрия объёма; повторяет геттеры ``sitk.Image``, чтобы подменять его как reference."""
+
+    spacing: Tuple[float, float, float]
+    origin: Tuple[float, float, float]
+    direction: Tuple[float, ...]
+
+    def GetSpacing(self):
+        return self.spacing
+
+    def GetOrigin(self):
+        return self.origin
+
+    def GetDirection(self):
+        return self.direction
+
+
+def series_fingerprint(dicom_folder: os.PathLike) -> Tuple[str, Sequence[str], str]:
+    """Возвращает (series_uid, файлы серии, ключ кэша) без декодирования пикселей."""
+    reader = sitk.ImageSeriesReader()
+    series_ids = reader.GetGDCMSeriesIDs(str(dicom_folder))
+    if not series_ids:
+        raise FileNotFoundError(f"Нет DICOM-серий в папке: {dicom_folder}")
+    series_uid = series_ids[0]
+    files = reader.GetGDCMSeriesFileNames(str(dicom_folder), series_uid)
+    h = hashlib.sha256(series_uid.encode("utf-8"))
+    for fp in files:
+        st = os.stat(fp)
+        h.update(f"\n{os.path.basename(fp)}:{st.st_size}:{st.st_mtime_ns}".encode("utf-8"))
+    return series_uid, files, h.hexdigest()[:32]
+
+
+def _to_storage_dtype(array: np.ndarray) -> np.ndarray:
+    """Приводит целочисленный объём к int16, если значения помещаются (типичный КТ в HU)."""
+    if array.dtype == np.int16 or not np.issubdtype(array.dtype, np.integer):
+        return array
+    info = np.iinfo(np.int16)
+    if array.size and (array.min() < info.min or array.max() > info.max):
+        return array
+    return array.astype(np.int16)
+
+
+class VolumeCache:
+    """LRU в памяти + memory-mapped ``.npy`` на диске."""
+
+    def __init__(
+        self,
+        root: os.PathLike = VOLUME_CACHE_DIR,
+        memory_bytes: int = VOLUME_CACHE_MEMORY_BYTES,
+        disk_bytes: int = VOLUME_CACHE_DISK_BYTES,
+    ):
+        self.root = Path(root)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory: "OrderedDict[str, Tuple[np.ndarray, VolumeGeometry]]" = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, list] = {}  # key -> [lock, users]; удаляется, когда users == 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    # ------------------------------------------------------------------
+    # Memory tier
+    # ------------------------------------------------------------------
+
+    def _memory_get(self, key: str):
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                self._memory.move_to_end(key)
+            return item
+
+    def _memory_put(self, key: str, array: np.ndarray, geometry: VolumeGeometry) -> None:
+        if array.nbytes > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_used -= old[0].nbytes
+            self._memory[key] = (array, geometry)
+            self._memory_used += array.nbytes
+            while self._memory_used > self.memory_bytes:
+                _, (evicted, _) = self._memory.popitem(last=False)
+                self._memory_used -= evicted.nbytes
+
+    # ------------------------------------------------------------------
+    # Disk tier
+    # ------------------------------------------------------------------
+
+    def _disk_paths(self, key: str) -> Tuple[Path, Path]:
+        return self.root / f"{key}.npy", self.root / f"{key}.json"
+
+    def _disk_get(self, key: str):
+        npy_path, meta_path = self._disk_paths(key)
+        if not (npy_path.exists() and meta_path.exists()):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        array = np.load(npy_path, mmap_mode="r")
+        os.utime(meta_path)
+        geometry = VolumeGeometry(tuple(meta["spacing"]), tuple(meta["origin"]), tuple(meta["direction"]))
+        return array, geometry
+
+    def _disk_put(self, key: str, array: np.ndarray, geometry: VolumeGeometry, series_uid: str) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        npy_path, meta_path = self._disk_paths(key)
+        tmp = self.root / f".{key}.{uuid.uuid4().hex[:8]}.npy"
+        np.save(tmp, array)
+        os.replace(tmp, npy_path)
+        meta = {
+            "series_uid": series_uid,
+            "shape": list(array.shape),
+            "dtype": str(array.dtype),
+            "spacing": list(geometry.spacing),
+            "origin": list(geometry.origin),
+            "direction": list(geometry.direction),
+        }
+        tmp_meta = meta_path.with_suffix(".json.tmp")
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, meta_path)
+        self._disk_evict(protect=key)
+
+    def _disk_evict(self, protect: str) -> None:
+        entries = []
+        for meta_path in self.root.glob("*.json"):
+            key = meta_path.stem
+            npy_path = self.root / f"{key}.npy"
+            if not npy_path.exists():
+                continue
+            entries.append((meta_path.stat().st_mtime, key, npy_path.stat().st_size))
+        entries.sort()
+        total = sum(size for _, _, size in entries)
+        for _, key, size in entries:
+            if total <= self.disk_bytes:
+                break
+            if key == protect:
+                continue
+            for path in self._disk_paths(key):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            total -= size
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _key_lock(self, key: str) -> Iterator[None]:
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[key]
+
+    def load(self, dicom_folder: os.PathLike, loader: Callable) -> Tuple[VolumeGeometry, np.ndarray, tuple, tuple, tuple]:
+        """Возвращает (geometry, array, spacing, origin, direction) — как ``load_dicom_series``.
+
+        *loader(dicom_folder)* вызывается только при промахе в обоих уровнях.
+        """
+        series_uid, _, key = series_fingerprint(dicom_folder)
+        with self._key_lock(key):
+            item = self._memory_get(key)
+            if item is not None:
+                self.stats["memory_hits"] += 1
+            else:
+                item = self._disk_get(key)
+                if item is not None:
+                    self.stats["disk_hits"] += 1
+                else:
+                    self.stats["misses"] += 1
+                    _, array, spacing, origin, direction = loader(dicom_folder)
+                    array = _to_storage_dtype(array)
+                    array.flags.writeable = False
+                    geometry = VolumeGeometry(tuple(spacing), tuple(origin), tuple(direction))
+                    self._disk_put(key, array, geometry, series_uid)
+                    item = (array, geometry)
+                self._memory_put(key, *item)
+        array, geometry = item
+        return geometry, array, geometry.spacing, geometry.origin, geometry.direction
+
+    def key_for(self, dicom_folder: os.PathLike) -> str:
+        return series_fingerprint(dicom_folder)[2]
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+
+
+_default_cache: Optional[VolumeCache] = None
+_default_lock = threading.Lock()
+
+
+def get_volume_cache() -> VolumeCache:
+    """Общий экземпляр кэша объёмов (создаётся лениво)."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = VolumeCache()
+        return _default_cache
+
+
+def _cache_counts() -> Optional[Tuple[int, int]]:
+    """(попадания, промахи) общего экземпляра для /metrics; None, пока он не создан."""
+    cache = _default_cache
+    if cache is None:
+        return None
+    return cache.stats["memory_hits"] + cache.stats["disk_hits"], cache.stats["misses"]
+
+
+register_cache("volume", _cache_counts)
@@ -0,0 +1,28 @@
+"""Shared pytest fixtures for the backend test-suite."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from backend.benchmarks.synthetic import write_ct_series
+
+
+@pytest.fixture
+def make_ct_series(tmp_path):
+    """Factory fixture: ``make_ct_series(volume, name="series", **kwargs) -> Path``."""
+
+    def _make(volume: np.ndarray, name: str = "series", **kwargs) -> Path:
+        return write_ct_series(tmp_path / name, volume, **kwargs)
+
+    return _make
+
+
+@pytest.fixture
+def phantom_volume():
+    """Small CT-like volume: air background with a 'kidney' ellipsoid of ~150 HU."""
+    z, y, x = np.mgrid[0:12, 0:32, 0:32]
+    vol = np.full((12, 32, 32), -1000, dtype=np.int16)
+    inside = ((z - 6) / 4.5) ** 2 + ((y - 16) / 10) ** 2 + ((x - 16) / 7) ** 2 <= 1
+    vol[inside] = 150
+    return vol
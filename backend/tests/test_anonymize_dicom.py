@@ -53,3 +53,73 @@ def test_anonymize_file(tmp_path: Path) -> None:
 
     # PatientName replaced
     assert ds.PatientName == "ANONYMIZED"
+
+
+def _make_series(tmp_dir: Path, n: int = 4) -> Path:
+    """A small series: shared Study/Series UIDs, distinct SOP UIDs, 64x64 pixel data."""
+    import numpy as np
+
+    series_dir = tmp_dir / "raw" / "patient01"
+    series_dir.mkdir(parents=True)
+    for i in range(n):
+        path = series_dir / f"slice_{i:03d}.dcm"
+        meta = Dataset()
+        meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+        meta.MediaStorageSOPInstanceUID = f"1.2.3.4.5.6.7.{i}"
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds = FileDataset(str(path), {}, file_meta=meta, preamble=b"\0" * 128)
+        ds.PatientName = "John^Doe"
+        ds.PatientID = "12345"
+        ds.SOPClassUID = meta.MediaStorageSOPClassUID
+        ds.StudyInstanceUID = "1.2.3.4.5"
+        ds.SeriesInstanceUID = "1.2.3.4.5.6"
+        ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+        ds.FrameOfReferenceUID = "1.2.3.4.9"
+        ds.InstanceNumber = i + 1
+        ds.Rows = ds.Columns = 64
+        ds.BitsAllocated = ds.BitsStored = 16
+        ds.HighBit = 15
+        ds.PixelRepresentation = 1
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        ds.PixelData = (np.arange(64 * 64, dtype=np.int16) + i).tobytes()
+        ds.save_as(path, enforce_file_format=True)
+    return tmp_dir / "raw"
+
+
+def test_anonymize_series_keeps_series_grouping(tmp_path: Path) -> None:
+    from backend.dataset_tools.anonymize_dicom import anonymize_series
+
+    raw = _make_series(tmp_path)
+    report = anonymize_series(raw, tmp_path / "anon", workers=2, salt="secret", progress=False)
+    assert report["files"] == report["anonymized"] == 4 and not report["failed"]
+    assert report["files_per_s"] > 0 and report["bytes"] > 0
+
+    src_files = sorted(raw.rglob("*.dcm"))
+    out = [pydicom.dcmread(tmp_path / "anon" / f.relative_to(raw)) for f in src_files]
+    assert len({ds.SeriesInstanceUID for ds in out}) == 1
+    assert len({ds.StudyInstanceUID for ds in out}) == 1
+    assert len({ds.SOPInstanceUID for ds in out}) == 4
+    assert out[0].SeriesInstanceUID != "1.2.3.4.5.6" and out[0].FrameOfReferenceUID != "1.2.3.4.9"
+    for src, ds in zip(src_files, out):
+        assert ds.file_meta.MediaStorageSOPInstanceUID == ds.SOPInstanceUID
+        assert ds.SOPClassUID == "1.2.840.10008.5.1.4.1.1.2"
+        assert "PatientID" not in ds
+        assert ds.PixelData == pydicom.dcmread(src).PixelData  # copied through byte for byte
+
+    # the mapping is deterministic for a given salt, even across runs and processes
+    anonymize_series(raw, tmp_path / "anon2", workers=1, salt="secret", progress=False)
+    again = pydicom.dcmread(tmp_path / "anon2" / src_files[0].relative_to(raw))
+    assert again.SOPInstanceUID == out[0].SOPInstanceUID
+    anonymize_series(raw, tmp_path / "anon3", workers=1, salt="other", progress=False)
+    other = pydicom.dcmread(tmp_path / "anon3" / src_files[0].relative_to(raw))
+    assert other.SOPInstanceUID != out[0].SOPInstanceUID
+
+
+def test_uid_remap_does_not_load_deferred_pixels(tmp_path: Path) -> None:
+    from backend.dataset_tools.anonymize_dicom import remap_uids
+
+    path = next(_make_series(tmp_path, n=1).rglob("*.dcm"))
+    ds = pydicom.dcmread(path, defer_size=1024)  # the test slice is 8 KB
+    remap_uids(ds, "secret")
+    assert ds.get_item(0x7FE00010, keep_deferred=True).value is None
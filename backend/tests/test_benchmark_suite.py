@@ -0,0 +1,69 @@
+"""Synthetic phantoms and the benchmark suite with its JSON baseline."""
+
+import json
+
+import numpy as np
+import pytest
+
+from backend.benchmarks.suite import CASES, compare, measure, run
+from backend.benchmarks.synthetic import Organ, Phantom
+from backend.dicom.dicom_service import collect_series
+from backend.segmentation.segmentation import load_dicom_series
+
+
+def test_phantom_organ_volumes_match_voxels():
+    phantom = Phantom.abdomen((64, 128, 128), spacing=(1.0, 1.0, 1.5))
+    volume = phantom.volume()
+    voxel = float(np.prod(phantom.spacing))
+    spleen = next(o for o in phantom.organs if o.name == "spleen")
+    assert spleen.volume_mm3 == pytest.approx(4 / 3 * np.pi * np.prod(spleen.radii))
+    assert (volume == spleen.hu).sum() * voxel == pytest.approx(spleen.volume_mm3, rel=0.01)
+    # Body fat stays outside the default 30..300 HU threshold
+    assert set(np.unique(volume)) == {-1000, -100, 120, 150}
+
+
+def test_phantom_series_roundtrip(tmp_path):
+    phantom = Phantom((6, 20, 24), spacing=(2.0, 2.5, 4.0), organs=[Organ("o", (24, 25, 12), (10, 12, 8))],
+                      noise=15, seed=3)
+    series = phantom.write_series(tmp_path / "series")
+    assert len(collect_series(series)) == 6
+    _, array, spacing, _, _ = load_dicom_series(series, reader_kind="parallel")
+    assert array.dtype == np.int16  # 12-bit slices keep HU in int16
+    np.testing.assert_array_equal(array, phantom.volume())
+    assert spacing == pytest.approx((2.0, 2.5, 4.0))
+
+
+def test_suite_runs_all_cases(tmp_path):
+    results = run("tiny", rounds=1, workdir=tmp_path, progress=False)
+    assert set(results["cases"]) == set(CASES)
+    json.dumps(results)  # the baseline must be JSON-serializable
+    for name, res in results["cases"].items():
+        if "skipped" in res:
+            continue
+        assert res["rounds"] == 1 and res["min"] <= res["median"], name
+    assert results["cases"]["header_scan"]["metrics"]["files"] == results["meta"]["shape"][0]
+    assert results["cases"]["threshold"]["metrics"]["volume_error"] < 0.05
+    assert list(tmp_path.iterdir()) == []  # the series is removed
+
+
+def test_measure_stats():
+    calls = []
+    res = measure(lambda: calls.append(1) or {"n": len(calls)}, rounds=4, warmup=1)
+    assert len(calls) == 5 and res["rounds"] == 4 and res["metrics"] == {"n": 5}
+    assert res["min"] <= res["median"] <= max(res["mean"], res["median"])
+
+
+def test_compare_flags_regressions():
+    def result(**medians):
+        return {"meta": {"size": "tiny"}, "cases": {k: {"median": v} for k, v in medians.items()}}
+
+    baseline = result(load=1.0, threshold=1.0, mesh=1.0, gone=1.0)
+    baseline["cases"]["mesh"]["threshold"] = 0.5
+    current = result(load=1.2, threshold=1.3, mesh=1.4, new=1.0)
+    current["cases"]["icp"] = {"skipped": "no open3d"}
+    status = {row["case"]: row["status"] for row in compare(current, baseline, threshold=0.25)}
+    assert status == {"load": "ok", "threshold": "regression", "mesh": "ok", "new": "new",
+                      "icp": "skipped", "gone": "missing"}
+    assert compare(result(load=0.5), result(load=1.0))[0]["status"] == "improved"
+    with pytest.raises(ValueError):
+        compare(current, {"meta": {"size": "small"}, "cases": {}})
@@ -0,0 +1,102 @@
+"""Chunked compressed volume store and patch sampling."""
+
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from backend.dataset_tools.chunked_volume import ChunkedVolume, PatchDataset, write_chunked
+from backend.dataset_tools.preprocess_volume import preprocess_batch, read_manifest
+
+
+@pytest.fixture
+def volume():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(37, 50, 45)).astype(np.float32)
+
+
+def test_roundtrip_and_partial_reads(volume, tmp_path):
+    index = write_chunked(volume, tmp_path / "v.cvol", chunks=(16, 16, 16))
+    assert len(index["offsets"]) == 3 * 4 * 3
+    with ChunkedVolume(tmp_path / "v.cvol") as vol:
+        assert vol.shape == volume.shape and vol.dtype == np.float32
+        np.testing.assert_array_equal(vol.to_numpy(), volume)
+        np.testing.assert_array_equal(vol[5:21, 40:, 3:4], volume[5:21, 40:, 3:4])
+        # Boxes hanging over the border are clipped to the volume
+        np.testing.assert_array_equal(vol.read((30, -4, 40), (16, 10, 16)), volume[30:, 0:6, 40:])
+
+
+def test_reads_only_overlapping_chunks(volume, tmp_path):
+    write_chunked(volume, tmp_path / "v.cvol", chunks=(16, 16, 16))
+    vol = ChunkedVolume(tmp_path / "v.cvol", cache_bytes=0)
+    vol.read((0, 0, 0), (16, 16, 16))
+    assert vol.chunks_read == 1
+    vol.read((8, 8, 8), (16, 16, 16))
+    assert vol.chunks_read == 1 + 8
+    vol.close()
+
+
+def test_transform_sets_stored_dtype(tmp_path):
+    src = np.arange(20 * 8 * 8, dtype=np.int16).reshape(20, 8, 8)
+    write_chunked(src, tmp_path / "v.cvol", chunks=(8, 8, 8), transform=lambda slab: slab.astype(np.float32) / 2)
+    with ChunkedVolume(tmp_path / "v.cvol") as vol:
+        assert vol.dtype == np.float32
+        np.testing.assert_array_equal(vol.to_numpy(), src / 2)
+
+
+def test_patch_dataset_deterministic_and_parallel(volume, tmp_path):
+    paths = [tmp_path / "a.cvol", tmp_path / "b.cvol"]
+    write_chunked(volume, paths[0], chunks=(16, 16, 16))
+    write_chunked(volume[::-1].copy(), paths[1], chunks=(16, 16, 16))
+    ds = PatchDataset(paths, patch=(24, 24, 24), samples=12, seed=3)
+    v, (z, y, x) = ds.locate(5)
+    expected = (volume if v == 0 else volume[::-1])[z:z + 24, y:y + 24, x:x + 24]
+    np.testing.assert_array_equal(ds[5], expected)
+
+    serial = list(ds.iter_batches(batch_size=4, workers=1))
+    parallel = list(ds.iter_batches(batch_size=4, workers=4))
+    assert [b.shape for b in parallel] == [(4, 24, 24, 24)] * 3
+    for a, b in zip(serial, parallel):
+        np.testing.assert_array_equal(a, b)
+    ds.close()
+
+
+def test_patch_dataset_in_spawned_workers(volume, tmp_path):
+    path = tmp_path / "v.cvol"
+    write_chunked(volume, path, chunks=(16, 16, 16))
+    ds = PatchDataset([path], patch=(16, 16, 16), samples=4, seed=1)
+    ds[0]  # fills the parent's chunk cache; only the path travels
+    clone = pickle.loads(pickle.dumps(ds))
+    assert clone.volumes[0].chunks_read == 0 and clone.volumes[0]._fd is not None
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        patches = list(pool.map(ds.__getitem__, range(4)))
+    for i, patch in enumerate(patches):
+        np.testing.assert_array_equal(patch, ds[i])
+    clone.close()
+    ds.close()
+
+
+def test_patch_larger_than_volume_is_zero_padded(volume, tmp_path):
+    write_chunked(volume, tmp_path / "v.cvol")
+    ds = PatchDataset([tmp_path / "v.cvol"], patch=(48, 48, 48), samples=1)
+    patch = ds[0]
+    _, (z, y, x) = ds.locate(0)
+    assert patch.shape == (48, 48, 48) and (z, x) == (0, 0)
+    np.testing.assert_array_equal(patch[:37, :, :45], volume[:, y:y + 48, :])
+    assert not patch[37:].any() and not patch[:, :, 45:].any()
+    ds.close()
+
+
+def test_preprocess_writes_chunked_volume(make_ct_series, phantom_volume, tmp_path):
+    series = make_ct_series(phantom_volume)
+    manifest = tmp_path / "series.txt"
+    manifest.write_text(f"{series}\n")
+    report = preprocess_batch(read_manifest(manifest, tmp_path / "out", ".cvol"), workers=1, progress=False)
+    assert report["done"] == 1
+    with ChunkedVolume(tmp_path / "out" / "series.cvol") as vol:
+        assert list(vol.shape) == report["series"][0]["shape"]
+        assert vol.attrs["hu_range"] == [-100, 400]
+        data = vol.to_numpy()
+        assert data.dtype == np.float32 and 0.0 <= data.min() and data.max() <= 1.0
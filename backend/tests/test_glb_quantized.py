@@ -0,0 +1,83 @@
+"""Quantized GLB (KHR_mesh_quantization) decodes back to the source mesh."""
+
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from backend.export.glb_quantized import encode_quantized_glb, export_glb, reorder_for_locality
+from backend.segmentation.packed_mask import threshold_packed
+from backend.segmentation.segmentation import mask_to_mesh
+
+_DTYPES = {5120: np.int8, 5122: np.int16, 5123: np.uint16, 5125: np.uint32, 5126: np.float32}
+_WIDTH = {"SCALAR": 1, "VEC3": 3}
+
+
+def _decode(glb):
+    """Minimal glTF 2.0 reader following the spec for normalized integer accessors."""
+    magic, version, total = struct.unpack_from("<4sII", glb)
+    assert (magic, version, total) == (b"glTF", 2, len(glb))
+    json_len, json_type = struct.unpack_from("<I4s", glb, 12)
+    assert json_type == b"JSON"
+    gltf = json.loads(glb[20:20 + json_len])
+    bin_len, bin_type = struct.unpack_from("<I4s", glb, 20 + json_len)
+    assert bin_type == b"BIN\0"
+    binary = glb[28 + json_len:28 + json_len + bin_len]
+
+    def accessor(i):
+        acc = gltf["accessors"][i]
+        view = gltf["bufferViews"][acc["bufferView"]]
+        dtype = np.dtype(_DTYPES[acc["componentType"]])
+        width = _WIDTH[acc["type"]]
+        stride = view.get("byteStride", dtype.itemsize * width)
+        raw = np.frombuffer(binary, dtype=np.uint8, count=view["byteLength"], offset=view["byteOffset"])
+        raw = np.pad(raw, (0, stride * acc["count"] - raw.size))
+        rows = raw.reshape(acc["count"], stride)[:, : dtype.itemsize * width]
+        values = np.ascontiguousarray(rows).view(dtype).reshape(acc["count"], width)
+        if acc.get("normalized"):
+            values = np.maximum(values / float(np.iinfo(dtype).max), -1.0)
+        return values
+
+    prim = gltf["meshes"][0]["primitives"][0]
+    node = gltf["nodes"][0]
+    positions = accessor(prim["attributes"]["POSITION"]) * node["scale"] + node["translation"]
+    normals = accessor(prim["attributes"]["NORMAL"])
+    faces = accessor(prim["indices"]).reshape(-1, 3)
+    return gltf, positions, normals, faces
+
+
+@pytest.fixture
+def mesh(phantom_volume):
+    return mask_to_mesh(threshold_packed(phantom_volume, (30, 300)), (0.8, 0.8, 2.0))
+
+
+def test_quantized_glb_round_trip(mesh):
+    glb, stats = encode_quantized_glb(mesh)
+    gltf, positions, normals, faces = _decode(glb)
+
+    assert gltf["extensionsRequired"] == ["KHR_mesh_quantization"]
+    assert stats["bytes"] == len(glb) and stats["faces"] == len(mesh.faces)
+    extent = float(np.ptp(mesh.vertices, axis=0).max())
+    assert stats["max_error"] <= extent / 32767
+    # Same surface: identical triangle set in world space, up to quantization
+    src = np.sort(np.round(mesh.vertices[mesh.faces].reshape(-1, 3), 2), axis=0)
+    dst = np.sort(np.round(positions[faces].reshape(-1, 3), 2), axis=0)
+    assert np.allclose(src, dst, atol=0.02)
+    assert np.allclose(np.linalg.norm(normals, axis=1), 1.0, atol=0.02)
+
+
+def test_reorder_is_a_permutation(mesh):
+    order, faces = reorder_for_locality(np.asarray(mesh.vertices), np.asarray(mesh.faces))
+    assert sorted(order.tolist()) == list(range(len(mesh.vertices)))
+    assert faces.shape == mesh.faces.shape
+    # first use of vertex k precedes first use of vertex k+1
+    first = np.unique(faces.ravel(), return_index=True)[1]
+    assert (np.diff(first) > 0).all()
+
+
+def test_quantized_glb_is_smaller(tmp_path, mesh):
+    plain = export_glb(mesh, tmp_path / "plain.glb", quantize=False)
+    packed = export_glb(mesh, tmp_path / "packed.glb", quantize=True)
+    assert (tmp_path / "packed.glb").stat().st_size < 0.6 * (tmp_path / "plain.glb").stat().st_size
+    assert plain.endswith("plain.glb") and packed.endswith("packed.glb")
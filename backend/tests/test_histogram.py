@@ -0,0 +1,74 @@
+"""Tests for the HU histogram threshold preview and auto-threshold."""
+
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+from backend.segmentation.histogram import compute_hu_histogram
+
+client = TestClient(app)
+
+
+def test_count_range_matches_mask(phantom_volume):
+    rng = np.random.default_rng(0)
+    vol = phantom_volume + rng.integers(-20, 20, size=phantom_volume.shape).astype(np.int16)
+    hist = compute_hu_histogram(vol, spacing=(0.5, 0.5, 2.0), chunk_slices=5)
+
+    for lo, hi in [(30, 300), (-1000, 0), (149, 151), (5000, 6000)]:
+        expected = int(((vol >= lo) & (vol <= hi)).sum())
+        assert hist.count_range(lo, hi) == expected
+    preview = hist.preview(30, 300)
+    assert np.isclose(preview["volume_ml"], preview["voxels"] * 0.5 / 1000)
+
+
+def test_otsu_separates_air_and_tissue(phantom_volume):
+    hist = compute_hu_histogram(phantom_volume, spacing=(1, 1, 1))
+    (t,) = hist.auto_thresholds(classes=2)
+    assert -1000 < t < 150
+
+    rng = np.random.default_rng(0)
+    three = phantom_volume.copy()
+    three[:, :, :4] = 700  # add a 'bone' class
+    three += rng.integers(-30, 30, size=three.shape).astype(np.int16)
+    t1, t2 = compute_hu_histogram(three, spacing=(1, 1, 1)).auto_thresholds(classes=3)
+    assert -1000 < t1 < 150 < t2 < 700
+
+    four = three.copy()
+    four[:, :4, :] = 2500  # metal; the full -1030..2530 HU range stays cheap to search
+    start = time.perf_counter()
+    t1, t2, t3 = compute_hu_histogram(four, spacing=(1, 1, 1)).auto_thresholds(classes=4)
+    assert time.perf_counter() - start < 1.0
+    assert -1000 < t1 < 150 < t2 < 700 < t3 < 2500
+    with pytest.raises(ValueError):
+        compute_hu_histogram(four, spacing=(1, 1, 1)).auto_thresholds(classes=5)
+
+
+def test_histogram_endpoints(make_ct_series, phantom_volume):
+    folder = make_ct_series(phantom_volume)
+    resp = client.post("/histogram/", data={"dicom_folder": str(folder)})
+    assert resp.status_code == 200, resp.text
+    hid = resp.json()["histogram_id"]
+
+    preview = client.get(f"/histogram/{hid}/preview/", params={"threshold_min": 30, "threshold_max": 300}).json()
+    assert preview["voxels"] == int((phantom_volume == 150).sum())
+    assert preview["volume_ml"] > 0
+
+    auto = client.get(f"/histogram/{hid}/auto_threshold/").json()
+    assert len(auto["thresholds"]) == 1 and len(auto["ranges"]) == 2
+    assert client.get("/histogram/unknown/preview/").status_code == 404
+    for classes in (1, 5, 50):
+        assert client.get(f"/histogram/{hid}/auto_threshold/", params={"classes": classes}).status_code == 422
+
+
+def test_histogram_bins_must_be_positive(make_ct_series, phantom_volume):
+    hist = compute_hu_histogram(phantom_volume, spacing=(1, 1, 1))
+    assert len(hist.summary(1)["counts"]) == 1
+    with pytest.raises(ValueError):
+        hist.summary(0)
+    folder = make_ct_series(phantom_volume)
+    for bins in (0, -3, 10 ** 6):
+        resp = client.post("/histogram/", data={"dicom_folder": str(folder), "bins": bins})
+        assert resp.status_code == 422, bins
@@ -0,0 +1,64 @@
+"""Incremental re-meshing must match a full re-mesh while touching fewer blocks."""
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+from backend.segmentation.incremental import IncrementalMesher
+from backend.segmentation.packed_mask import threshold_packed
+from backend.segmentation.segmentation import mask_to_mesh
+
+
+def _two_organs():
+    z, y, x = np.mgrid[0:40, 0:24, 0:24]
+    vol = np.full((40, 24, 24), -1000, dtype=np.int16)
+    vol[((z - 8) / 5) ** 2 + ((y - 12) / 8) ** 2 + ((x - 12) / 8) ** 2 <= 1] = 150
+    vol[((z - 30) / 6) ** 2 + ((y - 12) / 6) ** 2 + ((x - 10) / 7) ** 2 <= 1] = 250
+    return vol
+
+
+def test_incremental_update_matches_full_mesh():
+    vol = _two_organs()
+    spacing = (1.0, 1.0, 1.0)
+    mesher = IncrementalMesher(spacing, block_slices=8)
+
+    first = mesher.update(threshold_packed(vol, (30, 300)))
+    assert first["changed_blocks"] == first["total_blocks"]
+
+    # Dropping the upper threshold removes only the lower organ (z >= 24)
+    new_mask = threshold_packed(vol, (30, 200))
+    stats = mesher.update(new_mask)
+    assert 0 < stats["changed_blocks"] < stats["total_blocks"]
+
+    mesh = mesher.mesh()
+    full = mask_to_mesh(new_mask, spacing)
+    assert len(mesh.faces) == len(full.faces)
+    assert np.allclose(mesh.bounds, full.bounds)
+    assert np.isclose(mesh.area, full.area)
+
+
+def test_unchanged_threshold_touches_nothing():
+    vol = _two_organs()
+    mesher = IncrementalMesher((1.0, 1.0, 1.0), block_slices=8)
+    mesher.update(threshold_packed(vol, (30, 300)))
+    assert mesher.update(threshold_packed(vol, (100, 300)))["changed_blocks"] == 0
+
+
+def test_incremental_endpoint_reuses_job(make_ct_series):
+    client = TestClient(app)
+    folder = make_ct_series(_two_organs())
+    first = client.post("/segment_dicom_incremental/", data={"dicom_folder": str(folder)}).json()
+    second = client.post(
+        "/segment_dicom_incremental/",
+        data={"dicom_folder": str(folder), "threshold_max": 200, "job_id": first["job_id"]},
+    ).json()
+    assert second["job_id"] == first["job_id"]
+    assert second["changed_blocks"] < first["changed_blocks"]
+    assert second["faces"] < first["faces"]
+
+
+def test_incremental_endpoint_rejects_path_job_id(tmp_path):
+    client = TestClient(app)
+    for bad in ("../../x", "a/b", "..", " "):
+        r = client.post("/segment_dicom_incremental/", data={"dicom_folder": str(tmp_path), "job_id": bad})
+        assert r.status_code == 400, bad
@@ -0,0 +1,114 @@
+"""Inline anonymization on ingest: header rewritten, pixel bytes passed through."""
+
+import io
+
+import numpy as np
+import pydicom
+import pytest
+from pydicom.data import get_testdata_file
+
+from backend.dataset_tools.anonymize_dicom import anonymize_dataset
+from backend.dicom import dicom_service, inline_anonymizer, pacs_import
+from backend.dicom.inline_anonymizer import anonymize_stream
+from backend.segmentation.segmentation import load_dicom_series
+
+
+@pytest.mark.parametrize("name", ["CT_small.dcm", "MR_small_implicit.dcm", "MR_small_bigendian.dcm", "JPEG2000.dcm"])
+def test_header_rewritten_pixels_passed_through(name):
+    raw = open(get_testdata_file(name), "rb").read()
+    src = io.BytesIO(raw)
+    pydicom.dcmread(src, stop_before_pixels=True, force=True)
+    tail = raw[src.tell():]
+
+    out = io.BytesIO()
+    anonymize_stream(io.BytesIO(raw), out, salt="secret")
+    data = out.getvalue()
+    assert data.endswith(tail)  # pixel element copied byte for byte
+
+    before, after = pydicom.dcmread(io.BytesIO(raw)), pydicom.dcmread(io.BytesIO(data))
+    assert after.PatientName == "ANONYMIZED" and "PatientID" not in after
+    assert after.SOPInstanceUID != before.SOPInstanceUID
+    assert after.file_meta.MediaStorageSOPInstanceUID == after.SOPInstanceUID
+    assert after.PixelData == before.PixelData
+    if name != "JPEG2000.dcm":
+        assert np.array_equal(after.pixel_array, before.pixel_array)
+
+
+def _without_file_meta(name):
+    ds = pydicom.dcmread(get_testdata_file(name))
+    del ds.file_meta
+    ds.preamble = None
+    buf = io.BytesIO()
+    pydicom.dcmwrite(buf, ds, implicit_vr=False, little_endian=True)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("name", ["CT_small.dcm", "MR_small_implicit.dcm", "rtplan.dcm", "no_meta"])
+def test_same_result_as_offline_anonymizer(name):
+    """Byte-level rewrite (and the pydicom fallback for files without file meta) follow the offline rules."""
+    if name == "no_meta":
+        raw = _without_file_meta("CT_small.dcm")
+    else:
+        raw = open(get_testdata_file(name), "rb").read()
+    out = io.BytesIO()
+    anonymize_stream(io.BytesIO(raw), out, salt="secret")
+    inline = pydicom.dcmread(io.BytesIO(out.getvalue()), force=True)
+    offline = anonymize_dataset(pydicom.dcmread(io.BytesIO(raw), force=True), salt="secret")
+
+    def _values(ds):
+        return {e.tag: str(e.value) for e in ds.iterall() if e.tag.element != 0}
+
+    assert _values(inline) == _values(offline)
+
+
+@pytest.mark.parametrize("name", ["CT_small.dcm", "rtplan.dcm", "reportsi.dcm", "MR_small_bigendian.dcm"])
+def test_header_longer_than_probe_block(name, monkeypatch):
+    """Headers (nested undefined-length sequences included) that span several reads give the same file."""
+    raw = open(get_testdata_file(name), "rb").read()
+    whole = io.BytesIO()
+    anonymize_stream(io.BytesIO(raw), whole, salt="secret")
+    monkeypatch.setattr(inline_anonymizer, "HEADER_PROBE", 64)
+    monkeypatch.setattr(inline_anonymizer, "_anonymize_full", None)  # the fast path must not give up
+    blocks = io.BytesIO()
+    anonymize_stream(io.BytesIO(raw), blocks, salt="secret")
+    assert blocks.getvalue() == whole.getvalue()
+
+
+def test_upload_is_anonymized_and_still_segmentable(make_ct_series, phantom_volume, monkeypatch):
+    skipped = []
+    monkeypatch.setattr(dicom_service, "log_import_error", lambda name, msg: skipped.append(name))
+    folder = make_ct_series(phantom_volume)
+    files = [(f.name, open(f, "rb")) for f in sorted(folder.iterdir())]
+    files.append(("notes.txt", io.BytesIO(b"not a dicom file")))
+    target = dicom_service.save_uploaded_files(files, anonymize=True)
+    try:
+        saved = sorted(target.iterdir())
+        assert [p.name for p in saved] == sorted(f.name for f in folder.iterdir())
+        assert skipped == ["notes.txt"]
+        headers = [pydicom.dcmread(p, stop_before_pixels=True) for p in saved]
+        assert {str(h.PatientName) for h in headers} == {"ANONYMIZED"}
+        assert len({h.SeriesInstanceUID for h in headers}) == 1
+        _, array, *_ = load_dicom_series(target)
+        assert np.array_equal(array, phantom_volume)
+    finally:
+        for _, f in files:
+            f.close()
+        for p in target.iterdir():
+            p.unlink()
+        target.rmdir()
+
+
+def test_pacs_download_is_anonymized(tmp_path, monkeypatch):
+    raw = open(get_testdata_file("CT_small.dcm"), "rb").read()
+
+    class _Response:
+        content = raw
+
+        def raise_for_status(self):
+            pass
+
+    monkeypatch.setattr(pacs_import.requests, "get", lambda *a, **kw: _Response())
+    pacs_import.download_dicom_series_orthanc("http://pacs", "1.2.3", tmp_path, instances=["a"], anonymize=True)
+    ds = pydicom.dcmread(tmp_path / "a.dcm")
+    assert ds.PatientName == "ANONYMIZED"
+    assert ds.PixelData == pydicom.dcmread(io.BytesIO(raw)).PixelData
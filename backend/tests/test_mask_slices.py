@@ -0,0 +1,84 @@
+"""Skip-empty PNG export and on-demand slice serving."""
+
+import io
+import json
+import os
+
+import numpy as np
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from backend.app.main import app
+from backend.segmentation.mask_slices import MaskSliceCache
+from backend.segmentation.packed_mask import threshold_packed
+from backend.segmentation.segmentation import save_mask_nifti, save_mask_png
+from backend.segmentation.volume_cache import VolumeGeometry
+
+
+def _decode(data):
+    return np.asarray(Image.open(io.BytesIO(data)))
+
+
+def test_png_export_skips_empty_slices(tmp_path, phantom_volume):
+    mask = threshold_packed(phantom_volume, (30, 300))
+    index = save_mask_png(mask, tmp_path / "png", lazy=False)
+
+    expected = [int(z) for z in np.flatnonzero((phantom_volume == 150).any(axis=(1, 2)))]
+    assert index["slices"] == expected and len(expected) < phantom_volume.shape[0]
+    assert sorted(os.listdir(tmp_path / "png")) == sorted([f"mask_{z:03d}.png" for z in expected] + ["index.json"])
+    with open(tmp_path / "png" / "index.json") as f:
+        assert json.load(f)["shape"] == list(phantom_volume.shape)
+    z = expected[len(expected) // 2]
+    png = np.asarray(Image.open(tmp_path / "png" / f"mask_{z:03d}.png"))
+    assert np.array_equal(png, mask.slice(z) * 255)
+
+
+def test_lazy_mode_writes_only_index(tmp_path, phantom_volume):
+    index = save_mask_png(threshold_packed(phantom_volume, (30, 300)), tmp_path / "png", lazy=True)
+    assert index["lazy"] and os.listdir(tmp_path / "png") == ["index.json"]
+
+
+def test_slice_cache_reloads_mask_from_nifti(tmp_path, phantom_volume):
+    mask = threshold_packed(phantom_volume, (30, 300))
+    geometry = VolumeGeometry((1.0, 1.0, 1.0), (0.0, 0.0, 0.0), (1, 0, 0, 0, 1, 0, 0, 0, 1))
+    save_mask_nifti(mask, geometry, str(tmp_path / "mask.nii.gz"))
+
+    cache = MaskSliceCache(max_entries=2)
+    first = cache.png(tmp_path, 6)
+    assert np.array_equal(_decode(first), mask.slice(6) * 255)
+    assert cache.png(tmp_path, 6) is first and cache.hits == 1
+    cache.png(tmp_path, 0)
+    cache.png(tmp_path, 1)
+    cache.png(tmp_path, 6)
+    assert cache.misses == 4  # slice 6 was evicted by the LRU
+
+
+def test_evicted_mask_reloads_intact_from_nifti(tmp_path):
+    z, y, x = np.mgrid[0:40, 0:96, 0:96]
+    vol = np.where(((z - 20) / 15) ** 2 + ((y - 48) / 30) ** 2 + ((x - 48) / 30) ** 2 <= 1, 150, -1000)
+    mask = threshold_packed(vol.astype(np.int16), (30, 300))
+    geometry = VolumeGeometry((1.0, 1.0, 1.0), (0.0, 0.0, 0.0), (1, 0, 0, 0, 1, 0, 0, 0, 1))
+    (tmp_path / "job").mkdir()
+    save_mask_nifti(mask, geometry, str(tmp_path / "job" / "mask.nii.gz"))
+
+    cache = MaskSliceCache(max_masks=1)
+    cache.register(tmp_path / "job", mask)
+    for _ in range(5):
+        cache.register(tmp_path / "other", mask)  # evicts the job's mask
+        reloaded = cache.get_mask(tmp_path / "job")
+        assert reloaded is not mask
+        assert np.array_equal(reloaded.to_dense(), mask.to_dense())
+
+
+def test_mask_slice_endpoint(make_ct_series, phantom_volume):
+    client = TestClient(app)
+    folder = make_ct_series(phantom_volume)
+    resp = client.post("/segment_dicom_full/", data={"dicom_folder": str(folder)})
+    assert resp.status_code == 200, resp.text
+    job_id = os.path.basename(os.path.dirname(resp.json()["nifti_mask_path"])).split("_", 1)[1]
+
+    png = client.get(f"/segmentation/{job_id}/mask_slice/6")
+    assert png.status_code == 200 and png.headers["content-type"] == "image/png"
+    assert _decode(png.content).max() == 255
+    assert client.get(f"/segmentation/{job_id}/mask_slice/999").status_code == 404
+    assert client.get("/segmentation/missing/mask_slice/0").status_code == 404
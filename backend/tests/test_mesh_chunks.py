@@ -0,0 +1,75 @@
+"""Octree mesh chunks: coarse-to-fine levels, manifest and chunk endpoints."""
+
+import json
+import shutil
+
+import numpy as np
+import trimesh
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+from backend.segmentation.mesh_chunks import build_mesh_chunks, split_octree
+from backend.segmentation.packed_mask import threshold_packed
+from backend.segmentation.segmentation import mask_to_mesh
+
+client = TestClient(app)
+
+
+def test_split_octree_partitions_faces():
+    mesh = trimesh.creation.icosphere(subdivisions=3)
+    lo, hi = mesh.bounds
+    parts = split_octree(mesh, 1, lo, hi)
+    assert len(parts) == 8
+    assert sum(len(sub.faces) for _, sub in parts) == len(mesh.faces)
+    for cell, sub in parts:
+        centroids = sub.triangles_center
+        cell_lo = lo + (hi - lo) / 2 * np.asarray(cell)
+        assert np.all(centroids >= cell_lo - 1e-9) and np.all(centroids <= cell_lo + (hi - lo) / 2 + 1e-9)
+
+
+def test_chunks_written_coarse_to_fine(tmp_path, phantom_volume):
+    mesh = mask_to_mesh(threshold_packed(phantom_volume, (30, 300)), (1.0, 1.0, 1.0))
+    manifest = build_mesh_chunks(mesh, tmp_path, level_faces=[200, 0])
+
+    assert manifest["status"] == "done"
+    levels = [c["level"] for c in manifest["chunks"]]
+    assert levels == sorted(levels) and levels.count(0) == 1
+    assert manifest["levels"][0]["faces"] <= 200
+    assert manifest["levels"][1]["faces"] == len(mesh.faces)
+    assert sum(c["faces"] for c in manifest["chunks"] if c["level"] == 1) == len(mesh.faces)
+    for chunk in manifest["chunks"]:
+        loaded = trimesh.load(tmp_path / "chunks" / chunk["name"], force="mesh")
+        assert len(loaded.faces) == chunk["faces"]
+        np.testing.assert_allclose(loaded.bounds, chunk["bounds"], atol=1e-3)
+    with open(tmp_path / "chunks" / "manifest.json") as f:
+        assert json.load(f) == manifest
+    assert manifest["version"] > len(manifest["chunks"])  # bumped on every chunk
+
+
+def test_chunk_endpoints(make_ct_series, phantom_volume):
+    folder = make_ct_series(phantom_volume)
+    r = client.post("/segment_dicom_async/", data={"dicom_folder": str(folder), "mesh_chunks": "true"})
+    task_id = r.json()["task_id"]
+    try:
+        manifest = client.get(r.json()["chunk_manifest_url"], params={"since": 0, "wait": 5}).json()
+        assert manifest["status"] == "done" and manifest["chunks"]
+        url = f"/segmentation/{task_id}/chunks/{manifest['chunks'][0]['name']}"
+        first = client.get(url)
+        assert first.status_code == 200 and first.headers["content-type"] == "model/gltf-binary"
+        assert client.get(url, headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+        assert client.get(f"/segmentation/{task_id}/chunks/..%2Fmask.stl").status_code in (400, 404)
+        assert client.get("/segmentation/nope/chunks/manifest").status_code == 404
+    finally:
+        shutil.rmtree(f"data/reports/segmentation_{task_id}", ignore_errors=True)
+
+
+def test_manifest_reports_job_failed_before_chunks(tmp_path):
+    # No DICOM files: the job fails while loading, before any manifest is written
+    r = client.post("/segment_dicom_async/", data={"dicom_folder": str(tmp_path), "mesh_chunks": "true"})
+    task_id = r.json()["task_id"]
+    try:
+        manifest = client.get(r.json()["chunk_manifest_url"], params={"since": 0, "wait": 5}).json()
+        assert manifest["status"] == "error" and manifest["detail"]
+        assert manifest["detail"] == client.get(f"/task_status/{task_id}").json()["detail"]
+    finally:
+        shutil.rmtree(f"data/reports/segmentation_{task_id}", ignore_errors=True)
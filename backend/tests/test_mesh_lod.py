@@ -0,0 +1,49 @@
+"""LOD chain generation within face budgets."""
+
+import os
+
+import pytest
+import trimesh
+
+from backend.segmentation.mesh_lod import build_lod_chain, parse_face_budgets
+from backend.segmentation.packed_mask import threshold_packed
+from backend.segmentation.segmentation import mask_to_mesh, segment_and_export_full
+
+
+def test_lod_levels_respect_budgets(tmp_path, phantom_volume):
+    mesh = mask_to_mesh(threshold_packed(phantom_volume, (30, 300)), (1.0, 1.0, 1.0))
+    budgets = [len(mesh.faces) * 2, 600, 150]
+    lods = build_lod_chain(mesh, tmp_path, budgets)
+
+    assert [lod["level"] for lod in lods] == [0, 1, 2]
+    assert lods[0]["faces"] == len(mesh.faces)  # already within budget: kept as is
+    assert lods[0]["faces"] > lods[1]["faces"] > lods[2]["faces"]
+    for lod in lods:
+        assert lod["faces"] <= lod["budget"]
+        assert len(trimesh.load(lod["path"], force="mesh").faces) == lod["faces"]
+
+
+def test_decimation_failure_is_not_hidden(tmp_path, phantom_volume, monkeypatch):
+    mesh = mask_to_mesh(threshold_packed(phantom_volume, (30, 300)), (1.0, 1.0, 1.0))
+
+    def broken(self, face_count):
+        raise ImportError("fast_simplification is not installed")
+
+    monkeypatch.setattr(trimesh.Trimesh, "simplify_quadric_decimation", broken)
+    with pytest.raises(RuntimeError, match="Decimation failed"):
+        build_lod_chain(mesh, tmp_path, [150])
+    # Within budget nothing is decimated, so nothing can fail
+    assert build_lod_chain(mesh, tmp_path, [len(mesh.faces)])[0]["faces"] == len(mesh.faces)
+
+
+def test_parse_face_budgets():
+    assert parse_face_budgets("50000, 20000,5000") == [50000, 20000, 5000]
+    assert parse_face_budgets("") == []
+
+
+def test_full_pipeline_returns_lods(tmp_path, make_ct_series, phantom_volume):
+    folder = make_ct_series(phantom_volume)
+    result = segment_and_export_full(str(folder), str(tmp_path / "out"), lod_budgets=[1000, 300])
+    assert [os.path.basename(lod["path"]) for lod in result["lods"]] == ["mask_lod0.glb", "mask_lod1.glb"]
+    assert all(os.path.exists(lod["path"]) for lod in result["lods"])
+    assert segment_and_export_full(str(folder), str(tmp_path / "none"), lod_budgets=[])["lods"] == []
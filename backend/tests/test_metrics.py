@@ -0,0 +1,122 @@
+"""Prometheus metrics: stage timings, job RSS, request middleware and /metrics."""
+
+import re
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app.main import _tasks, app
+from backend.monitoring import metrics
+from backend.monitoring.metrics import Counter, Histogram, render_metrics, stage, track_job
+from backend.segmentation.segmentation import simple_threshold_segmentation
+
+client = TestClient(app)
+
+
+def _sample(text, name, **labels):
+    """Value of the sample *name* with exactly *labels* in a Prometheus text exposition."""
+    want = {k: str(v) for k, v in labels.items()}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        m = re.match(r"([a-zA-Z_:][\w:]*)(?:\{(.*)\})? (\S+)$", line)
+        assert m, f"malformed line: {line!r}"
+        if m.group(1) != name:
+            continue
+        got = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', m.group(2) or ""))
+        if got == want:
+            return float(m.group(3))
+    return None
+
+
+def test_histogram_render_is_cumulative():
+    hist = Histogram("test_seconds", "test", buckets=(0.1, 1.0), labelnames=("stage",))
+    for value in (0.05, 0.5, 0.7, 5.0):
+        hist.observe(value, stage='a"b')
+    text = "\n".join(hist.render())
+    assert "# TYPE test_seconds histogram" in text
+    assert _sample(text, "test_seconds_bucket", stage='a\\"b', le="0.1") == 1
+    assert _sample(text, "test_seconds_bucket", stage='a\\"b', le="1.0") == 3
+    assert _sample(text, "test_seconds_bucket", stage='a\\"b', le="+Inf") == 4
+    assert _sample(text, "test_seconds_sum", stage='a\\"b') == pytest.approx(6.25)
+    with pytest.raises(ValueError):
+        hist.observe(1.0, other="x")
+
+
+def test_stage_context_manager_and_decorator():
+    before = metrics.STAGE_SECONDS.count(stage="threshold")
+    simple_threshold_segmentation(np.zeros((2, 4, 4), dtype=np.int16))
+
+    @stage("unit_test")
+    def work():
+        return 42
+
+    assert work() == 42
+    with pytest.raises(RuntimeError):
+        with stage("unit_test"):
+            raise RuntimeError
+    assert metrics.STAGE_SECONDS.count(stage="threshold") == before + 1
+    assert metrics.STAGE_SECONDS.count(stage="unit_test") == 2
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    with stage("disabled"), track_job("disabled"):
+        pass
+    assert metrics.STAGE_SECONDS.count(stage="disabled") == 0
+    assert metrics.JOB_SECONDS.count(job="disabled") == 0
+
+
+def test_track_job_peak_rss():
+    with track_job("unit_test"):
+        block = np.ones(64 * 1024 ** 2, dtype=np.uint8)  # 64 MB touched
+        rss = metrics.current_rss()
+    del block
+    text = render_metrics()
+    assert _sample(text, "jobs_total", job="unit_test", status="ok") == 1
+    assert _sample(text, "job_peak_rss_bytes_sum", job="unit_test") >= rss
+    with pytest.raises(ValueError):
+        with track_job("unit_test"):
+            raise ValueError
+    assert metrics.JOBS.value(job="unit_test", status="error") == 1
+
+
+def test_metrics_endpoint():
+    client.get("/health")
+    client.get("/task_status/does-not-exist")
+    client.get("/no/such/path")
+    _tasks["metrics-test"] = {"status": "pending"}
+    try:
+        response = client.get("/metrics")
+    finally:
+        del _tasks["metrics-test"]
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert _sample(text, "http_requests_total", method="GET", endpoint="/health", status="200") >= 1
+    # Route templates, not raw paths, label the series
+    assert _sample(text, "http_requests_total", method="GET", endpoint="/task_status/{task_id}", status="404") >= 1
+    assert _sample(text, "http_requests_total", method="GET", endpoint="unmatched", status="404") >= 1
+    assert _sample(text, "http_request_duration_seconds_count", method="GET", endpoint="/health") >= 1
+    assert _sample(text, "job_queue_depth") >= 1
+    assert "# TYPE cache_hits_total counter" in text
+    assert _sample(text, "process_resident_memory_bytes") > 0
+
+
+def test_cache_counters_after_use(make_ct_series, phantom_volume):
+    from backend.segmentation.segmentation import load_dicom_series_cached
+
+    series = make_ct_series(phantom_volume, name="metrics_cache")  # fresh UIDs: first load misses
+    load_dicom_series_cached(series)
+    load_dicom_series_cached(series)
+    text = render_metrics()
+    assert _sample(text, "cache_hits_total", cache="volume") >= 1
+    assert _sample(text, "cache_misses_total", cache="volume") >= 1
+
+
+def test_counter_labels():
+    counter = Counter("test_total", "test", ("kind",))
+    counter.inc(kind="a")
+    counter.inc(2, kind="a")
+    assert counter.value(kind="a") == 3 and counter.value(kind="b") == 0
@@ -0,0 +1,89 @@
+"""Sliding-window ONNX inference on CPU with a tiny generated model."""
+
+import numpy as np
+import pytest
+
+from backend.segmentation.ml_inference import (
+    OnnxSegmenter,
+    ThresholdSegmenter,
+    gaussian_weights,
+    get_segmenter,
+    window_starts,
+)
+from backend.segmentation.packed_mask import threshold_packed
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+from onnx import TensorProto, helper  # noqa: E402
+
+
+def _voxelwise_model(path, patch=(8, 16, 16), channels=1):
+    """logits = (x - 0.5) * 20: after HU windowing (-100..400) the foreground is HU > 150."""
+    dims = ["n", 1, *patch]
+    inp = helper.make_tensor_value_info("image", TensorProto.FLOAT, dims)
+    out = helper.make_tensor_value_info("logits", TensorProto.FLOAT, ["n", channels, *patch])
+    consts = [
+        helper.make_node("Constant", [], ["half"], value=helper.make_tensor("h", TensorProto.FLOAT, [], [0.5])),
+        helper.make_node("Constant", [], ["gain"], value=helper.make_tensor("g", TensorProto.FLOAT, [], [20.0])),
+    ]
+    nodes = consts + [helper.make_node("Sub", ["image", "half"], ["centered"])]
+    if channels == 1:
+        nodes.append(helper.make_node("Mul", ["centered", "gain"], ["logits"]))
+    else:
+        nodes += [
+            helper.make_node("Mul", ["centered", "gain"], ["fg"]),
+            helper.make_node("Neg", ["fg"], ["bg"]),
+            helper.make_node("Concat", ["bg", "fg"], ["logits"], axis=1),
+        ]
+    graph = helper.make_graph(nodes, "voxelwise", [inp], [out])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, str(path))
+    return path
+
+
+def _volume(shape=(21, 40, 37)):
+    rng = np.random.default_rng(0)
+    return rng.choice(np.array([-1000, 40, 120, 200, 700], dtype=np.int16), size=shape)
+
+
+def test_window_starts_cover_axis():
+    assert window_starts(10, 16, 8) == [0]
+    starts = window_starts(37, 16, 8)
+    assert starts[0] == 0 and starts[-1] == 37 - 16
+    assert all(b - a <= 8 for a, b in zip(starts, starts[1:]))
+    w = gaussian_weights((8, 16, 16))
+    assert w.shape == (8, 16, 16) and w.max() == pytest.approx(1.0) and w.min() > 0
+
+
+@pytest.mark.parametrize("channels", [1, 2])
+def test_sliding_window_matches_voxelwise_rule(tmp_path, channels):
+    model = _voxelwise_model(tmp_path / "m.onnx", channels=channels)
+    seg = OnnxSegmenter(model, overlap=0.5, batch_size=3, intra_op_threads=1)
+    vol = _volume()
+    mask = seg.segment(vol)
+    assert mask.shape == vol.shape
+    assert np.array_equal(mask.to_dense(), (vol > 150).astype(np.uint8))
+
+
+def test_volume_smaller_than_patch_is_padded(tmp_path):
+    model = _voxelwise_model(tmp_path / "m.onnx")
+    vol = _volume((5, 12, 20))
+    mask = OnnxSegmenter(model, overlap=0.25).segment(vol)
+    assert np.array_equal(mask.to_dense(), (vol > 150).astype(np.uint8))
+
+
+def test_memory_cap_limits_batch(tmp_path):
+    model = _voxelwise_model(tmp_path / "m.onnx")
+    seg = OnnxSegmenter(model, batch_size=64, max_memory_bytes=2 * 8 * 64 * 64 * 4 + 4 * 8 * 16 * 16 * 4 * 2)
+    assert seg._fit_batch((64, 64)) == 2
+    with pytest.raises(ValueError):
+        OnnxSegmenter(model, max_memory_bytes=1024)._fit_batch((64, 64))
+
+
+def test_threshold_segmenter_is_default(phantom_volume):
+    seg = get_segmenter("threshold", threshold=(30, 300))
+    assert isinstance(seg, ThresholdSegmenter)
+    assert np.array_equal(seg.segment(phantom_volume).bits, threshold_packed(phantom_volume, (30, 300)).bits)
+    with pytest.raises(ValueError):
+        get_segmenter("unknown")
@@ -0,0 +1,72 @@
+"""MPR slice/thumbnail tiles served from the cached volume."""
+
+import io
+
+import numpy as np
+import pydicom
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from backend.app.main import app
+from backend.dicom.mpr_tiles import TileServer, apply_window
+from backend.dicom.parser import save_dicom_image
+from backend.segmentation.packed_mask import threshold_packed
+
+client = TestClient(app)
+
+
+def _image(data):
+    return Image.open(io.BytesIO(data))
+
+
+def test_window_lut_matches_direct_formula():
+    hu = np.arange(-1200, 1200, 7, dtype=np.int16).reshape(1, -1)
+    expected = np.clip((hu.astype(np.float32) - (40 - 200)) * (255 / 400), 0, 255).astype(np.uint8)
+    assert np.array_equal(apply_window(hu, 400, 40), expected)
+    assert np.array_equal(apply_window(hu.astype(np.float32), 400, 40), expected)
+
+
+def test_tiles_are_cached_and_oriented(make_ct_series, phantom_volume):
+    folder = make_ct_series(phantom_volume, spacing=(1.0, 1.0, 2.0))
+    server = TileServer()
+    info = server.open(folder)
+    vid = info["volume_id"]
+    assert info["slices"] == {"axial": 12, "coronal": 32, "sagittal": 32}
+
+    axial, media = server.render(vid, "axial", 6)
+    assert media == "image/png"
+    assert np.array_equal(np.asarray(_image(axial)), apply_window(phantom_volume[6], 400, 40))
+    assert server.render(vid, "axial", 6)[0] is axial and server.hits == 1
+
+    coronal = _image(server.render(vid, "coronal", 16)[0])
+    assert coronal.size == (32, 24)  # 12 slices x 2 mm stretched to 1 mm pixels
+
+    webp, media = server.render(vid, "sagittal", 16, fmt="webp", size=16)
+    assert media == "image/webp" and max(_image(webp).size) == 16
+
+    mask = threshold_packed(phantom_volume, (30, 300))
+    overlay = np.asarray(_image(server.render(vid, "axial", 6, mask=mask, mask_key="m")[0]))
+    inside = mask.slice(6).astype(bool)
+    assert overlay.shape[2] == 3 and (overlay[inside, 0] > overlay[inside, 1]).all()
+
+
+def test_slice_endpoints(make_ct_series, phantom_volume):
+    folder = make_ct_series(phantom_volume)
+    vid = client.post("/volumes/", data={"dicom_folder": str(folder)}).json()["volume_id"]
+    resp = client.get(f"/volumes/{vid}/slice/coronal/10", params={"window": 1500, "level": 300})
+    assert resp.status_code == 200 and resp.headers["content-type"] == "image/png"
+    assert client.get(f"/volumes/{vid}/thumbnail").headers["content-type"] == "image/webp"
+    assert client.get(f"/volumes/{vid}/slice/oblique/0").status_code == 400
+    assert client.get(f"/volumes/{vid}/slice/axial/99").status_code == 404
+    assert client.get("/volumes/unknown/slice/axial/0").status_code == 404
+
+
+def test_save_dicom_image_uses_hu_window(tmp_path, make_ct_series, phantom_volume):
+    folder = make_ct_series(phantom_volume)
+    ds = pydicom.dcmread(sorted(folder.iterdir())[0])
+    ds.WindowCenter, ds.WindowWidth = 40, 400
+    out = tmp_path / "slice.png"
+    assert save_dicom_image(ds, str(out))
+    img = np.asarray(Image.open(out))
+    expected = apply_window(ds.pixel_array * 1.0 + float(ds.RescaleIntercept), 400, 40)
+    assert np.array_equal(img, expected)
@@ -0,0 +1,76 @@
+"""One-pass multi-label segmentation and per-organ meshes."""
+
+import json
+import os
+
+import numpy as np
+import pytest
+import SimpleITK as sitk
+import trimesh
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+from backend.segmentation.multilabel import label_map_from_ranges, parse_label_specs
+
+client = TestClient(app)
+
+LABELS = [
+    {"name": "kidney", "min": 30, "max": 200},
+    {"name": "bone", "min": 201, "max": 3000, "forbidden": True},
+]
+
+
+def _two_organs():
+    z, y, x = np.mgrid[0:24, 0:32, 0:32]
+    vol = np.full((24, 32, 32), -1000, dtype=np.int16)
+    vol[((z - 6) / 4) ** 2 + ((y - 16) / 8) ** 2 + ((x - 10) / 6) ** 2 <= 1] = 150
+    vol[((z - 16) / 5) ** 2 + ((y - 16) / 6) ** 2 + ((x - 22) / 6) ** 2 <= 1] = 700
+    return vol
+
+
+def test_label_map_matches_per_range_masks():
+    vol = _two_organs()
+    specs = parse_label_specs(LABELS)
+    expected = np.zeros(vol.shape, dtype=np.uint8)
+    for spec in specs:
+        expected[(vol >= spec.threshold[0]) & (vol <= spec.threshold[1])] = spec.label
+    assert np.array_equal(label_map_from_ranges(vol, specs, chunk_slices=5), expected)
+    assert np.array_equal(label_map_from_ranges(vol.astype(np.float32), specs, chunk_slices=5), expected)
+    assert np.array_equal(label_map_from_ranges(vol.astype(np.int32), specs), expected)
+
+
+def test_later_label_wins_on_overlap():
+    vol = np.array([[[100, 250]]], dtype=np.int16)
+    specs = parse_label_specs([{"name": "a", "min": 0, "max": 300}, {"name": "b", "min": 200, "max": 300}])
+    assert label_map_from_ranges(vol, specs).tolist() == [[[1, 2]]]
+
+
+@pytest.mark.parametrize("names", [["../x"], ["a/b"], ["kidney.glb"], [""], ["Kidney", "kidney"]])
+def test_label_names_are_file_safe_and_unique(names):
+    items = [{"name": n, "min": 0, "max": 100} for n in names]
+    with pytest.raises(ValueError):
+        parse_label_specs(items)
+    resp = client.post("/segment_dicom_multilabel/", data={"dicom_folder": "unused", "labels": json.dumps(items)})
+    assert resp.status_code == 400
+
+
+def test_multilabel_endpoint(make_ct_series):
+    folder = make_ct_series(_two_organs())
+    resp = client.post(
+        "/segment_dicom_multilabel/",
+        data={"dicom_folder": str(folder), "labels": json.dumps(LABELS)},
+    )
+    assert resp.status_code == 200, resp.text
+    data = resp.json()
+
+    labels = sitk.GetArrayFromImage(sitk.ReadImage(data["nifti_labels_path"]))
+    assert set(np.unique(labels).tolist()) == {0, 1, 2}
+    for name in ("kidney", "bone"):
+        info = data["labels"][name]
+        assert info["voxels"] == int((labels == info["label"]).sum())
+        assert os.path.exists(info["gltf"]) and info["faces"] > 0
+    assert data["forbidden_mesh_paths"] == [data["labels"]["bone"]["gltf"]]
+    assert len(trimesh.load(data["forbidden_mesh_paths"][0], force="mesh").faces) > 0
+
+    bad = client.post("/segment_dicom_multilabel/", data={"dicom_folder": str(folder), "labels": "[{}]"})
+    assert bad.status_code == 400
@@ -0,0 +1,75 @@
+"""Tests for the chunked threshold kernel and the bit-packed mask."""
+
+import numpy as np
+import pytest
+from skimage import measure
+
+from backend.segmentation.packed_mask import PackedMask, threshold_packed
+from backend.segmentation.segmentation import (
+    EmptyMaskError,
+    _ensure_non_empty,
+    mask_to_mesh,
+    threshold_into,
+)
+
+
+def _reference(array, lo, hi):
+    return ((array >= lo) & (array <= hi)).astype(np.uint8)
+
+
+def test_chunked_threshold_matches_reference():
+    rng = np.random.default_rng(1)
+    array = rng.integers(-1000, 1000, size=(37, 20, 23), dtype=np.int16)
+    out = np.full(array.shape, 7, dtype=np.uint8)
+    res = threshold_into(array, (30, 300), out=out, chunk_slices=8)
+    assert res is out
+    assert np.array_equal(out, _reference(array, 30, 300))
+
+
+def test_threshold_outside_dtype_range():
+    array = np.array([[[0, 100, 32767]]], dtype=np.int16)
+    assert threshold_into(array, (40000, 50000)).sum() == 0
+    assert np.array_equal(threshold_into(array, (50, 10 ** 6)), [[[0, 1, 1]]])
+
+
+def test_packed_mask_roundtrip_and_stats(phantom_volume):
+    packed = threshold_packed(phantom_volume, (30, 300), chunk_slices=5)
+    dense = _reference(phantom_volume, 30, 300)
+
+    assert packed.nbytes < dense.nbytes
+    assert np.array_equal(packed.to_dense(), dense)
+    assert np.array_equal(packed.slice(6), dense[6])
+    assert np.array_equal(packed.slice_counts, dense.sum(axis=(1, 2)))
+    zs, ys, xs = np.nonzero(dense)
+    assert packed.bbox == ((zs.min(), zs.max() + 1), (ys.min(), ys.max() + 1), (xs.min(), xs.max() + 1))
+
+    roi, offset = packed.crop(pad=1)
+    z0, y0, x0 = offset
+    assert np.array_equal(roi, dense[z0:z0 + roi.shape[0], y0:y0 + roi.shape[1], x0:x0 + roi.shape[2]])
+
+
+def test_empty_packed_mask_raises():
+    packed = PackedMask.from_dense(np.zeros((4, 5, 6), dtype=np.uint8))
+    assert packed.is_empty
+    with pytest.raises(EmptyMaskError):
+        _ensure_non_empty(packed)
+
+
+def test_to_dense_clears_reused_buffer(phantom_volume):
+    full = threshold_packed(phantom_volume, (30, 300))
+    empty = threshold_packed(phantom_volume, (5000, 6000))
+    buf = full.to_dense()
+    assert buf.any()
+    assert empty.to_dense(out=buf) is buf and not buf.any()
+    full.to_dense(out=buf)
+    shifted = threshold_packed(phantom_volume, (-1000, -500))  # the air: a different footprint
+    assert np.array_equal(shifted.to_dense(out=buf), shifted.to_dense())
+
+
+def test_roi_mesh_matches_full_volume(phantom_volume):
+    spacing = (0.8, 0.8, 2.0)
+    dense = _reference(phantom_volume, 30, 300)
+    verts, faces, _, _ = measure.marching_cubes(dense, level=0.5, spacing=spacing)
+    mesh = mask_to_mesh(threshold_packed(phantom_volume, (30, 300)), spacing)
+    assert len(mesh.faces) == len(faces)
+    assert np.allclose(mesh.bounds, [verts.min(axis=0), verts.max(axis=0)])
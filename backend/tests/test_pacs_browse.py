@@ -0,0 +1,91 @@
+"""Tests for the cached Orthanc browse client (no real PACS required)."""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+from backend.dicom.pacs_browse import OrthancBrowser
+
+
+class _Response:
+    def __init__(self, payload):
+        self._payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+
+def _series(uid, n):
+    return {
+        "ID": f"orthanc-{uid}",
+        "MainDicomTags": {"SeriesInstanceUID": uid, "Modality": "CT", "SeriesDescription": uid},
+        "Instances": [f"i{k}" for k in range(n)],
+    }
+
+
+class _FakeSession:
+    def __init__(self):
+        self.calls = []
+        self.series = {"1.1": _series("1.1", 3), "1.2": _series("1.2", 5), "1.3": _series("1.3", 7)}
+
+    def get(self, url):
+        self.calls.append(("GET", url))
+        return _Response([self.series["1.1"], self.series["1.2"]])
+
+    def post(self, url, json):
+        self.calls.append(("POST", url))
+        if json["Level"] == "Study":
+            studies = [{"ID": f"st{k}", "MainDicomTags": {"StudyInstanceUID": f"9.{k}"}, "Series": ["a"]} for k in range(5)]
+            return _Response(studies[json["Since"]:json["Since"] + json["Limit"]])
+        uids = json["Query"]["SeriesInstanceUID"].split("\\")
+        return _Response([self.series[u] for u in uids])
+
+
+def _browser():
+    browser = OrthancBrowser("http://pacs", ttl=60)
+    browser.session = _FakeSession()
+    return browser
+
+
+def test_studies_are_paginated_and_cached():
+    browser = _browser()
+    page = browser.list_studies(offset=2, limit=2)
+    assert [s["study_uid"] for s in page["items"]] == ["9.2", "9.3"]
+    browser.list_studies(offset=2, limit=2)
+    assert len(browser.session.calls) == 1
+
+
+def test_series_preview_is_batched():
+    browser = _browser()
+    series = browser.list_series("st0", limit=1)
+    assert series["total"] == 2 and series["items"][0]["instance_count"] == 3
+
+    # 1.1 and 1.2 are already cached from list_series, only 1.3 hits the PACS
+    previews = browser.preview_series(["1.1", "1.2", "1.3"])
+    assert [p["instance_count"] for p in previews] == [3, 5, 7]
+    assert browser.session.calls == [("GET", "http://pacs/studies/st0/series"), ("POST", "http://pacs/tools/find")]
+
+    browser.preview_series(["1.3", "1.1"])
+    assert len(browser.session.calls) == 2
+
+
+def test_page_bounds_are_enforced():
+    browser = _browser()
+    for offset, limit in ((-1, 10), (0, 0), (0, 501)):
+        with pytest.raises(ValueError):
+            browser.list_studies(offset=offset, limit=limit)
+        with pytest.raises(ValueError):
+            browser.list_series("st0", offset=offset, limit=limit)
+    with pytest.raises(ValueError):
+        browser.preview_series([f"1.{k}" for k in range(501)])
+    assert browser.session.calls == []  # nothing reached the PACS
+
+    client = TestClient(app)
+    assert client.get("/pacs/studies/", params={"limit": 0}).status_code == 422
+    assert client.get("/pacs/studies/", params={"offset": -5}).status_code == 422
+    assert client.get("/pacs/studies/st0/series/", params={"limit": 10 ** 6}).status_code == 422
+    r = client.post("/pacs/series/preview/", json={"series_uids": [f"1.{k}" for k in range(501)]})
+    assert r.status_code == 422
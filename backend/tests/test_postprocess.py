@@ -0,0 +1,48 @@
+"""ROI-restricted post-processing must match the full-volume filters."""
+
+import numpy as np
+import SimpleITK as sitk
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+from backend.benchmarks.synthetic import organ_with_artifacts
+from backend.segmentation.packed_mask import PackedMask, threshold_packed
+from backend.segmentation.postprocess import fill_holes, largest_component, postprocess_mask, smooth_mesh
+from backend.segmentation.segmentation import mask_to_mesh
+
+
+def test_roi_postprocess_matches_full_volume():
+    vol = organ_with_artifacts(shape=(40, 64, 64), radii=(10, 16, 12), specks=20)
+    packed = threshold_packed(vol, (30, 300))
+    timings = {}
+    result = postprocess_mask(packed, timings=timings)
+
+    full = sitk.GetArrayFromImage(largest_component(fill_holes(sitk.GetImageFromArray(packed.to_dense()))))
+    assert np.array_equal(result.to_dense(), full)
+    assert result.voxel_count > packed.voxel_count - 20 * 8  # cavity filled, specks dropped
+    assert set(timings) == {"crop", "fill_holes", "largest_component", "pack"}
+
+
+def test_from_roi_round_trips_crop(phantom_volume):
+    packed = threshold_packed(phantom_volume, (30, 300))
+    roi, offset = packed.crop(pad=2)
+    restored = PackedMask.from_roi(packed.shape, roi, offset, chunk_slices=3)
+    assert np.array_equal(restored.bits, packed.bits)
+    assert restored.bbox == packed.bbox
+
+
+def test_taubin_smoothing_keeps_volume(phantom_volume):
+    mesh = mask_to_mesh(threshold_packed(phantom_volume, (30, 300)), (1.0, 1.0, 1.0))
+    smoothed = smooth_mesh(mesh, iterations=10)
+    assert smoothed.faces.shape == mesh.faces.shape
+    assert abs(smoothed.volume - mesh.volume) / mesh.volume < 0.05
+    # Smoothing removes the voxel staircase, so the surface area drops
+    assert smoothed.area < mesh.area
+
+
+def test_full_endpoint_reports_postprocess_timings(make_ct_series):
+    vol = organ_with_artifacts(shape=(24, 48, 48), radii=(8, 12, 10), specks=10)
+    folder = make_ct_series(vol)
+    resp = TestClient(app).post("/segment_dicom_full/", data={"dicom_folder": str(folder), "postprocess": True})
+    assert resp.status_code == 200, resp.text
+    assert "smooth" in resp.json()["postprocess_timings_ms"]
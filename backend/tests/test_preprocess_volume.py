@@ -1,13 +1,20 @@
 """Tests for preprocess_volume.py using synthetic data."""
 
-from pathlib import Path
+import os
+import time
 
 import numpy as np
+import pytest
 import SimpleITK as sitk
 
 from backend.dataset_tools.preprocess_volume import (
+    HU_MAX,
+    HU_MIN,
     TARGET_SPACING,
     normalize_hu,
+    normalize_hu_into,
+    preprocess_batch,
+    read_manifest,
     resample_isotropic,
 )
 
@@ -33,3 +40,51 @@ def test_normalize_hu() -> None:
     assert norm[0] == 0.0
     # Values above HU_MAX should clip to 1
     assert norm[-1] == 1.0
+
+
+def test_normalize_in_chunks_matches_reference() -> None:
+    arr = np.random.randint(-1000, 1500, (37, 8, 8), dtype=np.int16)
+    out = normalize_hu_into(arr, np.empty(arr.shape, dtype=np.float32), chunk_slices=5)
+    ref = ((np.clip(arr, HU_MIN, HU_MAX) - HU_MIN) / (HU_MAX - HU_MIN)).astype(np.float32)
+    np.testing.assert_allclose(out, ref, atol=1e-6)
+
+
+def test_batch_writes_memmaps_and_skips_up_to_date(make_ct_series, phantom_volume, tmp_path) -> None:
+    series = [make_ct_series(phantom_volume, name=f"patient{i}") for i in range(2)]
+    out_dir = tmp_path / "volumes"
+    manifest = tmp_path / "series.txt"
+    manifest.write_text(f"# training set\n{series[0]}\n{series[1]}\t{out_dir / 'custom.npy'}\n")
+    jobs = read_manifest(manifest, out_dir)
+    assert [dst.name for _, dst in jobs] == ["patient0.npy", "custom.npy"]
+
+    report = preprocess_batch(jobs, workers=2, sitk_threads=1, progress=False)
+    assert report["done"] == 2 and report["failed"] == 0
+    entry = report["series"][0]
+    assert entry["seconds"] > 0 and entry["mb_per_s"] > 0
+    volume = np.load(out_dir / "patient0.npy", mmap_mode="r")
+    assert volume.dtype == np.float32 and volume.shape == tuple(entry["shape"])
+    assert 0.0 <= volume.min() and volume.max() <= 1.0
+    assert not list(out_dir.glob("*.part"))
+
+    report = preprocess_batch(jobs, workers=2, progress=False)
+    assert report["skipped"] == 2
+    # A newer slice makes the series stale again
+    newest = max(series[1].iterdir(), key=lambda p: p.stat().st_mtime_ns)
+    os.utime(newest, ns=(time.time_ns() + 10 ** 9,) * 2)
+    report = preprocess_batch(jobs, workers=1, progress=False)
+    assert [e["status"] for e in report["series"]] == ["skipped", "done"]
+
+
+def test_same_named_series_get_distinct_outputs(make_ct_series, phantom_volume, tmp_path) -> None:
+    series = [make_ct_series(phantom_volume[:4], name=f"p0{i}/CT") for i in (1, 2)]
+    out_dir = tmp_path / "volumes"
+    manifest = tmp_path / "series.txt"
+    manifest.write_text(f"{series[0]}\n{series[1]}\n")
+    jobs = read_manifest(manifest, out_dir)
+    assert [dst for _, dst in jobs] == [out_dir / "p01" / "CT.npy", out_dir / "p02" / "CT.npy"]
+    report = preprocess_batch(jobs, workers=2, sitk_threads=1, progress=False)
+    assert report["done"] == 2 and (out_dir / "p01" / "CT.npy").exists() and (out_dir / "p02" / "CT.npy").exists()
+
+    manifest.write_text(f"{series[0]}\t{out_dir / 'ct.npy'}\n{series[1]}\t{out_dir / 'ct.npy'}\n")
+    with pytest.raises(ValueError, match="both"):
+        preprocess_batch(read_manifest(manifest, out_dir), progress=False)
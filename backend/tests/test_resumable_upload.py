@@ -0,0 +1,172 @@
+"""Resumable chunked uploads: out-of-order chunks, checksums, restart, hand-off."""
+
+import hashlib
+import io
+import os
+import shutil
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app import resumable_upload
+from backend.app.main import app
+from backend.app.resumable_upload import ChunkBusyError, UploadStore
+
+client = TestClient(app)
+
+
+def _sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = UploadStore(tmp_path / "uploads")
+    monkeypatch.setattr(resumable_upload, "_default_store", store)
+    return store
+
+
+def test_chunks_out_of_order_and_resume_after_restart(store):
+    payload = os.urandom(2500)
+    up = store.create("series.zip", len(payload), chunk_size=1000, sha256=_sha(payload))
+    uid = up["upload_id"]
+    assert up["chunks"] == 3 and up["missing"] == [0, 1, 2]
+
+    store.write_chunk(uid, 2, payload[2000:], _sha(payload[2000:]))
+    with pytest.raises(ValueError, match="sha256"):
+        store.write_chunk(uid, 0, b"x" * 1000, _sha(payload[:1000]))
+    st = store.write_chunk(uid, 0, payload[:1000], _sha(payload[:1000]))
+    assert st["received"] == [0, 2] and st["missing"] == [1]
+    assert st["ranges"] == [[0, 1000], [2000, 2500]] and st["received_bytes"] == 1500
+    with pytest.raises(ValueError, match="Missing"):
+        store.finalize(uid)
+
+    # a corrupted retry of an accepted chunk must not overwrite verified data
+    with pytest.raises(ValueError):
+        store.write_chunk(uid, 0, b"y" * 1000, _sha(payload[:1000]))
+
+    restarted = UploadStore(store.root)
+    assert restarted.status(uid)["missing"] == [1]
+    with pytest.raises(ValueError, match="exceeds"):
+        restarted.write_chunk(uid, 1, payload[1000:2001], "0")
+    restarted.write_chunk(uid, 1, payload[1000:2000], _sha(payload[1000:2000]))
+    assert restarted.finalize(uid).read_bytes() == payload
+
+
+def test_concurrent_writes_to_one_chunk_are_refused(store):
+    payload = os.urandom(2000)
+    uid = store.create("series.zip", len(payload), chunk_size=1000)["upload_id"]
+    good = store.open_chunk(uid, 0)
+    good.write(payload[:500])
+    # a second sender of the same chunk must not write over the bytes being verified
+    with pytest.raises(ChunkBusyError):
+        store.open_chunk(uid, 0)
+    assert client.put(f"/uploads/{uid}/chunks/0", content=b"z" * 1000,
+                      headers={"X-Chunk-SHA256": _sha(b"z" * 1000)}).status_code == 409
+    good.write(payload[500:1000])
+    good.commit(_sha(payload[:1000]))
+
+    retry = store.open_chunk(uid, 0)  # released after commit; accepted chunks are only verified
+    retry.write(b"y" * 1000)
+    with pytest.raises(ValueError):
+        retry.commit(_sha(payload[:1000]))
+
+    failed = store.open_chunk(uid, 1)
+    with pytest.raises(ValueError, match="exceeds"):
+        failed.write(b"x" * 1001)
+    store.write_chunk(uid, 1, payload[1000:], _sha(payload[1000:]))
+    assert store.finalize(uid).read_bytes() == payload
+
+
+def test_dicom_zip_upload_hands_off_to_segmentation(store, make_ct_series, phantom_volume):
+    folder = make_ct_series(phantom_volume)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for f in sorted(folder.iterdir()):
+            zf.write(f, f"series/{f.name}")
+    payload = buf.getvalue()
+
+    r = client.post("/uploads/", data={"filename": "series.zip", "size": len(payload), "chunk_size": 4096})
+    assert r.status_code == 200, r.text
+    uid, n = r.json()["upload_id"], r.json()["chunks"]
+    for i in reversed(range(n)):
+        chunk = payload[i * 4096:(i + 1) * 4096]
+        if i == 1:
+            continue  # dropped connection
+        r = client.put(f"/uploads/{uid}/chunks/{i}", content=chunk, headers={"X-Chunk-SHA256": _sha(chunk)})
+        assert r.status_code == 200, r.text
+    assert client.post(f"/uploads/{uid}/complete").status_code == 409
+    assert client.get(f"/uploads/{uid}").json()["missing"] == [1]
+    assert client.put(f"/uploads/{uid}/chunks/1", content=b"\0" * 10, headers={"X-Chunk-SHA256": "0"}).status_code == 400
+    chunk = payload[4096:8192]
+    client.put(f"/uploads/{uid}/chunks/1", content=chunk, headers={"X-Chunk-SHA256": _sha(chunk)})
+
+    r = client.post(f"/uploads/{uid}/complete", data={"threshold_min": 30, "threshold_max": 300})
+    assert r.status_code == 200, r.text
+    assert os.path.exists(r.json()["stl_path"])
+    assert client.get(f"/uploads/{uid}").status_code == 404
+
+
+def test_model_upload_lands_in_model_store(store):
+    payload = b"solid test\nendsolid test\n" * 100
+    uid = client.post("/uploads/", data={"filename": "kidney.stl", "size": len(payload), "kind": "model"}).json()["upload_id"]
+    client.put(f"/uploads/{uid}/chunks/0", content=payload, headers={"X-Chunk-SHA256": _sha(payload)})
+    body = client.post(f"/uploads/{uid}/complete").json()
+    try:
+        assert open(body["model_path"], "rb").read() == payload
+        download = client.get(body["download_url"], headers={"Accept-Encoding": "identity"})
+        assert download.status_code == 200 and download.content == payload
+    finally:
+        shutil.rmtree(os.path.dirname(body["model_path"]), ignore_errors=True)
+
+
+def test_cancel_rejects_unknown_and_traversal_ids(store):
+    sibling = store.root.parent / "sibling"
+    sibling.mkdir()
+    (sibling / "keep.txt").write_text("x")
+    uid = store.create("a.zip", 10)["upload_id"]
+    for bad in ("%2E%2E", "..", "..%2Fsibling", "%2E%2E%2Fsibling", "deadbeef"):
+        assert client.delete(f"/uploads/{bad}").status_code == 404, bad
+    with pytest.raises(KeyError):
+        store.discard("../sibling")
+    assert (sibling / "keep.txt").exists() and store.root.exists()
+    assert client.delete(f"/uploads/{uid}").json()["status"] == "cancelled"
+    assert client.get(f"/uploads/{uid}").status_code == 404
+
+
+def _upload(payload, filename="series.zip"):
+    uid = client.post("/uploads/", data={"filename": filename, "size": len(payload)}).json()["upload_id"]
+    assert client.put(f"/uploads/{uid}/chunks/0", content=payload,
+                      headers={"X-Chunk-SHA256": _sha(payload)}).status_code == 200
+    return uid
+
+
+@pytest.mark.parametrize("anonymize", [True, False])
+def test_complete_maps_unpack_failures_to_422(store, monkeypatch, anonymize):
+    monkeypatch.setattr(resumable_upload, "INGEST_ANONYMIZE", anonymize)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("series/1.dcm", b"\0" * 4096)
+    corrupt = bytearray(buf.getvalue())
+    corrupt[40:60] = b"\xff" * 20  # inside the deflated member: CRC / inflate error
+    cases = [(bytes(corrupt), "series.zip")]
+    if anonymize:
+        cases.append((b"not a dicom file" * 64, "1.dcm"))
+    for payload, name in cases:
+        uid = _upload(payload, name)
+        r = client.post(f"/uploads/{uid}/complete")
+        assert r.status_code == 422, r.text
+        assert client.get(f"/uploads/{uid}").status_code == 200  # kept: can be cancelled or retried
+        assert client.delete(f"/uploads/{uid}").status_code == 200
+
+
+def test_concurrent_complete_is_refused(store):
+    payload = b"solid test\nendsolid test\n" * 10
+    uid = client.post("/uploads/", data={"filename": "m.stl", "size": len(payload), "kind": "model"}).json()["upload_id"]
+    client.put(f"/uploads/{uid}/chunks/0", content=payload, headers={"X-Chunk-SHA256": _sha(payload)})
+    with store.completing(uid) as path:
+        assert path.read_bytes() == payload
+        assert client.post(f"/uploads/{uid}/complete").status_code == 409
+        assert client.delete(f"/uploads/{uid}").status_code == 409
+    assert client.get(f"/uploads/{uid}").status_code == 404  # removed once the hand-off succeeded
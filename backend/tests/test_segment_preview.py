@@ -0,0 +1,38 @@
+"""Low-resolution preview is returned first and replaced by the full result."""
+
+import os
+import time
+
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+from backend.segmentation.segmentation import segment_and_export_full
+
+client = TestClient(app)
+
+
+def test_preview_callback_precedes_full_result(tmp_path, make_ct_series, phantom_volume):
+    folder = make_ct_series(phantom_volume)
+    previews = []
+    result = segment_and_export_full(str(folder), str(tmp_path / "out"), preview_factor=2, on_preview=previews.append)
+    assert len(previews) == 1
+    assert os.path.exists(previews[0]["preview_gltf"])
+    assert result["preview_gltf"] == previews[0]["preview_gltf"]
+    assert os.path.exists(result["gltf"])
+
+
+def test_preview_endpoint_shares_job_id(make_ct_series, phantom_volume):
+    folder = make_ct_series(phantom_volume)
+    resp = client.post("/segment_dicom_preview/", data={"dicom_folder": str(folder), "preview_factor": 2})
+    assert resp.status_code == 200, resp.text
+    data = resp.json()
+    assert os.path.exists(data["preview_gltf_path"])
+
+    for _ in range(100):
+        state = client.get(f"/task_status/{data['job_id']}").json()
+        if state["status"] in ("done", "error"):
+            break
+        time.sleep(0.05)
+    assert state["status"] == "done", state
+    assert state["result"]["preview_gltf"] == data["preview_gltf_path"]
+    assert os.path.exists(state["result"]["gltf"])
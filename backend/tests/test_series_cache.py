@@ -0,0 +1,118 @@
+"""Tests for the on-disk PACS series cache."""
+
+import threading
+import time
+from pathlib import Path
+
+from backend.dicom.series_cache import SeriesCache, series_cache_key
+
+
+def _writer(payload: bytes, calls: list):
+    def fetch(target: Path) -> None:
+        calls.append(target)
+        time.sleep(0.05)  # give a concurrent request a chance to race
+        (target / "1.dcm").write_bytes(payload)
+
+    return fetch
+
+
+def test_key_depends_on_instances():
+    a = series_cache_key("1.2.3", ["b", "a"])
+    assert a == series_cache_key("1.2.3", ["a", "b"])
+    assert a != series_cache_key("1.2.3", ["a", "b", "c"])
+    assert a != series_cache_key("1.2.4", ["a", "b"])
+
+
+def test_concurrent_requests_download_once(tmp_path):
+    cache = SeriesCache(tmp_path, max_bytes=10 ** 6)
+    calls = []
+    results = []
+
+    def worker():
+        with cache.pinned("1.2.3", ["i1"], _writer(b"x" * 10, calls)) as path:
+            results.append(path)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert len(set(results)) == 1
+    assert (results[0] / "1.dcm").read_bytes() == b"x" * 10
+    assert cache.hits == 3 and cache.misses == 1
+    assert cache._pins == {} and cache._key_locks == {}
+
+
+def test_lru_eviction_respects_budget(tmp_path):
+    cache = SeriesCache(tmp_path, max_bytes=2500)
+    calls = []
+
+    def get(uid):
+        with cache.pinned(uid, ["a"], _writer(uid.encode() * 500, calls)) as path:
+            return path
+
+    first = get("s1")
+    second = get("s2")
+    # touch s1 so that s2 becomes the least recently used entry
+    time.sleep(0.01)
+    assert get("s1") == first
+    get("s3")
+
+    assert first.exists()
+    assert not second.exists()
+    assert cache.total_bytes() <= 2500
+
+
+def test_pinned_series_survive_eviction(tmp_path):
+    cache = SeriesCache(tmp_path, max_bytes=1500)
+    calls = []
+    old = cache.acquire("s1", ["a"], _writer(b"1" * 1000, calls))
+    time.sleep(0.01)
+    # s1 is the least recently used, but still in use: the budget is exceeded instead
+    with cache.pinned("s2", ["a"], _writer(b"2" * 1000, calls)) as new:
+        assert old.exists() and new.exists()
+        assert cache.evict() == []
+    cache.release(old)
+    assert [key for key, _, _ in cache.entries()] == [old.name, new.name]
+    assert cache.evict() == [old.name]
+    assert not old.exists() and new.exists()
+    assert cache._pins == {} and cache._key_locks == {}
+
+
+def test_pacs_endpoints_return_copies_outside_the_cache(tmp_path, monkeypatch, make_ct_series, phantom_volume):
+    import shutil
+    from contextlib import contextmanager
+
+    from fastapi.testclient import TestClient
+
+    from backend.app import main
+
+    series = make_ct_series(phantom_volume, name="pacs_series")
+    cache = SeriesCache(tmp_path / "cache", max_bytes=0)
+
+    @contextmanager
+    def fetch(orthanc_url, series_uid, username=None, password=None):
+        # the real helper without the Orthanc round trip: same pinning, files from a local series
+        files = sorted(p.name for p in series.iterdir())
+        with cache.pinned(series_uid, files, lambda target: shutil.copytree(series, target, dirs_exist_ok=True)) as path:
+            yield str(path)
+
+    monkeypatch.setattr(main, "fetch_dicom_series_cached", fetch)
+    client = TestClient(main.app)
+    form = {"orthanc_url": "http://pacs", "series_uid": "1.2.3"}
+    validated = client.post("/import_and_validate_pacs/", data=form).json()
+    segmented = client.post("/import_segment_pacs/", data=form).json()
+    try:
+        cache.evict()  # as the next import would: over budget and no longer pinned
+        assert cache.entries() == []
+        for body in (validated, segmented):
+            assert body["valid_dicom_files"] and body["invalid_count"] == 0
+            assert not Path(body["import_dir"]).resolve().is_relative_to(cache.root.resolve())
+            assert all(Path(f).parent == Path(body["import_dir"]) and Path(f).exists()
+                       for f in body["valid_dicom_files"])
+        assert Path(segmented["stl_path"]).exists()
+    finally:
+        shutil.rmtree(validated["import_dir"], ignore_errors=True)
+        shutil.rmtree(Path(segmented["stl_path"]).parent, ignore_errors=True)
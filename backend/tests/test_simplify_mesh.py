@@ -0,0 +1,82 @@
+"""Batch mesh simplification with face-count and file-size budgets."""
+
+import json
+from pathlib import Path
+
+import pytest
+import trimesh
+
+from backend.dataset_tools.simplify_mesh import (
+    collect_inputs,
+    export_bytes,
+    parse_size,
+    search_ratio,
+    simplify_batch,
+)
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "library"
+    (root / "kidney").mkdir(parents=True)
+    trimesh.creation.icosphere(subdivisions=5).export(root / "kidney" / "left.stl")
+    trimesh.creation.capsule(height=2.0, radius=0.5, count=[64, 64]).export(root / "vessel.ply")
+    (root / "notes.txt").write_text("not a mesh")
+    return root
+
+
+def test_collect_inputs_dir_and_glob(library):
+    assert [p.name for p in collect_inputs(str(library))] == ["left.stl", "vessel.ply"]
+    assert [p.name for p in collect_inputs(str(library / "**" / "*.stl"))] == ["left.stl"]
+
+
+def test_search_ratio_hits_face_budget():
+    mesh = trimesh.creation.icosphere(subdivisions=5)
+    simplified, ratio = search_ratio(mesh, lambda m: len(m.faces), 3000)
+    assert 0.95 * 3000 <= len(simplified.faces) <= 3000
+    assert 0 < ratio < 1
+    # A budget above the input size keeps the mesh as is
+    same, ratio = search_ratio(mesh, lambda m: len(m.faces), 10 ** 6)
+    assert same is mesh and ratio == 1.0
+
+
+def test_search_ratio_hits_size_budget():
+    mesh = trimesh.creation.icosphere(subdivisions=5)
+    budget = export_bytes(mesh, "glb") // 5
+    simplified, _ = search_ratio(mesh, lambda m: export_bytes(m, "glb"), budget)
+    assert 0.9 * budget <= export_bytes(simplified, "glb") <= budget
+
+
+def test_batch_writes_manifest(library, tmp_path):
+    out = tmp_path / "ar"
+    inputs = collect_inputs(str(library))
+    report = simplify_batch(inputs, out, faces=2000, out_format="glb", workers=2, root=library, progress=False)
+    assert report["done"] == 2 and report["failed"] == 0
+    by_name = {Path(e["output"]).name: e for e in report["files"]}
+    assert (out / "kidney" / "left.glb").exists() and (out / "vessel.glb").exists()
+    left = by_name["left.glb"]
+    assert left["faces_before"] == 20480 and left["faces_after"] <= 2000
+    assert 0 < left["hausdorff"] and left["hausdorff_rel"] < 0.05
+    json.dumps(report)  # manifest must be JSON-serializable
+
+
+def test_parse_size():
+    assert parse_size("2MB") == 2 * 1024 ** 2
+    assert parse_size("500k") == 500 * 1024
+    assert parse_size("1234") == 1234
+
+
+def test_batch_glob_keeps_same_named_files_apart(library, tmp_path):
+    (library / "spleen").mkdir()
+    trimesh.creation.icosphere(subdivisions=2).export(library / "spleen" / "left.stl")
+    out = tmp_path / "ar"
+    inputs = collect_inputs(str(library / "**" / "left.stl"))
+    report = simplify_batch(inputs, out, ratio=0.5, workers=1, progress=False)
+    assert report["done"] == 2
+    assert (out / "kidney" / "left.stl").exists() and (out / "spleen" / "left.stl").exists()
+
+    # Different inputs converging on one output file are refused before any work starts
+    trimesh.creation.icosphere(subdivisions=2).export(library / "kidney" / "left.ply")
+    with pytest.raises(ValueError, match="both"):
+        simplify_batch(collect_inputs(str(library / "kidney")), tmp_path / "clash", out_format="glb", progress=False)
+    assert not (tmp_path / "clash").exists()
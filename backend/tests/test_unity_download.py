@@ -0,0 +1,80 @@
+"""Artifact download: Range, content ETag / 304, gzip for text formats, path guard."""
+
+import gzip
+import json
+import shutil
+import uuid
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app import file_delivery
+from backend.app.main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def report_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_delivery, "GZIP_CACHE_DIR", tmp_path / "gzip")
+    path = Path("data", "reports", f"download_test_{uuid.uuid4().hex[:8]}")
+    path.mkdir(parents=True)
+    yield path
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _get(name, **headers):
+    headers.setdefault("Accept-Encoding", "identity")
+    return client.get("/unity/download/", params={"filename": name}, headers=headers)
+
+
+def test_download_range_and_etag(report_dir):
+    payload = bytes(range(256)) * 64
+    (report_dir / "mask.glb").write_bytes(payload)
+    name = f"{report_dir.name}/mask.glb"
+
+    full = _get(name)
+    assert full.status_code == 200 and full.content == payload
+    assert full.headers["content-type"] == "model/gltf-binary"
+    assert full.headers["accept-ranges"] == "bytes"
+    etag = full.headers["etag"]
+
+    part = _get(name, Range="bytes=1000-1999")
+    assert part.status_code == 206 and part.content == payload[1000:2000]
+    assert part.headers["content-range"] == f"bytes 1000-1999/{len(payload)}"
+    resumed = _get(name, Range="bytes=1000-", **{"If-Range": etag})
+    assert resumed.status_code == 206 and resumed.content == payload[1000:]
+
+    cached = _get(name, **{"If-None-Match": etag})
+    assert cached.status_code == 304 and not cached.content and cached.headers["etag"] == etag
+
+    # content-based: rewriting identical bytes (new mtime) keeps the ETag
+    (report_dir / "mask.glb").write_bytes(payload)
+    assert _get(name, **{"If-None-Match": etag}).status_code == 304
+    (report_dir / "mask.glb").write_bytes(payload[::-1])
+    changed = _get(name, **{"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+
+def test_download_gzip_for_text(report_dir):
+    doc = {"slices": list(range(2000))}
+    (report_dir / "index.json").write_text(json.dumps(doc))
+    name = f"{report_dir.name}/index.json"
+
+    plain = _get(name)
+    assert "content-encoding" not in plain.headers and plain.headers["vary"] == "Accept-Encoding"
+    zipped = _get(name, **{"Accept-Encoding": "gzip"})  # httpx decodes the body transparently
+    assert zipped.headers["content-encoding"] == "gzip"
+    assert zipped.headers["etag"] != plain.headers["etag"]
+    assert json.loads(zipped.content) == doc
+    assert int(zipped.headers["content-length"]) < len(plain.content)
+    assert _get(name, **{"Accept-Encoding": "gzip", "If-None-Match": zipped.headers["etag"]}).status_code == 304
+    cached = list(file_delivery.GZIP_CACHE_DIR.glob("*.gz"))
+    assert len(cached) == 1 and json.loads(gzip.decompress(cached[0].read_bytes())) == doc
+
+
+def test_download_rejects_missing_and_traversal(report_dir):
+    assert _get(f"{report_dir.name}/nope.glb").status_code == 404
+    assert _get("../../backend/app/main.py").status_code == 400
+    assert _get("/etc/passwd").status_code == 400
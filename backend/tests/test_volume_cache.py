@@ -0,0 +1,81 @@
+"""Tests for the two-tier (memory LRU + mmap disk) volume cache."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from backend.segmentation.segmentation import load_dicom_series, save_mask_nifti
+from backend.segmentation.volume_cache import VolumeCache
+
+
+def _counting_loader(calls):
+    def loader(folder):
+        calls.append(folder)
+        return load_dicom_series(folder)
+
+    return loader
+
+
+def test_memory_then_disk_hits(tmp_path, make_ct_series, phantom_volume):
+    folder = make_ct_series(phantom_volume)
+    calls = []
+    cache = VolumeCache(tmp_path / "cache", memory_bytes=10 ** 8)
+
+    geometry, array, spacing, origin, _ = cache.load(folder, _counting_loader(calls))
+    assert array.dtype == np.int16
+    assert np.array_equal(array, phantom_volume)
+    assert spacing == (0.8, 0.8, 2.0) and origin == (-100.0, -80.0, 50.0)
+
+    cache.load(folder, _counting_loader(calls))
+    assert cache.stats["memory_hits"] == 1
+
+    # New process-like instance: only the disk tier is warm
+    fresh = VolumeCache(tmp_path / "cache", memory_bytes=10 ** 8)
+    _, mapped, *_ = fresh.load(folder, _counting_loader(calls))
+    assert isinstance(mapped, np.memmap)
+    assert np.array_equal(mapped, phantom_volume)
+    assert fresh.stats["disk_hits"] == 1
+    assert len(calls) == 1
+
+
+def test_fingerprint_invalidates_on_change(tmp_path, make_ct_series, phantom_volume):
+    folder = make_ct_series(phantom_volume)
+    calls = []
+    cache = VolumeCache(tmp_path / "cache")
+    cache.load(folder, _counting_loader(calls))
+
+    some_file = sorted(folder.iterdir())[0]
+    st = os.stat(some_file)
+    os.utime(some_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    cache.load(folder, _counting_loader(calls))
+    assert len(calls) == 2
+
+
+def test_geometry_is_valid_nifti_reference(tmp_path, make_ct_series, phantom_volume):
+    folder = make_ct_series(phantom_volume)
+    geometry, array, *_ = VolumeCache(tmp_path / "cache").load(folder, load_dicom_series)
+    out = save_mask_nifti((array > 0).astype(np.uint8), geometry, str(tmp_path / "mask.nii.gz"))
+    img = sitk.ReadImage(out)
+    assert np.allclose(img.GetSpacing(), (0.8, 0.8, 2.0))
+    assert np.allclose(img.GetOrigin(), (-100.0, -80.0, 50.0))
+
+
+def test_key_locks_are_dropped_after_loads(tmp_path, make_ct_series, phantom_volume):
+    """Concurrent loads of one series share a single read; per-key locks do not accumulate."""
+    folders = [make_ct_series(phantom_volume, name=f"s{i}") for i in range(3)]
+    calls = []
+    cache = VolumeCache(tmp_path / "cache")
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        list(pool.map(lambda f: cache.load(f, _counting_loader(calls)), folders * 2))
+    assert sorted(calls) == sorted(folders)
+
+    def broken(folder):
+        raise RuntimeError("unreadable series")
+
+    other = make_ct_series(phantom_volume[::-1].copy(), name="broken")
+    with pytest.raises(RuntimeError):
+        cache.load(other, broken)
+    assert cache._key_locks == {}
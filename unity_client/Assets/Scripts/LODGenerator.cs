@@ -13,6 +13,11 @@ public class LODGenerator : MonoBehaviour {
 
     [Tooltip("Screen relative transition heights")] public Vector2 lodHeights = new Vector2(0.6f, 0.3f);
 
+    [Tooltip("Pre-decimated LOD1 from the backend (mask_lod1.glb). When set, no simplification runs on device.")]
+    public MeshRenderer[] serverLod1Renderers;
+    [Tooltip("Pre-decimated LOD2 from the backend (mask_lod2.glb).")]
+    public MeshRenderer[] serverLod2Renderers;
+
     private void Start() {
         BuildLODs();
     }
@@ -25,9 +30,15 @@ public class LODGenerator : MonoBehaviour {
         // LOD0: original renderers
         lods.Add(new LOD(lodHeights.x, renderers));
 
-        // LOD1 & LOD2
-        lods.Add(CreateLODN(renderers, lod1Ratio, lodHeights.y));
-        lods.Add(CreateLODN(renderers, lod2Ratio, 0.01f));
+        // LOD1 & LOD2: server-side levels if provided, otherwise simplify locally
+        if (serverLod1Renderers != null && serverLod1Renderers.Length > 0 &&
+            serverLod2Renderers != null && serverLod2Renderers.Length > 0) {
+            lods.Add(new LOD(lodHeights.y, serverLod1Renderers));
+            lods.Add(new LOD(0.01f, serverLod2Renderers));
+        } else {
+            lods.Add(CreateLODN(renderers, lod1Ratio, lodHeights.y));
+            lods.Add(CreateLODN(renderers, lod2Ratio, 0.01f));
+        }
 
         lodGroup.SetLODs(lods.ToArray());
         lodGroup.RecalculateBounds();
@@ -0,0 +1,141 @@
+using System;
+using System.Collections.Generic;
+using System.Threading.Tasks;
+using GLTFast;
+using UnityEngine;
+using UnityEngine.Networking;
+
+namespace LaprascopeAR
+{
+    /// <summary>
+    /// Progressive loading of a segmentation mesh split into octree chunks by the backend
+    /// (<c>GET /segmentation/{job}/chunks/manifest</c>). The coarse level-0 shell is shown as soon
+    /// as it is ready; each finer level is loaded in the background and swapped in once all of
+    /// its chunks have arrived, replacing the coarser level.
+    /// </summary>
+    public class ProgressiveMeshStreamer : MonoBehaviour
+    {
+        [Tooltip("Backend base URL, e.g. http://localhost:8000")]
+        public string backendUrl = "http://localhost:8000";
+
+        [Tooltip("Parent transform for the streamed model (optional)")]
+        public Transform modelParent;
+
+        [Tooltip("Long-poll timeout for manifest updates, seconds")]
+        public float pollWaitSeconds = 10f;
+
+        [Serializable] private class ChunkInfo { public string name; public int level; }
+        [Serializable] private class LevelInfo { public int level; public int chunks; }
+        [Serializable] private class Manifest
+        {
+            public int version;
+            public string status;
+            public string detail;
+            public LevelInfo[] levels;
+            public ChunkInfo[] chunks;
+        }
+
+        private readonly Dictionary<int, GameObject> _levelRoots = new Dictionary<int, GameObject>();
+        private readonly Dictionary<int, int> _loadedPerLevel = new Dictionary<int, int>();
+        private readonly HashSet<string> _requested = new HashSet<string>();
+        private GameObject _root;
+        private Manifest _manifest;
+        private int _shownLevel = -1;
+        private bool _streaming;
+
+        /// <summary>Starts streaming the chunks of segmentation job <paramref name="jobId"/>.</summary>
+        public async void Stream(string jobId)
+        {
+            Clear();
+            _streaming = true;
+            _root = new GameObject($"Segmentation_{jobId}");
+            if (modelParent != null) _root.transform.SetParent(modelParent, false);
+
+            string baseUrl = $"{backendUrl.TrimEnd('/')}/segmentation/{jobId}/chunks/";
+            int version = 0;
+            while (_streaming)
+            {
+                string json = await Get($"{baseUrl}manifest?since={version}&wait={pollWaitSeconds}");
+                if (json == null || !_streaming) break;
+                var manifest = JsonUtility.FromJson<Manifest>(json);
+                _manifest = manifest;
+                version = manifest.version;
+                if (manifest.chunks != null)
+                {
+                    foreach (var chunk in manifest.chunks)
+                    {
+                        if (_requested.Add(chunk.name)) _ = LoadChunk(baseUrl + chunk.name, chunk.level);
+                    }
+                }
+                // a level's chunk count becomes known only when the level is finished
+                foreach (var level in new List<int>(_levelRoots.Keys)) TryRefine(level);
+                if (manifest.status == "error") Debug.LogError($"Mesh streaming failed: {manifest.detail}");
+                if (manifest.status == "done" || manifest.status == "error") break;
+            }
+        }
+
+        private async Task LoadChunk(string url, int level)
+        {
+            var gltf = new GltfImport();
+            if (!await gltf.Load(new Uri(url)) || _root == null)
+            {
+                Debug.LogError($"Failed to load mesh chunk {url}");
+                return;
+            }
+            if (!_levelRoots.TryGetValue(level, out var levelRoot))
+            {
+                levelRoot = new GameObject($"Level{level}");
+                levelRoot.transform.SetParent(_root.transform, false);
+                levelRoot.SetActive(false);
+                _levelRoots[level] = levelRoot;
+            }
+            await gltf.InstantiateMainSceneAsync(levelRoot.transform);
+            _loadedPerLevel[level] = _loadedPerLevel.TryGetValue(level, out var n) ? n + 1 : 1;
+            TryRefine(level);
+        }
+
+        // Shows a level once all of its chunks are loaded and hides the coarser ones
+        private void TryRefine(int level)
+        {
+            var manifest = _manifest;
+            if (level <= _shownLevel || manifest?.levels == null || level >= manifest.levels.Length) return;
+            if (!_loadedPerLevel.ContainsKey(level)) return;
+            int expected = manifest.levels[level].chunks;
+            bool complete = level == 0 || (expected > 0 && _loadedPerLevel[level] >= expected);
+            if (!complete) return;
+            _levelRoots[level].SetActive(true);
+            foreach (var pair in _levelRoots)
+            {
+                if (pair.Key < level) pair.Value.SetActive(false);
+            }
+            _shownLevel = level;
+        }
+
+        private static async Task<string> Get(string url)
+        {
+            using var req = UnityWebRequest.Get(url);
+            var op = req.SendWebRequest();
+            while (!op.isDone) await Task.Yield();
+            if (req.result != UnityWebRequest.Result.Success)
+            {
+                Debug.LogError($"Manifest request failed: {req.error}");
+                return null;
+            }
+            return req.downloadHandler.text;
+        }
+
+        public void Clear()
+        {
+            _streaming = false;
+            if (_root != null) Destroy(_root);
+            _root = null;
+            _levelRoots.Clear();
+            _loadedPerLevel.Clear();
+            _requested.Clear();
+            _manifest = null;
+            _shownLevel = -1;
+        }
+
+        private void OnDestroy() => Clear();
+    }
+}